@@ -33,7 +33,11 @@ Create an activity::
         retry=0,
 
         # If you want to run the activity `n` times, you can use a generator.
-        generator=[generator_name])
+        generator=[generator_name],
+
+        # If the generator creates a lot of instances, you can limit how many
+        # of them are scheduled at the same time.
+        max_in_flight=100)
 
 """
 
@@ -41,10 +45,14 @@ import backoff
 import boto.exception as boto_exception
 import boto.swf.layer2 as swf
 import itertools
-import json
 import threading
 
+from garcon import blob
+from garcon import codec
+from garcon import context
+from garcon import generator
 from garcon import log
+from garcon import transport as swf_transport
 from garcon import utils
 from garcon import runner
 
@@ -67,10 +75,42 @@ class ActivityInstanceNotReadyException(Exception):
     pass
 
 
-class ActivityInstance:
+class ActivityResultDiscardedException(Exception):
+    """Exception when the result of an activity has not been kept.
+
+    Results larger than the maximum result size of the decider are not kept in
+    memory.
+    """
+
+    pass
+
+
+class FlowCycleException(Exception):
+    """Exception when the requirements of a flow have a cycle.
+
+    Activities that require each other (directly or not) can never be
+    scheduled.
+    """
+
+    pass
+
+
+class CompiledFlowMismatchException(Exception):
+    """Exception when a precompiled flow does not match its flow module.
+    """
+
+    pass
+
+
+class ActivityInstance(object):
+
+    __slots__ = (
+        'activity_worker', 'pool_size', 'execution_context', 'local_context',
+        'global_context', 'scheduling_plan')
 
     def __init__(
-            self, activity_worker, local_context=None, execution_context=None):
+            self, activity_worker, local_context=None, execution_context=None,
+            pool_size=1):
         """Activity Instance.
 
         In SWF, Activity is a worker: it will get information from the context,
@@ -88,14 +128,20 @@ class ActivityInstance:
                 generators.
             execution_context (dict): the execution context of when an activity
                 will be scheduled with.
+            pool_size (int): the number of instances of the activity (for the
+                execution.)
         """
 
         self.activity_worker = activity_worker
+        self.pool_size = pool_size
         self.execution_context = execution_context or dict()
         self.local_context = local_context or dict()
-        self.global_context = dict(
-            list(self.execution_context.items()) +
-            list(self.local_context.items()))
+
+        # The execution context is shared by all the instances of the
+        # execution: it is not copied.
+        self.global_context = context.ContextView(
+            self.execution_context, self.local_context)
+        self.scheduling_plan = None
 
     @property
     def activity_name(self):
@@ -140,15 +186,20 @@ class ActivityInstance:
         The schedule to start timeout assumes that only one activity worker is
         available (since swf does not provide a count of available workers). So
         if the default value is 5 minutes, and you have 10 instances: the
-        schedule to start will be 50 minutes for all instances.
+        schedule to start will be 50 minutes for all instances. If the activity
+        has a maximum number of instances in flight, only this number of
+        instances are considered.
 
         Return:
             int: Schedule to start timeout.
         """
 
-        return (
-            self.activity_worker.pool_size *
-            self.activity_worker.schedule_to_start_timeout)
+        pool_size = self.pool_size
+        max_in_flight = getattr(self.activity_worker, 'max_in_flight', None)
+        if max_in_flight:
+            pool_size = min(pool_size, max_in_flight)
+
+        return pool_size * self.activity_worker.schedule_to_start_timeout
 
     @property
     def schedule_to_close(self):
@@ -211,6 +262,20 @@ class ActivityInstance:
             raise runner.RunnerMissing()
         return activity_runner
 
+    @property
+    def plan(self):
+        """Return the scheduling plan of the instance.
+
+        The plan is only calculated once per instance.
+
+        Return:
+            SchedulingPlan: the scheduling plan.
+        """
+
+        if not self.scheduling_plan:
+            self.scheduling_plan = SchedulingPlan(self)
+        return self.scheduling_plan
+
     def create_execution_input(self):
         """Create the input of the activity from the context.
 
@@ -222,30 +287,122 @@ class ActivityInstance:
             dict: the input to send to the activity.
         """
 
-        activity_input = dict()
+        return self.create_input_from_plan(
+            runner.get_plan(self.runner, self.global_context))
 
-        try:
-            for requirement in self.runner.requirements(self.global_context):
-                value = self.global_context.get(requirement)
-                if value is not None:
-                    activity_input.update({requirement: value})
+    def create_input_from_plan(self, runner_plan):
+        """Create the input of the activity from the plan of its runner.
+
+        Args:
+            runner_plan (RunnerPlan): the plan of the runner, calculated from
+                the context of the instance.
+        Return:
+            dict: the input to send to the activity.
+        """
 
-            activity_input.update({
-                'execution.domain': self.global_context.get('execution.domain'),
-                'execution.run_id': self.global_context.get('execution.run_id'),
-                'execution.workflow_id': self.global_context.get(
-                    'execution.workflow_id')
-            })
+        if runner_plan.requirements is None:
+            return dict(self.global_context)
 
-        except runner.NoRunnerRequirementsFound:
-            return self.global_context
+        activity_input = dict()
+        for requirement in runner_plan.requirements:
+            value = self.global_context.get(requirement)
+            if value is not None:
+                activity_input.update({requirement: value})
+
+        activity_input.update({
+            'execution.domain': self.global_context.get('execution.domain'),
+            'execution.run_id': self.global_context.get('execution.run_id'),
+            'execution.workflow_id': self.global_context.get(
+                'execution.workflow_id')
+        })
 
         return activity_input
 
 
-class Activity(swf.ActivityWorker, log.GarconLogger):
+class SchedulingPlan:
+
+    def __init__(self, instance, encoder=None):
+        """Create the scheduling plan of an activity instance.
+
+        The scheduling plan holds all the values needed to schedule an
+        activity instance: its timeouts, its requirements and its input. The
+        task lists of the runner are only flattened once for all of them (and
+        the plan of the runner is shared by all the instances if it has no
+        task lists.)
+
+        Args:
+            instance (ActivityInstance): the activity instance.
+            encoder (InputEncoder): the encoder of the input (shared by the
+                instances scheduled together.)
+        """
+
+        runner_plan = runner.get_plan(
+            instance.runner, instance.global_context)
+        activity_input = instance.create_input_from_plan(runner_plan)
+        claim_check = instance.activity_worker.claim_check
+        if claim_check:
+            activity_input = claim_check.offload(activity_input)
+
+        self.timeout = runner_plan.timeout
+        self.heartbeat_timeout = runner_plan.heartbeat
+        self.requirements = runner_plan.requirements
+        self.schedule_to_start = instance.schedule_to_start
+        self.schedule_to_close = self.schedule_to_start + self.timeout
+        if encoder:
+            self.input = encoder.encode(activity_input)
+        else:
+            self.input = codec.dumps(activity_input)
+        self.input = codec.compress(
+            self.input, compression=instance.activity_worker.compression)
+
+
+class InputEncoder:
+
+    def __init__(self, context):
+        """Create an input encoder.
+
+        The inputs of the instances scheduled together mostly contain the same
+        values, taken from the same context. The encoder keeps the encoded
+        values of the context, so each of them is only encoded once for all
+        the instances. The inputs are encoded exactly as `json.dumps` would.
+
+        Args:
+            context (dict): the context shared by the instances.
+        """
+
+        self.context = context
+        self.fragments = dict()
+
+    def encode(self, activity_input):
+        """Encode the input of an activity instance.
+
+        Args:
+            activity_input (dict): the input of the instance.
+        Return:
+            str: the input encoded in JSON.
+        """
+
+        fragments = []
+        for key, value in activity_input.items():
+            # Only the values that are the values of the context can be
+            # reused: the instance may have its own value for a key.
+            shared = self.context.get(key, self) is value
+            fragment = self.fragments.get(key) if shared else None
+            if fragment is None:
+                fragment = codec.dumps({key: value})[1:-1]
+                if shared:
+                    self.fragments[key] = fragment
+            fragments.append(fragment)
+        return '{' + ', '.join(fragments) + '}'
+
+
+class Activity(
+        swf_transport.LazyConnection, swf.ActivityWorker, log.GarconLogger):
     version = '1.0'
     task_list = None
+    claim_check = None
+    compression = None
+    transport = None
 
     @backoff.on_exception(
         backoff.expo,
@@ -270,6 +427,73 @@ class Activity(swf.ActivityWorker, log.GarconLogger):
 
         return self.poll(identity=identity)
 
+    def get_transport(self):
+        """Get the transport of the calls to SWF.
+
+        Return:
+            Transport: the transport of the activity (a boto2 transport is
+                created if the activity does not have one.)
+        """
+
+        if self.transport is None:
+            self.transport = swf_transport.ActorTransport(self)
+        return self.transport
+
+    def poll(self, task_list=None, identity=None):
+        """Poll for an activity task.
+
+        Args:
+            task_list (str): the task list (the task list of the activity if
+                not provided.)
+            identity (str): the identity of the worker.
+        Return:
+            dict: the activity task.
+        """
+
+        task = self.get_transport().poll_for_activity_task(
+            self.domain, task_list or self.task_list, identity=identity)
+        self.last_tasktoken = task.get('taskToken')
+        return task
+
+    def complete(self, task_token=None, result=None):
+        """Complete the activity task.
+
+        Args:
+            task_token (str): the token of the task (the token of the last
+                polled task if not provided.)
+            result (str): the result of the task.
+        """
+
+        return self.get_transport().respond_activity_task_completed(
+            task_token or self.last_tasktoken, result=result)
+
+    def fail(self, task_token=None, details=None, reason=None):
+        """Fail the activity task.
+
+        Args:
+            task_token (str): the token of the task (the token of the last
+                polled task if not provided.)
+            details (str): the details of the failure.
+            reason (str): the reason of the failure.
+        """
+
+        return self.get_transport().respond_activity_task_failed(
+            task_token or self.last_tasktoken, details=details, reason=reason)
+
+    def heartbeat(self, task_token=None, details=None):
+        """Record the heartbeat of the activity task.
+
+        Args:
+            task_token (str): the token of the task (the token of the last
+                polled task if not provided.)
+            details (str): the progress of the task.
+        Return:
+            dict: the response (`cancelRequested`.)
+        """
+
+        return self.get_transport().record_activity_task_heartbeat(
+            task_token or self.last_tasktoken, details=details)
+
     def run(self, identity=None):
         """Activity Runner.
 
@@ -305,13 +529,18 @@ class Activity(swf.ActivityWorker, log.GarconLogger):
         context = dict()
 
         if packed_context:
-            context = json.loads(packed_context)
+            context = codec.decode(packed_context)
             self.set_log_context(context)
 
         if 'activityId' in activity_task:
             try:
+                if self.claim_check:
+                    context = self.claim_check.resolve(context)
                 context = self.execute_activity(context)
-                self.complete(result=json.dumps(context))
+                if self.claim_check:
+                    context = self.claim_check.offload(context)
+                self.complete(result=codec.encode(
+                    context, compression=self.compression))
             except Exception as error:
                 # If the workflow has been stopped, it is not possible for the
                 # activity to be updated – it throws an exception which stops
@@ -342,15 +571,22 @@ class Activity(swf.ActivityWorker, log.GarconLogger):
             data (dict): the data to use (if defined.)
         """
 
-        self.pool_size = 0
         self.version = data.get('version') or self.version
         self.name = self.name or data.get('name')
         self.domain = getattr(self, 'domain', '') or data.get('domain')
         self.requires = getattr(self, 'requires', []) or data.get('requires')
         self.retry = getattr(self, 'retry', None) or data.get('retry', 0)
+        self.max_in_flight = (
+            getattr(self, 'max_in_flight', None) or data.get('max_in_flight'))
         self.task_list = self.task_list or data.get('task_list')
         self.on_exception = (
             getattr(self, 'on_exception', None) or data.get('on_exception'))
+        self.claim_check = (
+            getattr(self, 'claim_check', None) or data.get('claim_check'))
+        self.compression = (
+            getattr(self, 'compression', None) or data.get('compression'))
+        self.transport = (
+            getattr(self, 'transport', None) or data.get('transport'))
 
         # The start timeout is how long it will take between the scheduling
         # of the activity and the start of the activity.
@@ -368,7 +604,9 @@ class Activity(swf.ActivityWorker, log.GarconLogger):
         self.generators = getattr(
             self, 'generators', None) or data.get('generators')
 
-    def instances(self, context):
+    def instances(
+            self, context, offset=0, limit=None, recorder=None,
+            evaluator=None):
         """Get all instances for one activity based on the current context.
 
         There are two scenarios: when the activity worker has a generator and
@@ -376,38 +614,72 @@ class Activity(swf.ActivityWorker, log.GarconLogger):
         always be one instance returned.
 
         Generators will however consume the context to calculate how many
-        instances of the activity are needed – and it will generate them
-        (regardless of their state.)
+        instances of the activity are needed – and it will generate them
+        (regardless of their state.) The instances are created as they are
+        consumed, and a page of instances can be requested with an offset and
+        a limit.
 
         Args:
             context (dict): the current context.
+            offset (int): the number of instances to skip.
+            limit (int): the maximum number of instances to return.
+            recorder (Recorder): the values of the recorded generators.
+            evaluator (Evaluator): the evaluator of the generators.
         Return:
             list: all the instances of the activity (for a current workflow
                 execution.)
         """
 
+        stop = offset + limit if limit is not None else None
+
         if not self.generators:
-            self.pool_size = 1
-            yield ActivityInstance(self, execution_context=context)
+            if offset < 1 and stop != 0:
+                yield ActivityInstance(self, execution_context=context)
             return
 
-        generator_values = []
-        for generator in self.generators:
-            generator_values.append(generator(context))
-
-        contexts = list(itertools.product(*generator_values))
-        self.pool_size = len(contexts)
-        for generator_contexts in contexts:
-            # Each generator returns a context, merge all the contexts
-            # to only be one - which can be used to 1/ create the id of the
-            # activity and 2/ be passed as a local context.
-            instance_context = dict()
-            for current_generator_context in generator_contexts:
-                instance_context.update(current_generator_context.items())
+        pool_size, generator_values = generator.evaluate(
+            self.generators, self.get_generator_context(context),
+            recorder=recorder, activity_name=self.name, evaluator=evaluator)
 
+        for instance_context in itertools.islice(
+                generator.combine(generator_values), offset, stop):
             yield ActivityInstance(
                 self, execution_context=context,
-                local_context=instance_context)
+                local_context=instance_context, pool_size=pool_size)
+
+    def count_instances(self, context):
+        """Count the instances of the activity based on the current context.
+
+        Countable generators (see `generator.countable`) are not consumed.
+
+        Args:
+            context (dict): the current context.
+        Return:
+            int: the number of instances.
+        """
+
+        if not self.generators:
+            return 1
+        return generator.count(
+            self.generators, self.get_generator_context(context))
+
+    def get_generator_context(self, context):
+        """Get the context the generators of the activity receive.
+
+        The large values of the context can be references to the blob store
+        (see `garcon.blob`): they are resolved with the claim check of the
+        activity, so the generators read the values.
+
+        Args:
+            context (dict): the current context.
+        Return:
+            dict: the context of the generators.
+        """
+
+        if not self.claim_check or not any(
+                blob.is_reference(value) for value in context.values()):
+            return context
+        return self.claim_check.resolve(context)
 
 
 class ExternalActivity(Activity):
@@ -442,7 +714,8 @@ class ExternalActivity(Activity):
 
 class ActivityWorker():
 
-    def __init__(self, flow, activities=None):
+    def __init__(
+            self, flow, activities=None, compiled_flow=None, transport=None):
         """Initiate an activity worker.
 
         The activity worker take in consideration all the activities from a
@@ -456,24 +729,53 @@ class ActivityWorker():
             flow (module): the flow module.
             activities (list): the list of activities that this worker should
                 handle.
+            compiled_flow (CompiledFlow): the precompiled flow (the flow is
+                compiled if not provided.)
+            transport (Transport): the transport of the activities (replaces
+                the transport they have been created with.)
         """
 
         self.flow = flow
-        self.activities = find_workflow_activities(self.flow)
+        self.compiled_flow = compiled_flow or compile_flow(flow)
+        self.activities = self.compiled_flow.activities
         self.worker_activities = activities
+        if transport is not None:
+            for activity in self.activities:
+                activity.transport = transport
+        self.stopped = threading.Event()
+        self.threads = []
 
     def run(self):
         """Run the activities.
+
+        Return:
+            list: the threads of the activities.
         """
 
+        self.stopped.clear()
+        self.threads = []
         for activity in self.activities:
             if (self.worker_activities and
                     activity.name not in self.worker_activities):
                 continue
-            threading.Thread(target=worker_runner, args=(activity,)).start()
+            thread = threading.Thread(
+                target=worker_runner, args=(activity, self.stopped))
+            thread.start()
+            self.threads.append(thread)
+        return self.threads
 
+    def stop(self):
+        """Stop the activities.
 
-class ActivityState:
+        The activities stop once their current poll and task are done.
+        """
+
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+
+class ActivityState(object):
     """
     Activity State
     ==============
@@ -482,8 +784,23 @@ class ActivityState:
     instance is already scheduled, has failed, or has been completed.) Along
     with the default values, this class also provides additional metadata such
     as the result of an activity instance.
+
+    An execution can have a very large number of activity instances: the
+    states are kept in a byte array (one byte per state), and the number of
+    failures and if the instance has completed are updated as the states are
+    added. The result is kept as it is provided by SWF (a json string), and
+    only decoded when it is accessed.
+
+    The results larger than the maximum size are not kept (`result_discarded`
+    is set.) The state of a schedule (see `decider.schedule`) has the results
+    of its instances that have been kept, and `result_discarded` is set if
+    some of them have not.
     """
 
+    __slots__ = (
+        'activity_id', '_result', 'raw_result', 'result_discarded', 'states',
+        'failures', 'completed')
+
     def __init__(self, activity_id):
         """Create a State.
 
@@ -493,15 +810,33 @@ class ActivityState:
 
         self.activity_id = activity_id
         self._result = None
-        self.states = []
+        self.raw_result = None
+        self.result_discarded = False
+        self.states = bytearray()
+        self.failures = 0
+        self.completed = False
 
     @property
     def result(self):
         """Get the result.
+
+        Raises:
+            ActivityInstanceNotReadyException: if the activity has not
+                completed.
+            ActivityResultDiscardedException: if the result has not been
+                kept.
         """
 
         if not self.ready:
             raise ActivityInstanceNotReadyException()
+
+        if self.raw_result is not None:
+            self._result = codec.decode(self.raw_result)
+            self.raw_result = None
+        elif self.result_discarded and self._result is None:
+            raise ActivityResultDiscardedException(
+                'The result of {} has not been kept.'.format(
+                    self.activity_id))
         return self._result
 
     @property
@@ -518,7 +853,7 @@ class ActivityState:
             int: the state of the activity (see: activity.py)
         """
 
-        if len(self.states):
+        if self.states:
             return self.states[-1]
         return None
 
@@ -530,6 +865,10 @@ class ActivityState:
         """
 
         self.states.append(state)
+        if state == ACTIVITY_FAILED:
+            self.failures += 1
+        elif state == ACTIVITY_COMPLETED:
+            self.completed = True
 
     def set_result(self, result):
         """Set the result of the activity.
@@ -541,10 +880,30 @@ class ActivityState:
             result (dict): Result of the activity.
         """
 
-        if self._result:
+        if self._result or self.raw_result is not None:
             raise Exception('Result is ummutable – it should not be changed.')
         self._result = result
 
+    def set_raw_result(self, raw_result, max_size=None):
+        """Set the result of the activity, as provided by SWF.
+
+        The result is decoded the first time it is accessed.
+
+        Args:
+            raw_result (str): Result of the activity (json string.)
+            max_size (int): the maximum size of a result kept in memory (None
+                to keep all the results.)
+        """
+
+        if self._result or self.raw_result is not None:
+            raise Exception('Result is ummutable – it should not be changed.')
+
+        raw_result = raw_result or '{}'
+        if max_size is not None and len(raw_result) > max_size:
+            self.result_discarded = True
+            return
+        self.raw_result = raw_result
+
     def wait(self):
         """Wait until ready.
         """
@@ -552,19 +911,222 @@ class ActivityState:
         if not self.ready():
             raise ActivityInstanceNotReadyException()
 
+    def to_dict(self):
+        """Serialize the activity state.
+
+        Return:
+            dict: the activity state (it can be stored as json.)
+        """
+
+        data = dict(activity_id=self.activity_id, states=list(self.states))
+        if self.raw_result is not None:
+            data.update(raw_result=self.raw_result)
+        elif self.result_discarded:
+            data.update(result_discarded=True)
+        else:
+            data.update(result=self._result)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Load an activity state.
+
+        Args:
+            data (dict): the serialized activity state (see `to_dict`.)
+        Return:
+            ActivityState: the activity state.
+        """
+
+        state = cls(data.get('activity_id'))
+        for current_state in data.get('states', []):
+            state.add_state(current_state)
+        state._result = data.get('result')
+        state.raw_result = data.get('raw_result')
+        state.result_discarded = data.get('result_discarded', False)
+        return state
+
+
+class CompiledFlow:
+    """
+    Compiled Flow
+    =============
+
+    The compiled flow holds the activities of a flow along with their
+    requirements (the activities each activity requires and the activities
+    that require it) and a topological order of the activities. Compiling a
+    flow is done once, by the decider and by the activity worker, instead of
+    inspecting the flow module each time its activities are needed.
+    """
+
+    def __init__(self, activities, attributes=None):
+        """Create a compiled flow.
+
+        Raises:
+            FlowCycleException: if the requirements of the activities have a
+                cycle.
+
+        Args:
+            activities (list): the activities of the flow.
+            attributes (list): the name of the attribute of each activity in
+                the flow module.
+        """
+
+        self.activities = list(activities)
+        self.attributes = list(attributes or [])
+        self.activities_by_name = dict()
+        self.requires = dict()
+        self.dependents = dict()
+
+        for current_activity in self.activities:
+            self.activities_by_name[current_activity.name] = current_activity
+            self.dependents.setdefault(current_activity.name, [])
+
+        for current_activity in self.activities:
+            requires = [
+                requirement.name for requirement in
+                (getattr(current_activity, 'requires', None) or [])]
+            self.requires[current_activity.name] = requires
+            for requirement in requires:
+                self.dependents.setdefault(requirement, []).append(
+                    current_activity.name)
+
+        self.order = self.sort()
+
+    def sort(self):
+        """Sort the activities of the flow.
+
+        Raises:
+            FlowCycleException: if the requirements of the activities have a
+                cycle.
+
+        Return:
+            list: the name of the activities, each activity being after all
+                the activities it requires.
+        """
+
+        indegrees = dict()
+        for name, requires in self.requires.items():
+            indegrees[name] = len([
+                requirement for requirement in requires
+                if requirement in self.activities_by_name])
+
+        ready = [
+            current_activity.name for current_activity in self.activities
+            if not indegrees[current_activity.name]]
+        order = []
+
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for dependent in self.dependents.get(name, []):
+                indegrees[dependent] -= 1
+                if not indegrees[dependent]:
+                    ready.append(dependent)
+
+        if len(order) != len(self.activities):
+            raise FlowCycleException(
+                'The requirements of the activities have a cycle: {}'.format(
+                    sorted(set(self.activities_by_name) - set(order))))
+        return order
+
+    def to_dict(self):
+        """Serialize the compiled flow.
+
+        Return:
+            dict: the compiled flow (it can be stored as json.)
+        """
+
+        return dict(
+            activities=[
+                dict(
+                    attribute=attribute,
+                    name=current_activity.name,
+                    requires=self.requires[current_activity.name])
+                for attribute, current_activity in zip(
+                    self.attributes, self.activities)],
+            order=self.order)
+
+    @classmethod
+    def from_dict(cls, flow, data):
+        """Load a compiled flow.
+
+        The activities are retrieved from the flow module with the attribute
+        names stored in the compiled flow: the module is only inspected to
+        check it does not have other activities, and the requirements and the
+        order of the activities are not computed again.
+
+        Raises:
+            CompiledFlowMismatchException: if the activities of the flow
+                module do not match the compiled flow.
+
+        Args:
+            flow (module): the flow module.
+            data (dict): the serialized compiled flow (see `to_dict`.)
+        Return:
+            CompiledFlow: the compiled flow.
+        """
 
-def worker_runner(worker):
+        compiled_flow = cls.__new__(cls)
+        compiled_flow.activities = []
+        compiled_flow.attributes = []
+        compiled_flow.activities_by_name = dict()
+        compiled_flow.requires = dict()
+        compiled_flow.dependents = dict()
+        compiled_flow.order = list(data.get('order', []))
+
+        activities_data = data.get('activities', [])
+        added_attributes = set(
+            attribute for attribute, current_activity in
+            iter_flow_activities(flow)) - set(
+                activity_data['attribute'] for activity_data in
+                activities_data)
+        if added_attributes:
+            raise CompiledFlowMismatchException(
+                'The activities {} are not in the compiled flow.'.format(
+                    sorted(added_attributes)))
+
+        for activity_data in activities_data:
+            current_activity = getattr(flow, activity_data['attribute'], None)
+            requires = list(activity_data.get('requires', []))
+
+            if (not isinstance(current_activity, Activity) or
+                    current_activity.name != activity_data['name'] or
+                    [requirement.name for requirement in
+                        (getattr(current_activity, 'requires', None) or [])] !=
+                    requires):
+                raise CompiledFlowMismatchException(
+                    'The activity {} does not match the flow.'.format(
+                        activity_data['name']))
+
+            compiled_flow.activities.append(current_activity)
+            compiled_flow.attributes.append(activity_data['attribute'])
+            compiled_flow.activities_by_name[
+                current_activity.name] = current_activity
+            compiled_flow.requires[current_activity.name] = requires
+            compiled_flow.dependents.setdefault(current_activity.name, [])
+            for requirement in requires:
+                compiled_flow.dependents.setdefault(requirement, []).append(
+                    current_activity.name)
+
+        return compiled_flow
+
+
+def worker_runner(worker, stopped=None):
     """Run indefinitely the worker.
 
     Args:
         worker (object): the Activity worker.
+        stopped (threading.Event): event set when the worker should stop (the
+            worker runs until its run method returns False if not provided.)
     """
 
-    while(worker.run()):
+    while (stopped is None or not stopped.is_set()) and worker.run():
         continue
 
 
-def create(domain, name, version='1.0', on_exception=None):
+def create(
+        domain, name, version='1.0', on_exception=None, claim_check=None,
+        compression=None, transport=None):
     """Helper method to create Activities.
 
     The helper method simplifies the creation of an activity by setting the
@@ -580,6 +1142,15 @@ def create(domain, name, version='1.0', on_exception=None):
         name (str): name of the activity.
         version (str): activity version.
         on_exception (callable): the error handler.
+        claim_check (ClaimCheck): the store of the large values of the inputs
+            and the results of the activities (see `garcon.blob`.) The
+            external activities only use a claim check if they set their own
+            `claim_check`.
+        compression (str): the compression of the large inputs and results
+            of the activities (see `garcon.codec`.) The external activities
+            are only compressed if they set their own `compression`.
+        transport (Transport): the transport of the calls of the activities
+            to SWF (see `garcon.transport`.)
 
     Return:
         callable: activity generator.
@@ -587,12 +1158,20 @@ def create(domain, name, version='1.0', on_exception=None):
 
     def wrapper(**options):
         activity = Activity()
+        activity_claim_check = options.get('claim_check') or claim_check
+        activity_compression = options.get('compression') or compression
 
         if options.get('external'):
             activity = ExternalActivity(
                 timeout=options.get('timeout'),
                 heartbeat=options.get('heartbeat'))
 
+            # The workers of external activities may not resolve the
+            # references to the blobs or decode compressed inputs: the claim
+            # check and the compression only apply if they opt in.
+            activity_claim_check = options.get('claim_check')
+            activity_compression = options.get('compression')
+
         activity_name = '{name}_{activity}'.format(
             name=name,
             activity=options.get('name'))
@@ -608,107 +1187,349 @@ def create(domain, name, version='1.0', on_exception=None):
             tasks=options.get('tasks'),
             run=options.get('run'),
             schedule_to_start=options.get('schedule_to_start'),
-            on_exception=options.get('on_exception') or on_exception))
+            max_in_flight=options.get('max_in_flight'),
+            on_exception=options.get('on_exception') or on_exception,
+            claim_check=activity_claim_check,
+            compression=activity_compression,
+            transport=options.get('transport') or transport))
         return activity
     return wrapper
 
 
-def find_available_activities(flow, history, context):
+def find_available_activities(
+        flow, history, context, ready_set=None, max_in_flight=None,
+        recorder=None, evaluator=None):
     """Find all available activity instances of a flow.
 
     The history contains all the information of our activities (their state).
     This method focuses on finding all the activities that need to run.
 
+    The instances of an activity are only created if all the activities it
+    requires have completed. If a ready set is provided, it is used to find
+    the activities that are ready (and the ones that have already completed)
+    without going through the history.
+
+    Not all the instances of an activity are scheduled at once if they have
+    a maximum number of instances in flight (of the activity or of the whole
+    workflow execution), or if the decision runs out of time. The activities
+    requiring them are only available once all of their instances have been
+    scheduled and have completed.
+
     Args:
-        flow (module): the flow module.
+        flow (module): the flow module (or the compiled flow.)
         history (dict): the history information.
         context (dict): from the context find the available activities.
+        ready_set (ReadySet): the progress of the activities.
+        max_in_flight (int): the maximum number of instances in flight for
+            the whole workflow execution.
+        recorder (Recorder): the values of the recorded generators (the
+            generators of the activities that are ready are recorded.)
+        evaluator (Evaluator): the evaluator of the generators (the
+            generators of all the activities that are ready are evaluated
+            concurrently.)
     """
 
-    for instance in find_activities(flow, context):
-        # If an event is already available for the activity, it means it is
-        # not in standby anymore, it's either processing or has been completed.
-        # The activity is thus not available anymore.
-        states = history.get(instance.activity_name, {}).get(instance.id)
-
-        if states:
-            if states.get_last_state() != ACTIVITY_FAILED:
-                continue
-            elif (not instance.retry or
-                    instance.retry < count_activity_failures(states)):
-                raise Exception(
-                    'The activity failures has exceeded its retry limit.')
+    compiled_flow = compile_flow(flow)
+    total_in_flight = 0
+    if max_in_flight:
+        total_in_flight = sum(
+            count_in_flight(history, current_activity.name, ready_set)
+            for current_activity in compiled_flow.activities)
+
+    ready_activities = [
+        current_activity for current_activity in compiled_flow.activities
+        if is_activity_ready(
+            current_activity, history, context, ready_set,
+            recorder=recorder, evaluator=evaluator)]
+
+    if evaluator:
+        for current_activity in ready_activities:
+            evaluator.prefetch(
+                current_activity.generators,
+                current_activity.get_generator_context(context),
+                current_activity.name, recorder=recorder)
+
+    for current_activity in ready_activities:
+        activity_max_in_flight = getattr(
+            current_activity, 'max_in_flight', None)
+
+        budget = None
+        if activity_max_in_flight:
+            budget = activity_max_in_flight - count_in_flight(
+                history, current_activity.name, ready_set)
+
+        for instance in current_activity.instances(
+                context, recorder=recorder, evaluator=evaluator):
+            if budget is not None and budget <= 0:
+                break
 
-        can_yield = True
-        for requirement in instance.activity_worker.requires:
-            require_history = history.get(requirement.name)
+            if max_in_flight and total_in_flight >= max_in_flight:
+                return
 
-            if not require_history:
-                can_yield = False
-                break
+            # If an event is already available for the activity, it means it
+            # is not in standby anymore, it's either processing or has been
+            # completed. The activity is thus not available anymore.
+            states = history.get(instance.activity_name, {}).get(instance.id)
 
-            for requirement_states in require_history.values():
-                if ACTIVITY_COMPLETED not in requirement_states.states:
-                    can_yield = False
-                    break
+            if states:
+                if states.get_last_state() != ACTIVITY_FAILED:
+                    continue
+                elif (not instance.retry or
+                        instance.retry < count_activity_failures(states)):
+                    raise Exception(
+                        'The activity failures has exceeded its retry limit.')
 
-        if can_yield:
             yield instance
+            total_in_flight += 1
+            if budget is not None:
+                budget -= 1
+
+
+def is_activity_ready(
+        current_activity, history, context, ready_set=None, recorder=None,
+        evaluator=None):
+    """Check if the instances of an activity can be scheduled.
+
+    Args:
+        current_activity (Activity): the activity.
+        history (dict): the history information.
+        context (dict): the current context.
+        ready_set (ReadySet): the progress of the activities.
+        recorder (Recorder): the values of the recorded generators.
+        evaluator (Evaluator): the evaluator of the generators.
+    Return:
+        boolean: if all the activities it requires have completed (and if the
+            activity may still have instances to schedule.)
+    """
+
+    if ready_set:
+        if not ready_set.is_ready(current_activity.name):
+            return False
+
+        # All the instances that have been scheduled have completed: the
+        # activity is only done if none is left to schedule.
+        if ready_set.is_completed(current_activity.name) and (
+                is_activity_exhausted(
+                    current_activity, history, context, ready_set,
+                    recorder=recorder, evaluator=evaluator)):
+            return False
+
+    elif not all(
+            is_activity_completed(history, requirement.name)
+            for requirement in current_activity.requires):
+        return False
+
+    return all(
+        is_activity_exhausted(
+            requirement, history, context, ready_set, recorder=recorder,
+            evaluator=evaluator)
+        for requirement in current_activity.requires)
+
+
+def is_activity_exhausted(
+        current_activity, history, context, ready_set=None, recorder=None,
+        evaluator=None):
+    """Check if all the instances of an activity have completed.
+
+    Unlike `is_activity_completed`, the instances of the activity are created
+    to make sure none of them is still waiting to be scheduled.
+
+    Args:
+        current_activity (Activity): the activity.
+        history (dict): the history information.
+        context (dict): the current context.
+        ready_set (ReadySet): the progress of the activities (if provided,
+            the activities that are exhausted are kept in it.)
+        recorder (Recorder): the values of the recorded generators.
+        evaluator (Evaluator): the evaluator of the generators.
+    Return:
+        boolean: if all the instances of the activity have completed.
+    """
+
+    if ready_set and current_activity.name in ready_set.exhausted:
+        return True
 
+    activity_history = history.get(current_activity.name, {})
+    for instance in current_activity.instances(
+            context, recorder=recorder, evaluator=evaluator):
+        states = activity_history.get(instance.id)
+        if not states or not states.completed:
+            return False
 
-def find_uncomplete_activities(flow, history, context):
+    if ready_set:
+        ready_set.exhausted.add(current_activity.name)
+    return True
+
+
+def count_in_flight(history, activity_name, ready_set=None):
+    """Count the instances of an activity that are in flight.
+
+    Instances in flight have been scheduled and have not completed or failed
+    yet.
+
+    Args:
+        history (dict): the history information.
+        activity_name (str): the name of the activity.
+        ready_set (ReadySet): the progress of the activities.
+    Return:
+        int: the number of instances in flight.
+    """
+
+    if ready_set:
+        return ready_set.in_flight.get(activity_name, 0)
+
+    return len([
+        states for states in history.get(activity_name, {}).values()
+        if states.get_last_state() == ACTIVITY_SCHEDULED])
+
+
+def is_activity_completed(history, activity_name):
+    """Check if all the instances of an activity have completed.
+
+    Args:
+        history (dict): the history information.
+        activity_name (str): the name of the activity.
+    Return:
+        boolean: if the activity has instances in the history, and if all of
+            them have completed.
+    """
+
+    activity_history = history.get(activity_name)
+    if not activity_history:
+        return False
+
+    for activity_states in activity_history.values():
+        if not activity_states.completed:
+            return False
+    return True
+
+
+def find_uncomplete_activities(
+        flow, history, context, recorder=None, evaluator=None):
     """Find uncomplete activity instances.
 
     Uncomplete activities are all the activities that are not marked as
     completed.
 
     Args:
-        flow (module): the flow module.
+        flow (module): the flow module (or the compiled flow.)
         history (dict): the history information.
         context (dict): from the context find the available activities.
+        recorder (Recorder): the values of the recorded generators (they are
+            only read: the activities may not be ready.)
+        evaluator (Evaluator): the evaluator of the generators.
     Yield:
         activity: The available activity.
     """
 
-    for instance in find_activities(flow, context):
-        states = history.get(instance.activity_name, {}).get(instance.id)
-        if not states or ACTIVITY_COMPLETED not in states.states:
-            yield instance
+    if recorder:
+        recorder = recorder.replay()
 
+    for current_activity in compile_flow(flow).activities:
+        for instance in current_activity.instances(
+                context, recorder=recorder, evaluator=evaluator):
+            states = history.get(instance.activity_name, {}).get(instance.id)
+            if not states or not states.completed:
+                yield instance
 
-def find_workflow_activities(flow):
-    """Retrieves all the activities from a flow
+
+def find_context_keys(flow):
+    """Find the values of the context needed to schedule the activities.
+
+    The values are the ones required by the tasks of the activities and the
+    ones read by their generators. They can only be found if all the tasks
+    list their requirements (and are not in task lists) and if all the
+    generators list the values they read (see `generator.requires`.)
 
     Args:
-        flow (module): the flow module.
+        flow (module): the flow module (or the compiled flow.)
     Return:
-        list: all the activities.
+        set: the keys of the context (None if all the values are needed.)
     """
 
+    keys = set()
+    for current_activity in compile_flow(flow).activities:
+        current_runner = getattr(current_activity, 'runner', None)
+        has_task_list = getattr(current_runner, 'has_task_list', None)
+        if not has_task_list or has_task_list():
+            return None
+
+        requirements = runner.get_plan(current_runner, dict()).requirements
+        if requirements is None:
+            return None
+        keys.update(requirements)
+
+        for current_generator in current_activity.generators or []:
+            generator_keys = generator.get_requirements(current_generator)
+            if generator_keys is None:
+                return None
+            keys.update(generator_keys)
+
+    return keys
+
+
+def compile_flow(flow):
+    """Compile a flow.
+
+    Args:
+        flow (module): the flow module (if the flow is already compiled, it is
+            returned as is.)
+    Return:
+        CompiledFlow: the compiled flow.
+    """
+
+    if isinstance(flow, CompiledFlow):
+        return flow
+
     activities = []
+    attributes = []
+    for module_attribute, current_activity in iter_flow_activities(flow):
+        activities.append(current_activity)
+        attributes.append(module_attribute)
+    return CompiledFlow(activities, attributes)
+
+
+def iter_flow_activities(flow):
+    """Iterate over the activities of a flow module.
+
+    Args:
+        flow (module): the flow module.
+    Yield:
+        tuple: the name of the attribute of the activity in the module, and
+            the activity.
+    """
+
     for module_attribute in dir(flow):
         current_activity = getattr(flow, module_attribute)
         if isinstance(current_activity, Activity):
-            activities.append(current_activity)
-    return activities
+            yield module_attribute, current_activity
+
+
+def find_workflow_activities(flow):
+    """Retrieves all the activities from a flow
+
+    Args:
+        flow (module): the flow module (or the compiled flow.)
+    Return:
+        list: all the activities.
+    """
+
+    return list(compile_flow(flow).activities)
 
 
 def find_activities(flow, context):
     """Retrieves all the activities from a flow.
 
     Args:
-        flow (module): the flow module.
+        flow (module): the flow module (or the compiled flow.)
     Return:
         list: All the activity instances for the flow.
     """
 
     activities = []
-    for module_attribute in dir(flow):
-        current_activity = getattr(flow, module_attribute)
-
-        if isinstance(current_activity, Activity):
-            for activity_instance in current_activity.instances(context):
-                activities.append(activity_instance)
+    for current_activity in compile_flow(flow).activities:
+        for activity_instance in current_activity.instances(context):
+            activities.append(activity_instance)
 
     return activities
 
@@ -722,4 +1543,4 @@ def count_activity_failures(states):
         int: The number of times an activity has failed.
     """
 
-    return len([evt for evt in states.states if evt == ACTIVITY_FAILED])
+    return states.failures
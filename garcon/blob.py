@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Blob
+====
+
+SWF limits the size of the inputs and the results of the activities (32kB).
+Large values can be stored in a blob store instead (claim check): only a
+reference to the value travels through SWF, and the activity workers load the
+value from the store when they receive the reference.
+
+The references are content-addressed (the sha256 of the encoded value): the
+same value is only stored once, even if it is sent to all the instances of an
+activity. The references are regular values of the context: the decider sends
+them to the next activities as they are. The decider only resolves them for
+the generators of the activities that have a claim check, and for the results
+returned to the custom deciders by `schedule`. Other code reading the context
+of the decider (such as the generators of an activity without a claim check)
+receives the references.
+
+The blob store must be reachable from the deciders and all the activity
+workers (the file blob store can use a shared volume.) Other stores (such as
+an object store) implement the interface of `BlobStore`.
+
+    from garcon import activity
+    from garcon import blob
+
+    claim_check = blob.ClaimCheck(blob.FileBlobStore('/mnt/garcon/blobs'))
+    create = activity.create(domain, name, claim_check=claim_check)
+
+The inputs of the external activities are not offloaded by the claim check of
+the flow (their workers may not resolve the references), unless the activity
+sets its own `claim_check`.
+"""
+
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+
+from garcon import codec
+
+
+REFERENCE_KEY = '__garcon_blob__'
+DEFAULT_THRESHOLD = 4096  # Values larger than 4kB (encoded) are offloaded.
+DEFAULT_CACHE_SIZE = 128
+
+
+class BlobNotFoundException(Exception):
+    """Exception when a blob is not in the blob store.
+    """
+
+    pass
+
+
+class BlobStore:
+    """Interface of the blob stores.
+    """
+
+    def get(self, key):
+        """Get a blob.
+
+        Args:
+            key (str): the key of the blob.
+        Return:
+            bytes: the blob.
+        Raises:
+            BlobNotFoundException: if the blob does not exist.
+        """
+
+        raise NotImplementedError()
+
+    def put(self, key, data):
+        """Put a blob (if it does not exist yet.)
+
+        Args:
+            key (str): the key of the blob.
+            data (bytes): the blob.
+        """
+
+        raise NotImplementedError()
+
+
+class FileBlobStore(BlobStore):
+
+    def __init__(self, path):
+        """Create a blob store on the file system.
+
+        Args:
+            path (str): the directory of the blobs (created if it does not
+                exist.)
+        """
+
+        self.path = path
+
+    def get_path(self, key):
+        """Get the path of a blob.
+
+        Args:
+            key (str): the key of the blob.
+        Return:
+            str: the path of the blob.
+        """
+
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        try:
+            with open(self.get_path(key), 'rb') as blob_file:
+                return blob_file.read()
+        except (IOError, OSError):
+            raise BlobNotFoundException(key)
+
+    def put(self, key, data):
+        path = self.get_path(key)
+        if os.path.exists(path):
+            return
+
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # The directory has been created in the meantime.
+                pass
+
+        # The blob is written in a temporary file first, so a blob is never
+        # read before it is complete.
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(descriptor, 'wb') as blob_file:
+            blob_file.write(data)
+        os.rename(temporary_path, path)
+
+
+class ClaimCheck:
+
+    def __init__(
+            self, store, threshold=DEFAULT_THRESHOLD,
+            cache_size=DEFAULT_CACHE_SIZE):
+        """Create a claim check.
+
+        Args:
+            store (BlobStore): the blob store.
+            threshold (int): size (in bytes, once encoded in JSON) above which
+                a value is offloaded to the blob store.
+            cache_size (int): number of values kept in memory (the values are
+                not loaded again from the store while they are in the cache.)
+        """
+
+        self.store = store
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def offload(self, values):
+        """Offload the large values of a dictionary.
+
+        Args:
+            values (dict): the values (such as the input or the result of an
+                activity.)
+        Return:
+            dict: the values, the large ones being replaced by references.
+        """
+
+        offloaded = dict()
+        for key, value in values.items():
+            if not is_reference(value):
+                data = codec.dumps(value).encode('utf-8')
+                if len(data) > self.threshold:
+                    value = self.put(data)
+            offloaded[key] = value
+        return offloaded
+
+    def resolve(self, values):
+        """Resolve the references of a dictionary.
+
+        Args:
+            values (dict): the values (such as the input of an activity.)
+        Return:
+            dict: the values, the references being replaced by the values
+                they refer to.
+        Raises:
+            BlobNotFoundException: if a blob does not exist.
+        """
+
+        resolved = dict()
+        for key, value in values.items():
+            if is_reference(value):
+                value = codec.loads(self.get(value[REFERENCE_KEY]).decode(
+                    'utf-8'))
+            resolved[key] = value
+        return resolved
+
+    def put(self, data):
+        """Put an encoded value into the blob store.
+
+        Args:
+            data (bytes): the encoded value.
+        Return:
+            dict: the reference to the value.
+        """
+
+        key = hashlib.sha256(data).hexdigest()
+        if self.get_cached(key) is None:
+            self.store.put(key, data)
+            self.set_cached(key, data)
+        return {REFERENCE_KEY: key}
+
+    def get(self, key):
+        """Get an encoded value (from the cache, or from the blob store.)
+
+        Args:
+            key (str): the key of the value.
+        Return:
+            bytes: the encoded value.
+        """
+
+        data = self.get_cached(key)
+        if data is None:
+            data = self.store.get(key)
+            self.set_cached(key, data)
+        return data
+
+    def get_cached(self, key):
+        with self.lock:
+            data = self.cache.pop(key, None)
+            if data is not None:
+                self.cache[key] = data
+            return data
+
+    def set_cached(self, key, data):
+        if not self.cache_size:
+            return
+
+        with self.lock:
+            self.cache.pop(key, None)
+            self.cache[key] = data
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+
+def is_reference(value):
+    """Check if a value is a reference to a blob.
+
+    Args:
+        value (*): the value.
+    Return:
+        boolean: if the value is a reference.
+    """
+
+    return (
+        isinstance(value, dict) and len(value) == 1 and
+        REFERENCE_KEY in value)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Cache
+=====
+
+The decider has to rebuild the state of an execution (the state of all its
+activities and its context) from the event history on every decision task. On
+long executions, most of this work has already been done by the previous
+decision task.
+
+The state cache keeps, in memory, the state built for each workflow run along
+with the id of the last event it has processed. The next decision task for the
+same run only has to process the events that have been added since.
+"""
+
+import collections
+import threading
+import time
+
+
+DEFAULT_MAX_SIZE = 1000
+DEFAULT_TTL = 3600  # 1 hour.
+
+
+class StateCache:
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        """Create a state cache.
+
+        The cache is bounded: the least recently used runs are evicted when
+        the cache reaches its maximum size, and runs that have not been
+        accessed for longer than the ttl are considered expired.
+
+        Args:
+            max_size (int): maximum number of runs to keep (0 disables the
+                cache.)
+            ttl (int): number of seconds an entry is kept without being
+                accessed (None to never expire.)
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, workflow_id, run_id):
+        """Get the state of a workflow run.
+
+        Args:
+            workflow_id (str): the workflow id.
+            run_id (str): the run id.
+        Return:
+            HistoryState: the cached state, None if the run is not cached (or
+                if its entry has expired.)
+        """
+
+        key = (workflow_id, run_id)
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if not entry:
+                return None
+
+            state, timestamp = entry
+            if self.ttl is not None and time.time() - timestamp > self.ttl:
+                return None
+
+            self.entries[key] = entry
+            return state
+
+    def set(self, workflow_id, run_id, state):
+        """Set the state of a workflow run.
+
+        Args:
+            workflow_id (str): the workflow id.
+            run_id (str): the run id.
+            state (HistoryState): the state of the run.
+        """
+
+        if not self.max_size:
+            return
+
+        key = (workflow_id, run_id)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (state, time.time())
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def remove(self, workflow_id, run_id):
+        """Remove a workflow run from the cache.
+
+        Args:
+            workflow_id (str): the workflow id.
+            run_id (str): the run id.
+        """
+
+        with self.lock:
+            self.entries.pop((workflow_id, run_id), None)
+
+    def __len__(self):
+        return len(self.entries)
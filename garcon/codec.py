@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Codec
+=====
+
+The workflow input, the inputs and the results of the activities are JSON
+strings. Large payloads can be compressed (zlib, or zstd if the `zstandard`
+package is installed) to stay under the size limits of SWF and to reduce the
+amount of data transferred on each poll.
+
+Compression is opt-in (see the `compression` option of `activity.create`),
+but decoding is always transparent: a compressed payload is tagged with its
+algorithm, and a payload that is not tagged is plain JSON. A payload is only
+compressed if it is larger than the threshold and if compressing it makes it
+smaller.
+
+    from garcon import activity
+
+    create = activity.create(domain, name, compression='zlib')
+
+The inputs of the external activities are not compressed by the option of the
+flow (their workers may not decode them), unless the activity sets its own
+`compression`.
+
+The workflow input can be compressed by the client that starts the execution:
+
+    from garcon import codec
+
+    input = codec.encode(values, compression='zlib')
+
+All the JSON payloads of garcon are encoded and decoded with `dumps` and
+`loads`. The JSON backend is picked when the module is loaded: `orjson` or
+`ujson` are used to decode the payloads if they are installed. The payloads
+are always encoded by the standard library (the output of the other libraries
+is not the same, and some values, such as the content-addressed blobs, depend
+on it.) The backend can be changed with `set_backend`.
+"""
+
+import base64
+import json
+import re
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+TAG_PREFIX = 'garcon.'
+TAG_SEPARATOR = ':'
+DEFAULT_THRESHOLD = 1024  # Payloads smaller than 1kB are not compressed.
+
+# The other backends do not decode the integers that do not fit in 64 bits
+# (orjson silently decodes them as floats): the payloads that may contain such
+# integers are decoded by the standard library.
+LARGE_INTEGER = re.compile(r'\d{19}')
+
+
+class UnknownCompressionException(Exception):
+    """Exception when a compression algorithm is not available.
+    """
+
+    pass
+
+
+class UnknownBackendException(Exception):
+    """Exception when a JSON backend is not available.
+    """
+
+    pass
+
+
+# The decoding and the encoding function of each backend.
+BACKENDS = dict(json=(json.loads, json.dumps))
+if ujson:
+    BACKENDS.update(ujson=(ujson.loads, json.dumps))
+if orjson:
+    BACKENDS.update(orjson=(orjson.loads, json.dumps))
+
+backend = None
+backend_loads = json.loads
+backend_dumps = json.dumps
+
+
+def set_backend(name):
+    """Set the JSON backend.
+
+    Args:
+        name (str): the name of the backend (`json`, `orjson` or `ujson`.)
+    Raises:
+        UnknownBackendException: if the backend is not available.
+    """
+
+    global backend, backend_loads, backend_dumps
+
+    if name not in BACKENDS:
+        raise UnknownBackendException(name)
+    backend = name
+    backend_loads, backend_dumps = BACKENDS[name]
+
+
+def loads(payload):
+    """Decode a JSON string.
+
+    The values that the backend does not support (such as the integers that
+    do not fit in 64 bits, or NaN) are decoded by the standard library.
+
+    Args:
+        payload (str): the JSON string.
+    Return:
+        *: the value.
+    """
+
+    if backend_loads is json.loads or LARGE_INTEGER.search(payload):
+        return json.loads(payload)
+
+    try:
+        return backend_loads(payload)
+    except Exception:
+        return json.loads(payload)
+
+
+def dumps(value):
+    """Encode a value in JSON.
+
+    Args:
+        value (*): the value.
+    Return:
+        str: the JSON string (the same as `json.dumps`.)
+    """
+
+    return backend_dumps(value)
+
+
+set_backend('orjson' if orjson else 'ujson' if ujson else 'json')
+
+
+def zstd_compress(data):
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+ALGORITHMS = dict(zlib=(zlib.compress, zlib.decompress))
+if zstandard:
+    ALGORITHMS.update(zstd=(zstd_compress, zstd_decompress))
+
+
+def compress(payload, compression=None, threshold=DEFAULT_THRESHOLD):
+    """Compress a payload.
+
+    Args:
+        payload (str): the payload (a JSON string.)
+        compression (str): the compression algorithm (`zlib` or `zstd`, None
+            to not compress the payload.)
+        threshold (int): the size (in characters) above which the payload is
+            compressed.
+    Return:
+        str: the payload (compressed and tagged, or as it was provided.)
+    Raises:
+        UnknownCompressionException: if the algorithm is not available.
+    """
+
+    if not compression or len(payload) <= threshold:
+        return payload
+
+    if compression not in ALGORITHMS:
+        raise UnknownCompressionException(compression)
+
+    compress_data = ALGORITHMS[compression][0]
+    compressed = '{}{}{}{}'.format(
+        TAG_PREFIX, compression, TAG_SEPARATOR,
+        base64.b64encode(
+            compress_data(payload.encode('utf-8'))).decode('ascii'))
+
+    if len(compressed) >= len(payload):
+        return payload
+    return compressed
+
+
+def decompress(payload):
+    """Decompress a payload.
+
+    Args:
+        payload (str): the payload (compressed or not.)
+    Return:
+        str: the JSON string.
+    Raises:
+        UnknownCompressionException: if the payload has been compressed with
+            an algorithm that is not available.
+    """
+
+    if not payload.startswith(TAG_PREFIX):
+        return payload
+
+    compression, data = payload[len(TAG_PREFIX):].split(TAG_SEPARATOR, 1)
+    if compression not in ALGORITHMS:
+        raise UnknownCompressionException(compression)
+
+    decompress_data = ALGORITHMS[compression][1]
+    return decompress_data(base64.b64decode(data)).decode('utf-8')
+
+
+def encode(value, compression=None, threshold=DEFAULT_THRESHOLD):
+    """Encode a value.
+
+    Args:
+        value (*): the value (it needs to be serializable in JSON.)
+        compression (str): the compression algorithm (see `compress`.)
+        threshold (int): the size above which the payload is compressed.
+    Return:
+        str: the payload.
+    """
+
+    return compress(
+        dumps(value), compression=compression, threshold=threshold)
+
+
+def decode(payload):
+    """Decode a payload (compressed or not.)
+
+    Args:
+        payload (str): the payload.
+    Return:
+        *: the value.
+    """
+
+    return loads(decompress(payload))
@@ -7,24 +7,35 @@ Context carries information that have been retrieved from the different SWF
 events of an execution.
 """
 
-import json
+from garcon import codec
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 
 class ExecutionContext:
 
-    def __init__(self, events=None):
+    def __init__(self, events=None, keys=None):
         """Create the execution context.
 
         An execution context gathers the execution input and the result of all
         the activities that have successfully ran. It also adds the execution
         input into the mix (for logger purposes).
 
+        The context can be projected: only the values that are needed (by the
+        activities to schedule) are kept.
+
         Args:
             events (list): optional list of all the events.
+            keys (set): the keys of the values to keep (None to keep all the
+                values.)
         """
 
         self.current = {}
         self.workflow_input = {}
+        self.keys = keys
 
         if events:
             for event in events:
@@ -73,7 +84,7 @@ class ExecutionContext:
         """Add the workflow execution input.
 
         Please note the input within the execution event should always be a
-        json string.
+        json string (it can be compressed, see `garcon.codec`.)
 
         Args:
             execution_event (str): the execution event information.
@@ -82,15 +93,15 @@ class ExecutionContext:
         attributes = execution_event['workflowExecutionStartedEventAttributes']
         result = attributes.get('input')
         if result:
-            result = json.loads(result)
+            result = codec.decode(result)
             self.workflow_input = result
-            self.current.update(result)
+            self.current.update(self.project(result))
 
     def add_activity_result(self, activity_event):
         """Add an activity result.
 
         Please note: the result of an activity event should always be a json
-        string.
+        string (it can be compressed, see `garcon.codec`.)
 
         Args:
             activity_event (str): json object that represents the activity
@@ -100,5 +111,126 @@ class ExecutionContext:
         attributes = activity_event['activityTaskCompletedEventAttributes']
         result = attributes.get('result')
 
+        # If no values are kept, the result does not need to be decoded.
+        if result and (self.keys is None or self.keys):
+            self.add_result(codec.decode(result))
+
+    def add_result(self, result):
+        """Add a decoded activity result.
+
+        Args:
+            result (dict): the result of the activity.
+        """
+
         if result:
-            self.current.update(json.loads(result))
+            self.current.update(self.project(result))
+
+    def project(self, values):
+        """Only keep the values of the context that are needed.
+
+        Args:
+            values (dict): the values.
+        Return:
+            dict: the values to keep.
+        """
+
+        if self.keys is None:
+            return values
+
+        if len(self.keys) < len(values):
+            return dict(
+                (key, values[key]) for key in self.keys if key in values)
+        return dict(
+            (key, value) for key, value in values.items() if key in self.keys)
+
+    def covers(self, keys):
+        """Check if the context has all the values needed.
+
+        Args:
+            keys (set): the keys of the values needed (None if all the values
+                are needed.)
+        Return:
+            boolean: if the context has kept all the values.
+        """
+
+        if self.keys is None:
+            return True
+        return keys is not None and set(keys) <= self.keys
+
+    def to_dict(self):
+        """Serialize the execution context.
+
+        Return:
+            dict: the execution context (it can be stored as json.)
+        """
+
+        return dict(
+            current=self.current, workflow_input=self.workflow_input,
+            keys=sorted(self.keys) if self.keys is not None else None)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Load an execution context.
+
+        Args:
+            data (dict): the serialized execution context (see `to_dict`.)
+        Return:
+            ExecutionContext: the execution context.
+        """
+
+        execution_context = cls()
+        execution_context.current = dict(data.get('current', {}))
+        execution_context.workflow_input = data.get('workflow_input', {})
+        if data.get('keys') is not None:
+            execution_context.keys = set(data.get('keys'))
+        return execution_context
+
+
+class ContextView(Mapping):
+    """Read-only view of a local context over an execution context.
+
+    The values of the local context take precedence over the values of the
+    execution context. The execution context is not copied: all the activity
+    instances of an execution share it, and only keep their local context.
+    The keys are iterated in the same order as in
+    `dict(execution_context, **local_context)`. The task lists receive a copy
+    of the view as a dict.
+    """
+
+    __slots__ = ('execution_context', 'local_context')
+
+    def __init__(self, execution_context, local_context):
+        """Create a context view.
+
+        Args:
+            execution_context (dict): the execution context (shared.)
+            local_context (dict): the local context.
+        """
+
+        self.execution_context = execution_context
+        self.local_context = local_context
+
+    def __getitem__(self, key):
+        if key in self.local_context:
+            return self.local_context[key]
+        return self.execution_context[key]
+
+    def get(self, key, default=None):
+        if key in self.local_context:
+            return self.local_context[key]
+        return self.execution_context.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.local_context or key in self.execution_context
+
+    def __iter__(self):
+        for key in self.execution_context:
+            yield key
+        for key in self.local_context:
+            if key not in self.execution_context:
+                yield key
+
+    def __len__(self):
+        return len(self.execution_context) + sum(
+            1 for key in self.local_context
+            if key not in self.execution_context)
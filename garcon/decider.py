@@ -7,39 +7,153 @@ The decider worker is focused on orchestrating which activity needs to be
 executed and when based on the flow procided.
 """
 
-from boto.swf.exceptions import SWFDomainAlreadyExistsError
-from boto.swf.exceptions import SWFTypeAlreadyExistsError
 import boto.swf.layer2 as swf
+from concurrent.futures import ThreadPoolExecutor
 import functools
-import json
+import itertools
+import threading
+import time
+import uuid
 
 from garcon import activity
+from garcon import cache
+from garcon import codec
 from garcon import event
+from garcon import generator
 from garcon import log
-
-
-class DeciderWorker(swf.Decider, log.GarconLogger):
-
-    def __init__(self, flow, register=True):
+from garcon import registration
+from garcon import transport as swf_transport
+from garcon import utils
+
+
+MAX_HISTORY_PAGE_SIZE = 1000
+DEFAULT_GENERATOR_WORKERS = 4
+DEFAULT_POOL_SIZE = 4
+RUNNER_BACKOFF = 1  # Seconds to wait after a decision raises an error.
+MAX_RUNNER_BACKOFF = 60
+
+# Events that cannot change the decisions: if all the events added since the
+# previous decision task are passive, there is nothing new to decide.
+PASSIVE_EVENTS = frozenset([
+    'ActivityTaskScheduled',
+    'ActivityTaskStarted',
+    'DecisionTaskCompleted',
+    'DecisionTaskScheduled',
+    'DecisionTaskStarted',
+    'MarkerRecorded',
+    'TimerStarted',
+    'WorkflowExecutionSignaled'])
+CLOSING_DECISIONS = (
+    'CompleteWorkflowExecution',
+    'FailWorkflowExecution')
+
+# Prefix of the timers started when a decision runs out of time: the timers
+# fire right away, and the next decision continues the scheduling.
+CONTINUATION_TIMER_PREFIX = 'garcon.continue'
+
+
+class DeciderWorker(
+        swf_transport.LazyConnection, swf.Decider, log.GarconLogger):
+
+    def __init__(
+            self, flow, register=True, state_cache=None,
+            reverse_history=False, compiled_flow=None, snapshot_store=None,
+            registration_manifest=None, transport=None):
         """Initialize the Decider Worker.
 
         Args:
             flow (module): Flow module.
             register (boolean): If this flow needs to be register on AWS.
+            state_cache (StateCache): cache of the execution states (a new
+                cache is created if not provided.)
+            reverse_history (boolean): if the history should be retrieved from
+                the newest to the oldest event (see `get_history`.)
+            compiled_flow (CompiledFlow): the precompiled flow (the flow is
+                compiled if not provided.)
+            snapshot_store (SnapshotStore): store of the execution states on
+                disk (the states are only kept in memory if not provided.)
+            registration_manifest (str): path of the manifest of the
+                registered flows (see `garcon.registration`.)
+            transport (Transport): the transport of the calls to SWF (the
+                boto2 transport if not provided, see `garcon.transport`.)
         """
 
         self.flow = flow
         self.domain = flow.domain
         self.version = getattr(flow, 'version', '1.0')
-        self.activities = activity.find_workflow_activities(flow)
+        self.compiled_flow = compiled_flow or activity.compile_flow(flow)
+        self.activities = self.compiled_flow.activities
         self.task_list = flow.name
         self.on_exception = getattr(flow, 'on_exception', None)
+        self.on_metric = getattr(flow, 'on_metric', None)
+        self.max_in_flight = getattr(flow, 'max_in_flight', None)
+        self.max_result_size = getattr(flow, 'max_result_size', None)
+        if self.max_result_size is None and not getattr(flow, 'decider', None):
+            # The default decider never reads the results of the activities.
+            self.max_result_size = 0
+
+        # The custom deciders can read any value from the context.
+        self.context_keys = None
+        if (getattr(flow, 'project_context', True) and
+                not getattr(flow, 'decider', None)):
+            self.context_keys = activity.find_context_keys(self.compiled_flow)
+        self.state_cache = state_cache
+        if self.state_cache is None:
+            self.state_cache = cache.StateCache()
+        self.reverse_history = reverse_history
+        self.snapshot_store = snapshot_store
+        self.history_executor = ThreadPoolExecutor(max_workers=1)
+        self.generator_executor = ThreadPoolExecutor(
+            max_workers=getattr(
+                flow, 'generator_workers', DEFAULT_GENERATOR_WORKERS))
+        self.generator_timeout = getattr(flow, 'generator_timeout', None)
+        self.decision_budget = getattr(flow, 'decision_budget', None)
+        self.registration = registration.Registration(
+            workers=getattr(
+                flow, 'registration_workers', registration.DEFAULT_WORKERS),
+            manifest=registration_manifest)
         super(DeciderWorker, self).__init__()
+        self.transport = transport
+        if self.transport is None:
+            self.transport = swf_transport.ActorTransport(self)
 
         if register:
             self.register()
 
-    def get_history(self, poll):
+    def poll(self, task_list=None, **kwargs):
+        """Poll for a decision task (or for a page of its history.)
+
+        Args:
+            task_list (str): the task list (the task list of the flow if not
+                provided.)
+            kwargs (dict): the options of the poll (see
+                `Transport.poll_for_decision_task`.)
+        Return:
+            dict: the decision task.
+        """
+
+        decision_task = self.transport.poll_for_decision_task(
+            self.domain, task_list or self.task_list, **kwargs)
+        self.last_tasktoken = decision_task.get('taskToken')
+        return decision_task
+
+    def complete(self, task_token=None, decisions=None, **kwargs):
+        """Complete the decision task.
+
+        Args:
+            task_token (str): the token of the task (the token of the last
+                polled task if not provided.)
+            decisions (Layer1Decisions): the decisions.
+        """
+
+        if isinstance(decisions, swf.Layer1Decisions):
+            decisions = decisions._data
+        if task_token is None:
+            task_token = self.last_tasktoken
+        return self.transport.respond_decision_task_completed(
+            task_token, decisions=decisions, **kwargs)
+
+    def get_history(self, poll, known_event_id=0):
         """Get all the history.
 
         The full history needs to be recovered from SWF to make sure that all
@@ -48,20 +162,177 @@ class DeciderWorker(swf.Decider, log.GarconLogger):
 
         Args:
             poll (object): The poll object (see AWS SWF for details.)
+            known_event_id (int): id of the last event already known (only
+                used when the history is retrieved in reverse order.)
         Return:
             list: All the events.
         """
 
-        events = poll['events']
-        while 'nextPageToken' in poll:
-            poll = self.poll(next_page_token=poll['nextPageToken'])
+        # Remove all the events that are related to decisions and only.
+        return [
+            e for page in self.iter_history(poll, known_event_id)
+            for e in page if not e['eventType'].startswith('Decision')]
+
+    def iter_history(self, poll, known_event_id=0):
+        """Iterate over the pages of the history.
 
-            if 'events' in poll:
-                events += poll['events']
+        The pages are provided as soon as they are retrieved, and the next
+        page is requested while the current one is consumed.
 
-        # Remove all the events that are related to decisions and only.
-        return [e for e in events if not e['eventType'].startswith('Decision')]
+        When the history is retrieved in reverse order, pages of the maximum
+        size are requested from the newest to the oldest event, and the
+        retrieval stops as soon as a page reaches an event that is already
+        known by the decider. The events are then provided in one page, from
+        the oldest to the newest.
+
+        Args:
+            poll (object): The poll object (see AWS SWF for details.)
+            known_event_id (int): id of the last event already known (only
+                used when the history is retrieved in reverse order.)
+        Yield:
+            list: the events of a page.
+        """
+
+        tags = execution_tags(poll)
+        total_pages = 0
+        total_events = 0
+        size = 0 if self.on_metric else None
+        reversed_pages = []
+
+        page = poll
+        while True:
+            events = page.get('events', [])
+            total_pages += 1
+            total_events += len(events)
+            if size is not None:
+                size += self.measure_events(events)
+
+            next_page = None
+            if 'nextPageToken' in page and not (
+                    self.reverse_history and known_event_id and min(
+                        [evt['eventId'] for evt in events] or
+                        [0]) <= known_event_id):
+                next_page = self.history_executor.submit(
+                    self.poll, **self.get_page_options(page['nextPageToken']))
+
+            if self.reverse_history:
+                reversed_pages.append(events)
+            else:
+                yield events
+
+            if not next_page:
+                break
+            page = next_page.result()
+
+        self.report('history.pages', total_pages, tags)
+        self.report('history.events', total_events, tags)
+        if size is not None:
+            self.report('history.bytes', size, tags)
+
+        if self.reverse_history:
+            yield [
+                evt for events in reversed(reversed_pages)
+                for evt in reversed(events)]
+
+    def get_page_options(self, next_page_token):
+        """Get the options to poll the next page of the history.
+
+        Args:
+            next_page_token (str): the token of the next page.
+        Return:
+            dict: the options of the poll.
+        """
+
+        options = dict(next_page_token=next_page_token)
+        if self.reverse_history:
+            options.update(
+                reverse_order=True,
+                maximum_page_size=MAX_HISTORY_PAGE_SIZE)
+        return options
+
+    def get_known_event_id(self, poll):
+        """Get the id of the last event known for an execution.
+
+        If the execution is not in the cache, its snapshot is loaded (and put
+        in the cache, where `get_history_state` finds it.)
+
+        Args:
+            poll (object): The poll object (see AWS SWF for details.)
+        Return:
+            int: the id of the last event consumed by the cached state of the
+                execution (0 if the execution is not cached and does not have
+                a snapshot.)
+        """
+
+        execution = poll.get('workflowExecution', {})
+        workflow_id = execution.get('workflowId')
+        run_id = execution.get('runId')
+
+        state = self.state_cache.get(workflow_id, run_id)
+        if state is None:
+            state = self.get_snapshot(workflow_id, run_id)
+            if state is None:
+                return 0
+            self.state_cache.set(workflow_id, run_id, state)
+        return state.last_event_id
+
+    def measure_events(self, events):
+        """Measure the size of a page of events.
+
+        Boto does not expose the size of the responses, the size is measured
+        by encoding the events again. This is only done if the flow has a
+        `on_metric` handler.
+
+        Args:
+            events (list): the events of a page.
+        Return:
+            int: the size (in bytes) of the events, None if not measured.
+        """
+
+        if not self.on_metric:
+            return None
+        return len(codec.dumps(events))
+
+    def report(self, name, value, tags=None):
+        """Report a metric.
+
+        Metrics are logged (debug level), and sent to the `on_metric` handler
+        of the flow if one is defined.
+
+        Args:
+            name (str): the name of the metric.
+            value (int): the value of the metric.
+            tags (dict): additional information (such as the workflow id and
+                the run id.)
+        """
+
+        tags = tags or dict()
+        self.logger.debug('{}: {} {}'.format(name, value, tags))
+        if self.on_metric:
+            self.on_metric(self, name, value, tags)
+
+    def create_evaluator(self, poll):
+        """Create the evaluator of the generators for a decision.
 
+        The generators are evaluated on the thread pool of the decider, and
+        the time each generator takes is reported (`generator.time` metric.)
+
+        Args:
+            poll (object): The poll object (see AWS SWF for details.)
+        Return:
+            Evaluator: the evaluator.
+        """
+
+        tags = execution_tags(poll)
+
+        def on_timing(name, elapsed):
+            generator_tags = dict(tags)
+            generator_tags.update(generator=name)
+            self.report('generator.time', elapsed, generator_tags)
+
+        return generator.Evaluator(
+            self.generator_executor, timeout=self.generator_timeout,
+            on_timing=on_timing)
 
     def get_activity_states(self, history):
         """Get the activity states from the history.
@@ -78,15 +349,150 @@ class DeciderWorker(swf.Decider, log.GarconLogger):
 
         return event.activity_states_from_events(history)
 
+    def get_history_state(self, poll, pages, known_event_id=0):
+        """Get the history state of the execution.
+
+        If the state of the execution is in the cache (or in the snapshot
+        store), only the events that have not been consumed yet are added into
+        it. Otherwise (or if the cached state cannot be updated), the state is
+        rebuilt from the full history. If a page of the history cannot be
+        retrieved, the error is raised and no state is kept in the cache.
+
+        The pages of the history are consumed as they are provided (see
+        `iter_history`.)
+
+        Args:
+            poll (object): The poll object (see AWS SWF for details.)
+            pages (iterable): the pages of the history (the full history, or
+                only the events after `known_event_id`.)
+            known_event_id (int): id of the last event known when the history
+                was retrieved.
+        Return:
+            HistoryState: the state of the execution.
+        """
+
+        execution = poll.get('workflowExecution', {})
+        workflow_id = execution.get('workflowId')
+        run_id = execution.get('runId')
+
+        pages = iter(pages)
+        consumed_pages = []
+
+        state = self.state_cache.get(workflow_id, run_id)
+        if not state:
+            state = self.get_snapshot(workflow_id, run_id)
+
+        if state:
+            # The cached state is removed while it is updated, so a failure
+            # in the middle of the update does not leave a corrupted state.
+            self.state_cache.remove(workflow_id, run_id)
+
+            error = None
+            if known_event_id and state.last_event_id != known_event_id:
+                error = 'The cached state has changed.'
+            else:
+                # The errors raised while the pages are retrieved are not
+                # caught: the state would be rebuilt from a partial history.
+                last_event_id = 0
+                for page in pages:
+                    consumed_pages.append(page)
+                    try:
+                        state.add_events(page)
+                    except Exception as fold_error:
+                        error = fold_error
+                        break
+                    last_event_id = max(
+                        [last_event_id] + [evt['eventId'] for evt in page])
+                else:
+                    if state.last_event_id > last_event_id:
+                        error = 'The cached state is ahead of history.'
+
+            if error:
+                self.logger.debug(
+                    'Cached state cannot be used: {}'.format(error))
+                state = None
+
+        if not state:
+            if known_event_id:
+                # The history only contains the most recent events: the full
+                # history is needed to rebuild the state.
+                pages = self.iter_history(poll)
+            else:
+                pages = itertools.chain(consumed_pages, pages)
+
+            state = event.HistoryState(
+                self.compiled_flow, max_result_size=self.max_result_size,
+                context_keys=self.context_keys)
+            for page in pages:
+                state.add_events(page)
+
+        self.state_cache.set(workflow_id, run_id, state)
+        return state
+
+    def get_snapshot(self, workflow_id, run_id):
+        """Get the snapshot of the state of a workflow run.
+
+        Args:
+            workflow_id (str): the workflow id.
+            run_id (str): the run id.
+        Return:
+            HistoryState: the state of the run (None if there is no snapshot
+                store, or if the run does not have a usable snapshot.)
+        """
+
+        if self.snapshot_store is None:
+            return None
+
+        try:
+            state = self.snapshot_store.get(
+                workflow_id, run_id, compiled_flow=self.compiled_flow)
+
+            # The snapshot may have been saved by a decider that needed less
+            # values from the context.
+            if not state or not state.context.covers(self.context_keys):
+                return None
+
+            state.max_result_size = self.max_result_size
+            state.context.keys = self.context_keys
+            return state
+        except Exception as error:
+            self.logger.warning(
+                'Snapshot cannot be loaded: {}'.format(error))
+
+    def save_snapshot(self, workflow_id, run_id, state, closing=False):
+        """Save the snapshot of the state of a workflow run.
+
+        Failing to save a snapshot does not fail the decision: the next
+        decision will rebuild the state from the history.
+
+        Args:
+            workflow_id (str): the workflow id.
+            run_id (str): the run id.
+            state (HistoryState): the state of the run.
+            closing (boolean): if the execution is closing (its snapshot is
+                then removed.)
+        """
+
+        if self.snapshot_store is None:
+            return
+
+        try:
+            if closing:
+                self.snapshot_store.remove(workflow_id, run_id)
+            else:
+                self.snapshot_store.set(workflow_id, run_id, state)
+        except Exception as error:
+            self.logger.warning('Snapshot cannot be saved: {}'.format(error))
+
     def register(self):
         """Register the Workflow on SWF.
 
         To work, SWF needs to have pre-registered the domain, the workflow,
-        and the different activities, this method takes care of this part.
+        and the different activities, this method takes care of this part
+        (only the types that do not exist yet are registered.)
         """
 
         registerables = []
-        registerables.append(swf.Domain(name=self.domain))
         registerables.append(swf.WorkflowType(
             domain=self.domain,
             name=self.task_list,
@@ -101,39 +507,72 @@ class DeciderWorker(swf.Decider, log.GarconLogger):
                     version=self.version,
                     task_list=current_activity.task_list))
 
-        for swf_entity in registerables:
-            try:
-                swf_entity.register()
-            except (SWFDomainAlreadyExistsError, SWFTypeAlreadyExistsError):
-                print(
-                    swf_entity.__class__.__name__, swf_entity.name,
-                    'already exists')
+        self.registration.register(
+            swf.Domain(name=self.domain), registerables)
 
-    def create_decisions_from_flow(self, decisions, activity_states, context):
+    def create_decisions_from_flow(
+            self, decisions, activity_states, context, ready_set=None,
+            recorder=None, evaluator=None, deadline=None):
         """Create the decisions from the flow.
 
         Simple flows don't need a custom decider, since all the requirements
         can be provided at the activity level. Discovery of the next activity
         to schedule is thus very straightforward.
 
+        If the deadline is reached before all the available activities are
+        scheduled, the decisions built so far are kept and a continuation
+        timer is started: it fires right away, and the next decision schedules
+        the remaining activities. At least one activity is scheduled on each
+        decision, so the execution always progresses.
+
         Args:
             decisions (Layer1Decisions): the layer decision for swf.
             activity_states (dict): all the state activities.
             context (dict): the context of the activities.
+            ready_set (ReadySet): the progress of the activities.
+            recorder (Recorder): the values of the recorded generators (the
+                values evaluated during this decision are recorded as
+                markers.)
+            evaluator (Evaluator): the evaluator of the generators.
+            deadline (float): time (see `time.time`) after which no more
+                activities are scheduled (None for no deadline.)
+        Raises:
+            GeneratorTimeoutException: if a generator takes longer than its
+                timeout.
         """
 
         try:
+            scheduled = 0
             for current in activity.find_available_activities(
-                    self.flow, activity_states, context.current):
+                    self.compiled_flow, activity_states, context.current,
+                    ready_set=ready_set, max_in_flight=self.max_in_flight,
+                    recorder=recorder, evaluator=evaluator):
+
+                if scheduled and deadline and time.time() >= deadline:
+                    decisions.start_timer(
+                        '0', '{}.{}'.format(
+                            CONTINUATION_TIMER_PREFIX, uuid.uuid4().hex))
+                    break
 
                 schedule_activity_task(
                     decisions, current, version=self.version)
+                scheduled += 1
             else:
-                activities = list(
+                uncomplete = next(
                     activity.find_uncomplete_activities(
-                        self.flow, activity_states, context.current))
-                if not activities:
+                        self.compiled_flow, activity_states, context.current,
+                        recorder=recorder, evaluator=evaluator),
+                    None)
+                if not uncomplete:
                     decisions.complete_workflow_execution()
+                    return
+
+            if recorder:
+                for name, details in sorted(recorder.pending.items()):
+                    decisions.record_marker(name, details=details)
+        except generator.GeneratorTimeoutException:
+            # The decision is aborted (see `run`.)
+            raise
         except Exception as e:
             decisions.fail_workflow_execution(reason=str(e))
             if self.on_exception:
@@ -146,7 +585,9 @@ class DeciderWorker(swf.Decider, log.GarconLogger):
         For more complex flows (the ones that have, for instance, optional
         activities), you can write your own decider. The decider receives a
         method `schedule` which schedule the activity if not scheduled yet,
-        and if scheduled, returns its result.
+        and if scheduled, returns its result. Deciders that have a
+        `schedule_many` argument also receive a method to schedule an
+        activity for a list of schedule ids at once (see `schedule_many`.)
 
         Args:
             decisions (Layer1Decisions): the layer decision for swf.
@@ -167,6 +608,11 @@ class DeciderWorker(swf.Decider, log.GarconLogger):
             if 'context' in decider.__code__.co_varnames:
                 kwargs.update(context=context.workflow_input)
 
+            if 'schedule_many' in decider.__code__.co_varnames:
+                kwargs.update(schedule_many=functools.partial(
+                    schedule_many, decisions, schedule_context, history,
+                    context.current, version=self.version))
+
             decider(**kwargs)
 
             # When no exceptions are raised and the method decider has returned
@@ -204,8 +650,15 @@ class DeciderWorker(swf.Decider, log.GarconLogger):
                 running process.
         """
 
+        poll_options = dict(identity=identity)
+        if self.reverse_history:
+            poll_options.update(
+                reverse_order=True,
+                maximum_page_size=MAX_HISTORY_PAGE_SIZE)
+
         try:
-            poll = self.poll(identity=identity)
+            poll = self.poll(**poll_options)
+            started = time.time()
         except Exception as error:
             # Catch exceptions raised during poll() to avoid a Decider thread
             # dying & the daemon unable to process subsequent workflows.
@@ -224,22 +677,167 @@ class DeciderWorker(swf.Decider, log.GarconLogger):
         if 'events' not in poll:
             return True
 
-        history = self.get_history(poll)
-        activity_states = self.get_activity_states(history)
-        current_context = event.get_current_context(history)
+        pages = None
+        new_events = get_new_events(poll)
+        if (new_events is None and not self.reverse_history and
+                poll.get('previousStartedEventId') and
+                'nextPageToken' in poll):
+            # The new events are in the last pages of the history: the pages
+            # are kept until the new events are found.
+            pages = list(self.iter_history(poll))
+            new_events = get_new_events(poll, pages=pages)
+
+        fast_path = is_passive(new_events)
+        self.report('decision.fast_path', int(fast_path), execution_tags(poll))
+        if fast_path:
+            self.complete(decisions=swf.Layer1Decisions())
+            return True
+
+        known_event_id = 0
+        if self.reverse_history:
+            known_event_id = self.get_known_event_id(poll)
+
+        if pages is None:
+            pages = self.iter_history(poll, known_event_id=known_event_id)
+        history_state = self.get_history_state(
+            poll, pages, known_event_id=known_event_id)
+        activity_states = history_state.activity_states
+        current_context = history_state.context
         current_context.set_workflow_execution_info(poll, self.domain)
 
+        deadline = None
+        if self.decision_budget:
+            deadline = started + self.decision_budget
+
+        tags = execution_tags(poll)
         decisions = swf.Layer1Decisions()
         if not custom_decider:
-            self.create_decisions_from_flow(
-                decisions, activity_states, current_context)
+            evaluator = self.create_evaluator(poll)
+            try:
+                self.create_decisions_from_flow(
+                    decisions, activity_states, current_context,
+                    ready_set=history_state.ready_set,
+                    recorder=generator.Recorder(history_state.markers),
+                    evaluator=evaluator, deadline=deadline)
+            except generator.GeneratorTimeoutException as error:
+                # A slow generator does not fail the execution: the decision
+                # task is not completed, it times out and SWF provides it
+                # again.
+                evaluator.cancel()
+                self.report('generator.timeout', 1, tags)
+                self.logger.warning(
+                    'Decision aborted: {}'.format(error))
+                return True
         else:
             self.delegate_decisions(
                 decisions, custom_decider, activity_states, current_context)
+
+        elapsed = time.time() - started
+        self.report('decision.time', elapsed, tags)
+        if deadline and elapsed > self.decision_budget:
+            self.report(
+                'decision.budget_exceeded',
+                elapsed - self.decision_budget, tags)
+        if is_continued(decisions):
+            self.report('decision.continued', 1, tags)
+
+        execution = poll.get('workflowExecution', {})
+        workflow_id = execution.get('workflowId')
+        run_id = execution.get('runId')
+        closing = is_closing(decisions)
+        if closing:
+            self.state_cache.remove(workflow_id, run_id)
+
         self.complete(decisions=decisions)
+        self.save_snapshot(
+            workflow_id, run_id, history_state, closing=closing)
         return True
 
 
+class DeciderPool:
+
+    def __init__(
+            self, flow, size=DEFAULT_POOL_SIZE, register=True,
+            state_cache=None, reverse_history=False, snapshot_store=None,
+            registration_manifest=None, transport=None):
+        """Initialize a pool of deciders.
+
+        All the deciders of the pool poll the task list of the flow, and each
+        of them processes one decision task at a time. They share the compiled
+        flow and the state cache (decision tasks of a same execution are never
+        processed at the same time by SWF.)
+
+        Args:
+            flow (module): Flow module.
+            size (int): the number of deciders.
+            register (boolean): If this flow needs to be register on AWS.
+            state_cache (StateCache): cache of the execution states (a new
+                cache is created if not provided.)
+            reverse_history (boolean): if the history should be retrieved from
+                the newest to the oldest event.
+            snapshot_store (SnapshotStore): store of the execution states on
+                disk.
+            registration_manifest (str): path of the manifest of the
+                registered flows.
+            transport (Transport): the transport shared by the deciders (each
+                decider has its own boto2 transport if not provided.)
+        """
+
+        self.flow = flow
+        self.compiled_flow = activity.compile_flow(flow)
+        self.state_cache = state_cache
+        if self.state_cache is None:
+            self.state_cache = cache.StateCache()
+        self.workers = [
+            DeciderWorker(
+                flow, register=register and not index,
+                state_cache=self.state_cache,
+                reverse_history=reverse_history,
+                compiled_flow=self.compiled_flow,
+                snapshot_store=snapshot_store,
+                registration_manifest=registration_manifest,
+                transport=transport)
+            for index in range(size)]
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def run(self, identity=None):
+        """Run the deciders, each in its own thread.
+
+        Args:
+            identity (str): Identity of the pool. Each decider is identified
+                by the identity of the pool and its position in the pool.
+        Return:
+            list: the threads of the deciders.
+        """
+
+        self.stopped.clear()
+        self.threads = []
+        for index, worker in enumerate(self.workers):
+            worker_identity = identity
+            if identity:
+                worker_identity = '{}-{}'.format(identity, index)
+
+            thread = threading.Thread(
+                target=decider_runner,
+                args=(worker, self.stopped, worker_identity))
+            thread.start()
+            self.threads.append(thread)
+
+        return self.threads
+
+    def stop(self):
+        """Stop the deciders.
+
+        The deciders stop once their current poll (which can last up to a
+        minute) and decision task are done.
+        """
+
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+
 class ScheduleContext:
     """
     Schedule Context
@@ -266,6 +864,124 @@ class ScheduleContext:
         self.completed = False
 
 
+def decider_runner(worker, stopped, identity=None):
+    """Run the decider until it is stopped.
+
+    If a decision raises an error, the decider waits (longer after each
+    consecutive error) before it polls again.
+
+    Args:
+        worker (DeciderWorker): the decider.
+        stopped (threading.Event): event set when the decider should stop.
+        identity (str): Identity of the decider.
+    """
+
+    failures = 0
+    while not stopped.is_set():
+        try:
+            if not worker.run(identity=identity):
+                break
+            failures = 0
+        except Exception as error:
+            # An error (such as a page of the history that cannot be
+            # retrieved) does not stop the decider: the decision task times
+            # out, and is provided again by SWF.
+            failures += 1
+            if worker.on_exception:
+                worker.on_exception(worker, error)
+            worker.logger.error(error, exc_info=True)
+            stopped.wait(min(
+                MAX_RUNNER_BACKOFF, RUNNER_BACKOFF * 2 ** (failures - 1)))
+
+
+def execution_tags(poll):
+    """Get the tags of an execution.
+
+    Args:
+        poll (object): The poll object (see AWS SWF for details.)
+    Return:
+        dict: the workflow id and the run id of the execution.
+    """
+
+    execution = poll.get('workflowExecution', {})
+    return dict(
+        workflow_id=execution.get('workflowId'),
+        run_id=execution.get('runId'))
+
+
+def get_new_events(poll, pages=None):
+    """Get the events added since the previous decision task.
+
+    Args:
+        poll (object): The poll object (see AWS SWF for details.)
+        pages (list): the pages of the history (only the first page, provided
+            by the poll, is used if not provided.)
+    Return:
+        list: the new events (None if this is the first decision task, or if
+            some of the new events are not in the pages.)
+    """
+
+    previous_event_id = poll.get('previousStartedEventId') or 0
+    started_event_id = poll.get('startedEventId') or 0
+    if not previous_event_id:
+        return None
+
+    if pages is None:
+        pages = [poll.get('events', [])]
+
+    new_events = [
+        evt for events in pages for evt in events
+        if evt.get('eventId') > previous_event_id]
+    if len(new_events) != started_event_id - previous_event_id:
+        return None
+    return new_events
+
+
+def is_passive(events):
+    """Check if events cannot change the decisions.
+
+    Args:
+        events (list): the events (see `get_new_events`.)
+    Return:
+        boolean: if all the events are passive (False if the events are
+            unknown.)
+    """
+
+    if events is None:
+        return False
+    return all(evt.get('eventType') in PASSIVE_EVENTS for evt in events)
+
+
+def is_closing(decisions):
+    """Check if the decisions close the workflow execution.
+
+    Args:
+        decisions (Layer1Decisions): the layer decision for swf.
+    Return:
+        boolean: if the execution is completed or failed by the decisions.
+    """
+
+    return any(
+        decision.get('decisionType') in CLOSING_DECISIONS
+        for decision in decisions._data)
+
+
+def is_continued(decisions):
+    """Check if the decisions continue in a follow-up decision.
+
+    Args:
+        decisions (Layer1Decisions): the layer decision for swf.
+    Return:
+        boolean: if a continuation timer is started by the decisions.
+    """
+
+    return any(
+        decision.get('decisionType') == 'StartTimer' and
+        decision['startTimerDecisionAttributes']['timerId'].startswith(
+            CONTINUATION_TIMER_PREFIX)
+        for decision in decisions._data)
+
+
 def schedule_activity_task(
         decisions, instance, version='1.0', id=None):
     """Schedule an activity task.
@@ -277,16 +993,17 @@ def schedule_activity_task(
         id (str): optional id of the activity instance.
     """
 
+    plan = instance.plan
     decisions.schedule_activity_task(
         id or instance.id,
         instance.activity_name,
         version,
         task_list=instance.activity_worker.task_list,
-        input=json.dumps(instance.create_execution_input()),
-        heartbeat_timeout=str(instance.heartbeat_timeout),
-        start_to_close_timeout=str(instance.timeout),
-        schedule_to_start_timeout=str(instance.schedule_to_start),
-        schedule_to_close_timeout=str(instance.schedule_to_close))
+        input=plan.input,
+        heartbeat_timeout=str(plan.heartbeat_timeout),
+        start_to_close_timeout=str(plan.timeout),
+        schedule_to_start_timeout=str(plan.schedule_to_start),
+        schedule_to_close_timeout=str(plan.schedule_to_close))
 
 
 def schedule(
@@ -313,49 +1030,120 @@ def schedule(
             requirements is not ready.
 
     Return:
-        State: the state of the schedule (contains the response).
+        State: the state of the schedule (contains the response). The results
+            that have not been kept (see `max_result_size`) are not in its
+            result, and its `result_discarded` is then set. The values
+            offloaded to the blob store are resolved (see `garcon.blob`.)
     """
 
-    ensure_requirements(requires)
-    activity_completed = set()
-    result = dict()
+    return schedule_many(
+        decisions, schedule_context, history, context,
+        [(schedule_id, input)], current_activity, requires=requires,
+        version=version)[0]
 
-    instance_context = dict()
-    instance_context.update(context or {})
-    instance_context.update(input or {})
 
-    for current in current_activity.instances(instance_context):
-        current_id = '{}-{}'.format(current.id, schedule_id)
-        states = history.get(current.activity_name, {}).get(current_id)
+def schedule_many(
+        decisions, schedule_context, history, context, ids_and_inputs,
+        current_activity, requires=None, version='1.0'):
+    """Schedule an activity several times.
 
-        if states:
-            if states.get_last_state() == activity.ACTIVITY_COMPLETED:
-                result.update(states.result or dict())
-                activity_completed.add(True)
-                continue
+    This is the same as calling `schedule` for each schedule id, but the work
+    is done once for all of them: the requirements are checked once, the
+    history of the activity is only looked up once, the instances of the
+    schedules that have the same input are only created once, and the values
+    of the context are only encoded once in the inputs of the instances.
+
+    Args:
+        decisions (Layer1Decisions): the layer decision for swf.
+        schedule_context (dict): information about the schedule.
+        history (dict): history of the execution.
+        context (dict): context of the execution.
+        ids_and_inputs (list): the id of each schedule, and its additional
+            input for the context (or None.)
+        current_activity (Activity): the activity to run.
+        requires (list): list of all requirements.
+
+    Throws:
+        ActivityInstanceNotReadyException: if one of the activity in the
+            requirements is not ready.
+
+    Return:
+        list: the state of each schedule (contains the response.)
+    """
+
+    ensure_requirements(requires)
+    activity_history = history.get(current_activity.name, {})
+    encoder = activity.InputEncoder(context or {})
+
+    # The instances of the schedules that have the same input (the same
+    # values, not the same dict) are shared.
+    instances = dict()
+    states = []
+
+    for schedule_id, input in ids_and_inputs:
+        key = utils.create_dictionary_key(input) if input else None
+        if key not in instances:
+            instance_context = dict()
+            instance_context.update(context or {})
+            instance_context.update(input or {})
+            instances[key] = list(
+                current_activity.instances(instance_context))
+
+        activity_completed = set()
+        result = dict()
+        result_discarded = False
+
+        for current in instances[key]:
+            current_id = '{}-{}'.format(current.id, schedule_id)
+            instance_states = activity_history.get(current_id)
+
+            if instance_states:
+                last_state = instance_states.get_last_state()
+                if last_state == activity.ACTIVITY_COMPLETED:
+                    # The results that have not been kept (see
+                    # `max_result_size`) are skipped.
+                    if instance_states.result_discarded:
+                        result_discarded = True
+                    else:
+                        result.update(instance_states.result or dict())
+                    activity_completed.add(True)
+                    continue
+
+                activity_completed.add(False)
+                schedule_context.mark_uncompleted()
+
+                if last_state != activity.ACTIVITY_FAILED:
+                    continue
+                elif (not current.retry or
+                        current.retry < activity.count_activity_failures(
+                            instance_states)):
+                    raise Exception(
+                        'The activity failures has exceeded its retry limit.')
 
             activity_completed.add(False)
             schedule_context.mark_uncompleted()
-
-            if states.get_last_state() != activity.ACTIVITY_FAILED:
-                continue
-            elif (not current.retry or
-                    current.retry < activity.count_activity_failures(states)):
-                raise Exception(
-                    'The activity failures has exceeded its retry limit.')
-
-        activity_completed.add(False)
-        schedule_context.mark_uncompleted()
-        schedule_activity_task(
-            decisions, current, id=current_id, version=version)
-
-    state = activity.ActivityState(current_activity.name)
-    state.add_state(activity.ACTIVITY_SCHEDULED)
-
-    if len(activity_completed) == 1 and True in activity_completed:
-        state.add_state(activity.ACTIVITY_COMPLETED)
-        state.set_result(result)
-    return state
+            if not current.scheduling_plan:
+                current.scheduling_plan = activity.SchedulingPlan(
+                    current, encoder=encoder)
+            schedule_activity_task(
+                decisions, current, id=current_id, version=version)
+
+        state = activity.ActivityState(current_activity.name)
+        state.add_state(activity.ACTIVITY_SCHEDULED)
+
+        if len(activity_completed) == 1 and True in activity_completed:
+            # The large values of the result are references to the blob
+            # store (see `garcon.blob`): the deciders receive the values.
+            claim_check = getattr(current_activity, 'claim_check', None)
+            if claim_check:
+                result = claim_check.resolve(result)
+
+            state.add_state(activity.ACTIVITY_COMPLETED)
+            state.set_result(result)
+            state.result_discarded = result_discarded
+        states.append(state)
+
+    return states
 
 
 def ensure_requirements(requires):
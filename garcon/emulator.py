@@ -0,0 +1,595 @@
+# -*- coding: utf-8 -*-
+"""
+Emulator
+========
+
+The emulator is an in-process replacement of the SWF service: it keeps the
+task lists and the event history of the executions in memory, and implements
+the calls of the SWF connection (`boto.swf.layer1.Layer1`) used by the
+deciders and the activity workers. Flows can run end to end without AWS, to
+test them or to measure their throughput and their latency.
+
+The actors (the deciders and the activities) are connected to the emulator
+instead of SWF, through the in-memory transport (see `garcon.transport`.) They
+do not need AWS credentials: their connection of boto is only created when it
+is first needed. The registration of the flows is not sent to the emulator:
+the deciders have to be created with `register=False`.
+
+    from garcon import activity
+    from garcon import decider
+    from garcon import emulator
+
+    swf = emulator.Emulator(latency=0.01)
+
+    decider_worker = decider.DeciderWorker(flow, register=False)
+    activity_worker = activity.ActivityWorker(flow)
+    swf.connect(decider_worker, *activity_worker.activities)
+
+    run_id = swf.start_workflow_execution(
+        flow.domain, 'workflow_id', flow.name, '1.0')['runId']
+
+The latency of each call can be injected: a number of seconds, or a function
+that receives the name of the call (such as `poll_for_decision_task`) and
+returns a number of seconds.
+
+The timeouts of the tasks and of the executions are not emulated.
+"""
+
+from boto.swf.exceptions import SWFDomainAlreadyExistsError
+from boto.swf.exceptions import SWFTypeAlreadyExistsError
+from boto.swf.exceptions import SWFWorkflowExecutionAlreadyStartedError
+import boto.exception as boto_exception
+import collections
+import threading
+import time
+import uuid
+
+from garcon import transport
+
+
+DEFAULT_POLL_TIMEOUT = 60  # Seconds a poll waits for a task (as on SWF.)
+MAX_PAGE_SIZE = 1000
+CLOSED_EVENTS = (
+    'WorkflowExecutionCompleted',
+    'WorkflowExecutionFailed')
+
+
+class UnsupportedDecisionException(Exception):
+    """Exception when a decision is not supported by the emulator.
+    """
+
+    pass
+
+
+class Execution(object):
+
+    def __init__(self, domain, workflow_id, workflow_type, task_list):
+        """Create a workflow execution.
+
+        Args:
+            domain (str): the domain.
+            workflow_id (str): the workflow id.
+            workflow_type (dict): the name and the version of the workflow.
+            task_list (str): the task list of the decision tasks.
+        """
+
+        self.domain = domain
+        self.workflow_id = workflow_id
+        self.run_id = uuid.uuid4().hex
+        self.workflow_type = workflow_type
+        self.task_list = task_list
+        self.events = []
+        self.closed = False
+        self.close_status = None
+
+        # The state of the decision task: None, 'scheduled' or 'started'. If
+        # events are added while a decision task is started, another one is
+        # scheduled once it is completed.
+        self.decision = None
+        self.decision_pending = False
+        self.decision_scheduled_event_id = 0
+        self.decision_started_event_id = 0
+        self.previous_started_event_id = 0
+        self.open_activities = set()
+
+    @property
+    def info(self):
+        return dict(workflowId=self.workflow_id, runId=self.run_id)
+
+    def add_event(self, event_type, **attributes):
+        """Add an event into the history.
+
+        Args:
+            event_type (str): the type of the event.
+            attributes (dict): the attributes of the event.
+        Return:
+            int: the id of the event.
+        """
+
+        event_id = len(self.events) + 1
+        attributes_key = '{}{}EventAttributes'.format(
+            event_type[0].lower(), event_type[1:])
+        self.events.append({
+            'eventId': event_id,
+            'eventTimestamp': time.time(),
+            'eventType': event_type,
+            attributes_key: attributes})
+
+        if event_type in CLOSED_EVENTS:
+            self.closed = True
+            self.close_status = event_type
+        return event_id
+
+
+class Emulator(object):
+
+    def __init__(self, latency=None, poll_timeout=DEFAULT_POLL_TIMEOUT):
+        """Create an emulator.
+
+        Args:
+            latency (float|callable): the latency of each call, in seconds (or
+                a function that returns the latency of a call from its name.)
+            poll_timeout (float): number of seconds a poll waits for a task.
+        """
+
+        self.latency = latency
+        self.poll_timeout = poll_timeout
+        self.condition = threading.Condition()
+        self.closed = False
+        self.domains = set()
+        self.types = dict()
+        self.executions = dict()
+        self.decision_tasks = collections.defaultdict(collections.deque)
+        self.activity_tasks = collections.defaultdict(collections.deque)
+        self.decision_tokens = dict()
+        self.activity_tokens = dict()
+
+    def connect(self, *actors):
+        """Connect actors (deciders and activities) to the emulator.
+
+        Args:
+            actors (list): the actors.
+        """
+
+        in_memory_transport = transport.InMemoryTransport(self)
+        for actor in actors:
+            # The other calls of the actor that use its connection of boto
+            # are also sent to the emulator. The registration does not: it
+            # creates its own connections (the deciders are created with
+            # `register=False`.)
+            actor._swf = self
+            actor.transport = in_memory_transport
+
+    def close(self):
+        """Close the emulator: the polls return without a task.
+        """
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def delay(self, call):
+        """Wait for the latency of a call.
+
+        Args:
+            call (str): the name of the call.
+        """
+
+        latency = self.latency
+        if callable(latency):
+            latency = latency(call)
+        if latency:
+            time.sleep(latency)
+
+    def get_execution(self, run_id):
+        """Get a workflow execution.
+
+        Args:
+            run_id (str): the run id.
+        Return:
+            Execution: the execution.
+        """
+
+        return self.executions[run_id]
+
+    def wait(self, run_id, timeout=None):
+        """Wait for a workflow execution to close.
+
+        Args:
+            run_id (str): the run id.
+            timeout (float): number of seconds to wait (None to wait until the
+                execution closes.)
+        Return:
+            str: the type of the closing event (None if the execution is still
+                open.)
+        """
+
+        execution = self.executions[run_id]
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while not execution.closed:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                self.condition.wait(remaining)
+            return execution.close_status
+
+    def register_domain(
+            self, name, workflow_execution_retention_period_in_days,
+            description=None):
+        self.delay('register_domain')
+        with self.condition:
+            if name in self.domains:
+                raise SWFDomainAlreadyExistsError(400, 'Bad Request')
+            self.domains.add(name)
+
+    def register_workflow_type(
+            self, domain, name, version, task_list=None, **kwargs):
+        self.register_type('workflow', domain, name, version)
+
+    def register_activity_type(
+            self, domain, name, version, task_list=None, **kwargs):
+        self.register_type('activity', domain, name, version)
+
+    def register_type(self, kind, domain, name, version):
+        self.delay('register_{}_type'.format(kind))
+        key = (kind, domain, name, version)
+        with self.condition:
+            if key in self.types:
+                raise SWFTypeAlreadyExistsError(400, 'Bad Request')
+            self.types[key] = {
+                '{}Type'.format(kind): dict(name=name, version=version),
+                'status': 'REGISTERED'}
+
+    def list_workflow_types(self, domain, registration_status, **kwargs):
+        return self.list_types('workflow', domain)
+
+    def list_activity_types(self, domain, registration_status, **kwargs):
+        return self.list_types('activity', domain)
+
+    def list_types(self, kind, domain):
+        self.delay('list_{}_types'.format(kind))
+        with self.condition:
+            return dict(typeInfos=[
+                dict(info) for key, info in sorted(self.types.items())
+                if key[:2] == (kind, domain)])
+
+    def start_workflow_execution(
+            self, domain, workflow_id, workflow_name, workflow_version,
+            task_list=None, child_policy=None,
+            execution_start_to_close_timeout=None, input=None, tag_list=None,
+            task_start_to_close_timeout=None):
+        self.delay('start_workflow_execution')
+        task_list = task_list or workflow_name
+        workflow_type = dict(name=workflow_name, version=workflow_version)
+
+        with self.condition:
+            for execution in self.executions.values():
+                if (execution.domain == domain and
+                        execution.workflow_id == workflow_id and
+                        not execution.closed):
+                    raise SWFWorkflowExecutionAlreadyStartedError(
+                        400, 'Bad Request')
+
+            execution = Execution(
+                domain, workflow_id, workflow_type, task_list)
+            self.executions[execution.run_id] = execution
+
+            attributes = dict(
+                workflowType=workflow_type,
+                taskList=dict(name=task_list),
+                childPolicy=child_policy or 'TERMINATE')
+            if input is not None:
+                attributes.update(input=input)
+            execution.add_event('WorkflowExecutionStarted', **attributes)
+            self.schedule_decision(execution)
+            return dict(runId=execution.run_id)
+
+    def schedule_decision(self, execution):
+        """Schedule a decision task (the condition needs to be acquired.)
+
+        Args:
+            execution (Execution): the execution.
+        """
+
+        if execution.closed:
+            return
+
+        if execution.decision == 'started':
+            execution.decision_pending = True
+        elif execution.decision is None:
+            execution.decision = 'scheduled'
+            execution.decision_scheduled_event_id = execution.add_event(
+                'DecisionTaskScheduled',
+                taskList=dict(name=execution.task_list))
+            self.decision_tasks[
+                (execution.domain, execution.task_list)].append(execution)
+
+        self.condition.notify_all()
+
+    def wait_for_task(self, tasks):
+        """Wait for a task (the condition needs to be acquired.)
+
+        Args:
+            tasks (deque): the tasks of the task list.
+        Return:
+            *: the task (None if the poll has timed out.)
+        """
+
+        deadline = time.time() + self.poll_timeout
+        while not tasks and not self.closed:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self.condition.wait(remaining)
+
+        if tasks and not self.closed:
+            return tasks.popleft()
+
+    def poll_for_decision_task(
+            self, domain, task_list, identity=None, maximum_page_size=None,
+            next_page_token=None, reverse_order=None):
+        self.delay('poll_for_decision_task')
+
+        with self.condition:
+            if next_page_token:
+                task_token, offset = next_page_token.rsplit(':', 1)
+                task = self.decision_tokens[task_token]
+                return self.get_decision_page(
+                    task, int(offset), maximum_page_size, reverse_order)
+
+            execution = self.wait_for_task(
+                self.decision_tasks[(domain, task_list)])
+            if not execution:
+                return dict(startedEventId=0, previousStartedEventId=0)
+
+            execution.decision = 'started'
+            execution.decision_started_event_id = execution.add_event(
+                'DecisionTaskStarted',
+                scheduledEventId=execution.decision_scheduled_event_id,
+                identity=identity)
+
+            task = dict(
+                taskToken=uuid.uuid4().hex,
+                execution=execution,
+                startedEventId=execution.decision_started_event_id,
+                previousStartedEventId=execution.previous_started_event_id,
+                events=list(execution.events))
+            self.decision_tokens[task['taskToken']] = task
+            return self.get_decision_page(
+                task, 0, maximum_page_size, reverse_order)
+
+    def get_decision_page(
+            self, task, offset, maximum_page_size, reverse_order):
+        """Get a page of the history of a decision task.
+
+        Args:
+            task (dict): the decision task.
+            offset (int): the position of the first event of the page.
+            maximum_page_size (int): the number of events of the page.
+            reverse_order (boolean): if the events are from the newest to the
+                oldest.
+        Return:
+            dict: the decision task, with a page of its history.
+        """
+
+        events = task['events']
+        if reverse_order:
+            events = list(reversed(events))
+
+        page_size = min(maximum_page_size or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+        execution = task['execution']
+        page = dict(
+            taskToken=task['taskToken'],
+            startedEventId=task['startedEventId'],
+            previousStartedEventId=task['previousStartedEventId'],
+            workflowExecution=execution.info,
+            workflowType=execution.workflow_type,
+            events=events[offset:offset + page_size])
+
+        if offset + page_size < len(events):
+            page.update(nextPageToken='{}:{}'.format(
+                task['taskToken'], offset + page_size))
+        return page
+
+    def respond_decision_task_completed(
+            self, task_token, decisions=None, execution_context=None):
+        self.delay('respond_decision_task_completed')
+
+        with self.condition:
+            task = self.decision_tokens.pop(task_token, None)
+            if not task:
+                raise unknown_resource()
+
+            execution = task['execution']
+            completed_event_id = execution.add_event(
+                'DecisionTaskCompleted',
+                scheduledEventId=execution.decision_scheduled_event_id,
+                startedEventId=execution.decision_started_event_id)
+            execution.previous_started_event_id = (
+                execution.decision_started_event_id)
+
+            for decision in decisions or []:
+                self.apply_decision(execution, decision, completed_event_id)
+
+            execution.decision = None
+            if execution.decision_pending:
+                execution.decision_pending = False
+                self.schedule_decision(execution)
+            self.condition.notify_all()
+
+    def apply_decision(self, execution, decision, completed_event_id):
+        """Apply a decision (the condition needs to be acquired.)
+
+        Args:
+            execution (Execution): the execution.
+            decision (dict): the decision.
+            completed_event_id (int): the id of the decision task completed
+                event.
+        Raises:
+            UnsupportedDecisionException: if the decision is not supported.
+        """
+
+        decision_type = decision.get('decisionType')
+        attributes_key = '{}{}DecisionAttributes'.format(
+            decision_type[0].lower(), decision_type[1:])
+        attributes = dict(decision.get(attributes_key) or {})
+        attributes.update(decisionTaskCompletedEventId=completed_event_id)
+
+        if execution.closed:
+            return
+
+        if decision_type == 'ScheduleActivityTask':
+            activity_id = attributes['activityId']
+            if activity_id in execution.open_activities:
+                execution.add_event(
+                    'ScheduleActivityTaskFailed', activityId=activity_id,
+                    activityType=attributes['activityType'],
+                    cause='ACTIVITY_ID_ALREADY_IN_USE',
+                    decisionTaskCompletedEventId=completed_event_id)
+                self.schedule_decision(execution)
+                return
+
+            execution.open_activities.add(activity_id)
+            scheduled_event_id = execution.add_event(
+                'ActivityTaskScheduled', **attributes)
+            task_list = attributes['taskList']['name']
+            self.activity_tasks[(execution.domain, task_list)].append(
+                (execution, scheduled_event_id))
+        elif decision_type == 'RecordMarker':
+            execution.add_event('MarkerRecorded', **attributes)
+        elif decision_type == 'StartTimer':
+            started_event_id = execution.add_event(
+                'TimerStarted', **attributes)
+            timer = threading.Timer(
+                float(attributes['startToFireTimeout']), self.fire_timer,
+                args=(execution, attributes['timerId'], started_event_id))
+            timer.daemon = True
+            timer.start()
+        elif decision_type == 'CompleteWorkflowExecution':
+            execution.add_event('WorkflowExecutionCompleted', **attributes)
+        elif decision_type == 'FailWorkflowExecution':
+            execution.add_event('WorkflowExecutionFailed', **attributes)
+        else:
+            raise UnsupportedDecisionException(decision_type)
+
+    def fire_timer(self, execution, timer_id, started_event_id):
+        """Fire a timer.
+
+        Args:
+            execution (Execution): the execution.
+            timer_id (str): the id of the timer.
+            started_event_id (int): the id of the timer started event.
+        """
+
+        with self.condition:
+            if execution.closed:
+                return
+            execution.add_event(
+                'TimerFired', timerId=timer_id,
+                startedEventId=started_event_id)
+            self.schedule_decision(execution)
+
+    def poll_for_activity_task(self, domain, task_list, identity=None):
+        self.delay('poll_for_activity_task')
+
+        with self.condition:
+            tasks = self.activity_tasks[(domain, task_list)]
+            while True:
+                task = self.wait_for_task(tasks)
+                if not task:
+                    return dict(startedEventId=0)
+
+                # The tasks of the closed executions are not provided.
+                execution, scheduled_event_id = task
+                if not execution.closed:
+                    break
+
+            scheduled = execution.events[scheduled_event_id - 1][
+                'activityTaskScheduledEventAttributes']
+            started_event_id = execution.add_event(
+                'ActivityTaskStarted', scheduledEventId=scheduled_event_id,
+                identity=identity)
+
+            task_token = uuid.uuid4().hex
+            self.activity_tokens[task_token] = (
+                execution, scheduled_event_id, started_event_id,
+                scheduled['activityId'])
+
+            activity_task = dict(
+                taskToken=task_token,
+                activityId=scheduled['activityId'],
+                activityType=scheduled['activityType'],
+                startedEventId=started_event_id,
+                workflowExecution=execution.info)
+            if scheduled.get('input') is not None:
+                activity_task.update(input=scheduled['input'])
+            return activity_task
+
+    def respond_activity_task_completed(self, task_token, result=None):
+        attributes = dict()
+        if result is not None:
+            attributes.update(result=result)
+        self.close_activity_task(
+            'respond_activity_task_completed', task_token,
+            'ActivityTaskCompleted', attributes)
+
+    def respond_activity_task_failed(
+            self, task_token, details=None, reason=None):
+        self.close_activity_task(
+            'respond_activity_task_failed', task_token, 'ActivityTaskFailed',
+            dict(details=details, reason=reason))
+
+    def respond_activity_task_canceled(self, task_token, details=None):
+        self.close_activity_task(
+            'respond_activity_task_canceled', task_token,
+            'ActivityTaskCanceled', dict(details=details))
+
+    def close_activity_task(self, call, task_token, event_type, attributes):
+        """Close an activity task.
+
+        Args:
+            call (str): the name of the call.
+            task_token (str): the token of the task.
+            event_type (str): the type of the closing event.
+            attributes (dict): the attributes of the event.
+        """
+
+        self.delay(call)
+
+        with self.condition:
+            task = self.activity_tokens.pop(task_token, None)
+            if not task or task[0].closed:
+                raise unknown_resource()
+
+            execution, scheduled_event_id, started_event_id, activity_id = (
+                task)
+            execution.open_activities.discard(activity_id)
+            execution.add_event(
+                event_type, scheduledEventId=scheduled_event_id,
+                startedEventId=started_event_id, **attributes)
+            self.schedule_decision(execution)
+
+    def record_activity_task_heartbeat(self, task_token, details=None):
+        self.delay('record_activity_task_heartbeat')
+
+        with self.condition:
+            task = self.activity_tokens.get(task_token)
+            if not task or task[0].closed:
+                raise unknown_resource()
+            return dict(cancelRequested=False)
+
+
+def unknown_resource():
+    """Create the error SWF returns for unknown (or closed) tasks.
+
+    Return:
+        SWFResponseError: the error.
+    """
+
+    return boto_exception.SWFResponseError(
+        400, 'Bad Request', body={
+            '__type': 'com.amazonaws.swf.base.model#UnknownResourceFault',
+            'message': 'Unknown task token'})
@@ -1,7 +1,264 @@
 # -*- coding: utf-8 -*-
 from garcon import activity
+from garcon import codec
 from garcon import context
-import json
+from garcon import generator
+from garcon import scheduler
+
+
+ACTIVITY_EVENTS = {
+    'ActivityTaskScheduled': 'activityTaskScheduledEventAttributes',
+    'ActivityTaskFailed': 'activityTaskFailedEventAttributes',
+    'ActivityTaskCompleted': 'activityTaskCompletedEventAttributes'}
+
+
+class HistoryState:
+    """
+    History State
+    =============
+
+    The history state is everything the decider knows about an execution: the
+    states of its activities, its execution context and the values of its
+    recorded generators. It is built by
+    consuming the events of the execution history, and it keeps track of the
+    last event it has consumed – allowing the state to be updated with only
+    the new events of the history.
+    """
+
+    def __init__(
+            self, compiled_flow=None, max_result_size=None, context_keys=None):
+        """Create an empty history state.
+
+        Args:
+            compiled_flow (CompiledFlow): the compiled flow of the execution.
+                If provided, the progress of the activities is tracked in a
+                ready set.
+            max_result_size (int): the maximum size of the activity results
+                kept in the activity states (None to keep all the results.)
+            context_keys (set): the keys of the values kept in the execution
+                context (None to keep all the values.)
+        """
+
+        self.activity_states = dict()
+        self.event_id_info = dict()
+        self.context = context.ExecutionContext(keys=context_keys)
+        self.markers = dict()
+        self.last_event_id = 0
+        self.max_result_size = max_result_size
+        self.ready_set = None
+
+        if compiled_flow:
+            self.ready_set = scheduler.ReadySet(compiled_flow)
+
+    def add_events(self, events):
+        """Add events into the history state.
+
+        Events that have already been consumed (the ones with an id lower or
+        equal to the last event id) are ignored.
+
+        Args:
+            events (list): list of events.
+        """
+
+        events = sorted(
+            [event for event in events
+                if event.get('eventId') > self.last_event_id],
+            key=lambda item: item.get('eventId'))
+
+        for event in events:
+            self.add(event)
+
+    def add(self, event):
+        """Add an event into the history state.
+
+        Args:
+            event (dict): the event to add.
+        """
+
+        event_type = event.get('eventType')
+        previous_state = None
+        if self.ready_set and event_type in ACTIVITY_EVENTS:
+            previous_state = get_activity_state(
+                self.activity_states, self.event_id_info, event)
+            was_completed = bool(previous_state) and previous_state.completed
+            was_in_flight = bool(previous_state) and (
+                previous_state.get_last_state() ==
+                activity.ACTIVITY_SCHEDULED)
+
+        add_activity_event(
+            self.activity_states, self.event_id_info, event,
+            max_result_size=self.max_result_size)
+
+        if self.ready_set and event_type in ACTIVITY_EVENTS:
+            activity_name = get_activity_name(self.event_id_info, event)
+            if not previous_state:
+                self.ready_set.add_instance(activity_name)
+            if (event_type == 'ActivityTaskCompleted' and
+                    not was_completed):
+                self.ready_set.complete_instance(activity_name)
+
+            if event_type == 'ActivityTaskScheduled':
+                self.ready_set.update_in_flight(activity_name, 1)
+            elif was_in_flight:
+                self.ready_set.update_in_flight(activity_name, -1)
+
+        if event_type == 'ActivityTaskCompleted':
+            self.add_activity_result(event)
+        elif event_type == 'WorkflowExecutionStarted':
+            self.context.set_execution_input(event)
+        elif event_type == 'MarkerRecorded':
+            add_marker_event(self.markers, event)
+
+        self.last_event_id = event.get('eventId')
+
+    def add_activity_result(self, event):
+        """Add the result of a completed activity into the context.
+
+        The result is only decoded once: the decoded result is shared by the
+        context and the state of the activity.
+
+        Args:
+            event (dict): the ActivityTaskCompleted event.
+        """
+
+        # If no values are kept, the result does not need to be decoded.
+        result = event['activityTaskCompletedEventAttributes'].get('result')
+        if not result or (
+                self.context.keys is not None and not self.context.keys):
+            return
+
+        state = get_activity_state(
+            self.activity_states, self.event_id_info, event)
+        if state is not None and state.raw_result is not None:
+            result = state.result
+        else:
+            result = codec.decode(result)
+        self.context.add_result(result)
+
+    def to_dict(self):
+        """Serialize the history state.
+
+        The ready set is not serialized: it is rebuilt from the states of the
+        activities when the history state is loaded.
+
+        Return:
+            dict: the history state (it can be stored as json.)
+        """
+
+        return dict(
+            activity_states=dict(
+                (activity_name, dict(
+                    (activity_id, state.to_dict())
+                    for activity_id, state in instances.items()))
+                for activity_name, instances in self.activity_states.items()),
+            event_id_info=[
+                [event_id, info]
+                for event_id, info in self.event_id_info.items()],
+            context=self.context.to_dict(),
+            markers=self.markers,
+            last_event_id=self.last_event_id)
+
+    @classmethod
+    def from_dict(cls, data, compiled_flow=None):
+        """Load a history state.
+
+        Args:
+            data (dict): the serialized history state (see `to_dict`.)
+            compiled_flow (CompiledFlow): the compiled flow of the execution.
+        Return:
+            HistoryState: the history state.
+        """
+
+        state = cls()
+        state.activity_states = dict(
+            (activity_name, dict(
+                (activity_id, activity.ActivityState.from_dict(
+                    activity_state))
+                for activity_id, activity_state in instances.items()))
+            for activity_name, instances in data.get(
+                'activity_states', {}).items())
+        state.event_id_info = dict(
+            (event_id, tuple(info))
+            for event_id, info in data.get('event_id_info', []))
+        state.context = context.ExecutionContext.from_dict(
+            data.get('context', {}))
+        state.markers = dict(data.get('markers', {}))
+        state.last_event_id = data.get('last_event_id', 0)
+
+        if compiled_flow:
+            state.ready_set = scheduler.ReadySet.from_activity_states(
+                compiled_flow, state.activity_states)
+        return state
+
+
+def add_marker_event(markers, event):
+    """Add a marker event.
+
+    Only the markers of the recorded generators are kept.
+
+    Args:
+        markers (dict): the values of the recorded generators (by marker
+            name.)
+        event (dict): the marker event.
+    """
+
+    marker_info = event.get('markerRecordedEventAttributes')
+    name = marker_info.get('markerName')
+    if name.startswith(generator.MARKER_PREFIX + '.'):
+        markers[name] = codec.loads(marker_info.get('details'))
+
+
+def get_activity_name(event_id_info, event):
+    """Get the name of the activity an event is about.
+
+    Args:
+        event_id_info (dict): the activity name and id of each scheduled
+            event (by event id.)
+        event (dict): the activity event.
+    Return:
+        str: the name of the activity.
+    """
+
+    return get_activity_key(event_id_info, event)[0]
+
+
+def get_activity_key(event_id_info, event):
+    """Get the name and the id of the activity an event is about.
+
+    Args:
+        event_id_info (dict): the activity name and id of each scheduled
+            event (by event id.)
+        event (dict): the activity event.
+    Return:
+        tuple: the name and the id of the activity.
+    """
+
+    event_type = event.get('eventType')
+    activity_info = event.get(ACTIVITY_EVENTS[event_type])
+
+    if event_type == 'ActivityTaskScheduled':
+        return (
+            activity_info.get('activityType').get('name'),
+            activity_info.get('activityId'))
+
+    return event_id_info.get(activity_info.get('scheduledEventId'))
+
+
+def get_activity_state(activity_events, event_id_info, event):
+    """Get the current state of the activity an event is about.
+
+    Args:
+        activity_events (dict): the activities and their state.
+        event_id_info (dict): the activity name and id of each scheduled
+            event (by event id.)
+        event (dict): the activity event.
+    Return:
+        ActivityState: the state of the activity (None if the activity has no
+            state yet.)
+    """
+
+    activity_name, activity_id = get_activity_key(event_id_info, event)
+    return activity_events.get(activity_name, {}).get(activity_id)
 
 
 def activity_states_from_events(events):
@@ -27,57 +284,55 @@ def activity_states_from_events(events):
     activity_events = dict()
 
     for event in events:
-        event_id = event.get('eventId')
-        event_type = event.get('eventType')
-
-        if event_type == 'ActivityTaskScheduled':
-            activity_info = event.get('activityTaskScheduledEventAttributes')
-            activity_id = activity_info.get('activityId')
-            activity_name = activity_info.get('activityType').get('name')
-            event_id_info.update({
-                event_id: {
-                    'activity_name': activity_name,
-                    'activity_id': activity_id}
-            })
-
-            activity_events.setdefault(
-                activity_name, {}).setdefault(
-                    activity_id,
-                    activity.ActivityState(activity_id)).add_state(
-                        activity.ACTIVITY_SCHEDULED)
-
-        elif event_type == 'ActivityTaskFailed':
-            activity_info = event.get('activityTaskFailedEventAttributes')
-            activity_event = event_id_info.get(
-                activity_info.get('scheduledEventId'))
-            activity_id = activity_event.get('activity_id')
-
-            activity_events.setdefault(
-                activity_event.get('activity_name'), {}).setdefault(
-                    activity_id,
-                    activity.ActivityState(activity_id)).add_state(
-                        activity.ACTIVITY_FAILED)
-
-        elif event_type == 'ActivityTaskCompleted':
-            activity_info = event.get('activityTaskCompletedEventAttributes')
-            activity_event = event_id_info.get(
-                activity_info.get('scheduledEventId'))
-            activity_id = activity_event.get('activity_id')
-
-            activity_events.setdefault(
-                activity_event.get('activity_name'), {}).setdefault(
-                    activity_id,
-                    activity.ActivityState(activity_id)).add_state(
-                        activity.ACTIVITY_COMPLETED)
-
-            result = json.loads(activity_info.get('result') or '{}')
-            activity_events.get(
-                activity_event.get('activity_name')).get(
-                    activity_id).set_result(result)
+        add_activity_event(activity_events, event_id_info, event)
 
     return activity_events
 
 
+def add_activity_event(
+        activity_events, event_id_info, event, max_result_size=None):
+    """Add an event into the activity states.
+
+    The results of the activities are not decoded (see `ActivityState`.)
+
+    Args:
+        activity_events (dict): the activities and their state.
+        event_id_info (dict): the activity name and id of each scheduled
+            event (by event id.)
+        event (dict): the event to add.
+        max_result_size (int): the maximum size of the activity results kept
+            in the activity states (None to keep all the results.)
+    """
+
+    event_type = event.get('eventType')
+    if event_type not in ACTIVITY_EVENTS:
+        return
+
+    activity_name, activity_id = get_activity_key(event_id_info, event)
+    if event_type == 'ActivityTaskScheduled':
+        event_id_info[event.get('eventId')] = (activity_name, activity_id)
+
+    instances = activity_events.get(activity_name)
+    if instances is None:
+        instances = activity_events[activity_name] = dict()
+
+    state = instances.get(activity_id)
+    if state is None:
+        state = instances[activity_id] = activity.ActivityState(activity_id)
+
+    if event_type == 'ActivityTaskScheduled':
+        state.add_state(activity.ACTIVITY_SCHEDULED)
+
+    elif event_type == 'ActivityTaskFailed':
+        state.add_state(activity.ACTIVITY_FAILED)
+
+    elif event_type == 'ActivityTaskCompleted':
+        state.add_state(activity.ACTIVITY_COMPLETED)
+        activity_info = event.get(ACTIVITY_EVENTS[event_type])
+        state.set_raw_result(
+            activity_info.get('result'), max_size=max_result_size)
+
+
 def get_current_context(events):
     """Get the current context from the list of events.
 
@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+Generator
+=========
+
+Generators spawn one or more instances of an activity based on values
+provided in the context. A generator is a callable that receives the context
+and returns an iterable of local contexts (one per instance)::
+
+    def country_generator(context):
+        for country_id in range(1, 200):
+            yield {'generator.country_id': country_id}
+
+When an activity has more than one generator, one instance is created for
+each combination of their local contexts. Generators can also report how many
+local contexts they generate, which allows the instances to be created as
+they are needed instead of all at once::
+
+    @generator.countable(lambda context: 199)
+    def country_generator(context):
+        for country_id in range(1, 200):
+            yield {'generator.country_id': country_id}
+
+Generators that are expensive to evaluate (or that may not return the same
+values twice) can be recorded: their values are stored in the execution
+history the first time they are evaluated, and read from the history by all
+the following decisions::
+
+    @generator.recorded
+    def file_generator(context):
+        for key in list_files(context.get('bucket')):
+            yield {'generator.key': key}
+
+The decider evaluates the generators of the activities that are ready
+concurrently (see `Evaluator`.)
+
+Generators can list the values of the context they read, which allows the
+decider to only keep those values (see `requires`.)
+"""
+
+from concurrent import futures
+import itertools
+import threading
+import time
+
+from garcon import codec
+from garcon import task
+
+
+MARKER_PREFIX = 'garcon.generator'
+MAX_MARKER_DETAILS = 32768  # Maximum size of the details of a SWF marker.
+
+
+class GeneratorTimeoutException(Exception):
+    """Exception when a generator takes longer than its timeout.
+    """
+
+    pass
+
+
+def countable(count):
+    """Wrapper for a generator to define how many local contexts it generates.
+
+    Args:
+        count (callable): method that receives the context and returns the
+            number of local contexts the generator will generate.
+    """
+
+    def wrapper(fn):
+        task._decorate(fn, 'count', count)
+        return fn
+
+    return wrapper
+
+
+def recorded(fn):
+    """Wrapper for a generator to record its values in the execution history.
+
+    Args:
+        fn (callable): the generator.
+    """
+
+    task._decorate(fn, 'recorded', True)
+    return fn
+
+
+def is_recorded(fn):
+    """Check if the values of a generator are recorded.
+
+    Return:
+        boolean: if the generator is recorded.
+    """
+
+    return getattr(fn, '__garcon__', {}).get('recorded', False)
+
+
+def marker_name(activity_name, index):
+    """Get the name of the marker of a generator.
+
+    Args:
+        activity_name (str): the name of the activity.
+        index (int): the position of the generator in the activity.
+    Return:
+        str: the marker name.
+    """
+
+    return '{}.{}.{}'.format(MARKER_PREFIX, activity_name, index)
+
+
+def requires(*keys):
+    """Wrapper for a generator to define the values it reads from the context.
+
+    The values read by its count method (see `countable`) should also be
+    listed.
+
+    Args:
+        keys (str): the keys of the context.
+    """
+
+    def wrapper(fn):
+        task._decorate(fn, 'requirements', set(keys))
+        return fn
+
+    return wrapper
+
+
+def get_requirements(fn):
+    """Get the values a generator reads from the context.
+
+    Return:
+        set: the keys of the context (None if the generator does not list
+            them.)
+    """
+
+    return getattr(fn, '__garcon__', {}).get('requirements')
+
+
+def get_count(fn):
+    """Get the count method of a generator.
+
+    Return:
+        callable: the count method (None if the generator is not countable.)
+    """
+
+    return getattr(fn, '__garcon__', {}).get('count')
+
+
+def count(generators, context):
+    """Count the local contexts generated by a list of generators.
+
+    Args:
+        generators (list): the generators.
+        context (dict): the current context.
+    Return:
+        int: the number of combinations of local contexts.
+    """
+
+    total = 1
+    for current in generators:
+        count_fn = get_count(current)
+        if count_fn:
+            total *= count_fn(context)
+        else:
+            total *= len(list(current(context)))
+    return total
+
+
+def evaluate(
+        generators, context, recorder=None, activity_name=None,
+        evaluator=None):
+    """Evaluate a list of generators.
+
+    The values of a generator are only kept in memory if needed: the values of
+    the first generator are only consumed once, so if it is countable, they
+    are consumed as they are generated. All the other generators are
+    consumed once per value of the first generator, so their values are kept.
+
+    The values of the recorded generators are read from the recorder if they
+    have already been recorded.
+
+    Args:
+        generators (list): the generators.
+        context (dict): the current context.
+        recorder (Recorder): the values of the recorded generators.
+        activity_name (str): the name of the activity of the generators.
+        evaluator (Evaluator): the evaluator of the generators (if not
+            provided, the generators are evaluated in the current thread.)
+    Return:
+        tuple: the number of combinations of local contexts, and the values of
+            each generator.
+    """
+
+    total = 1
+    values = []
+
+    for index, current in enumerate(generators):
+        name = marker_name(activity_name, index)
+        recorded = recorder and is_recorded(current)
+        if recorded and recorder.get(name) is not None:
+            current_values = recorder.get(name)
+            total *= len(current_values)
+            values.append(current_values)
+            continue
+
+        count_fn = get_count(current)
+        if not index and count_fn and not recorded:
+            total *= count_fn(context)
+            values.append(current(context))
+            continue
+
+        if evaluator:
+            current_values = evaluator.result(name, current, context)
+        else:
+            current_values = list(current(context))
+
+        if recorded:
+            current_values = recorder.record(name, current_values)
+
+        total *= len(current_values)
+        values.append(current_values)
+
+    return total, values
+
+
+def combine(values):
+    """Combine the values of a list of generators.
+
+    Each generator returns a context, all the contexts of a combination are
+    merged to only be one – which can be used to 1/ create the id of the
+    activity and 2/ be passed as a local context.
+
+    Args:
+        values (list): the values of each generator (see `evaluate`.)
+    Yield:
+        dict: the local context of each combination.
+    """
+
+    if not values:
+        return
+
+    for first_context in values[0]:
+        for other_contexts in itertools.product(*values[1:]):
+            local_context = dict()
+            local_context.update(first_context.items())
+            for current_context in other_contexts:
+                local_context.update(current_context.items())
+            yield local_context
+
+
+class Recorder:
+    """
+    Recorder
+    ========
+
+    The recorder holds the values of the recorded generators of an execution:
+    the ones found in the history (as markers), and the ones evaluated during
+    the current decision – which need to be recorded.
+    """
+
+    def __init__(self, markers=None, recording=True):
+        """Create a recorder.
+
+        Args:
+            markers (dict): the values of the generators already recorded (by
+                marker name.)
+            recording (boolean): if the values of the generators evaluated
+                should be recorded. Generators should only be recorded once
+                the context of their activity is complete.
+        """
+
+        self.markers = dict(markers or {})
+        self.pending = dict()
+        self.recording = recording
+
+    def get(self, name):
+        """Get the recorded values of a generator.
+
+        Args:
+            name (str): the marker name of the generator.
+        Return:
+            list: the values (None if the generator has not been recorded.)
+        """
+
+        return self.markers.get(name)
+
+    def record(self, name, values):
+        """Record the values of a generator.
+
+        The values are recorded as they are read from the history, so the
+        decision that records them sees the same values as the following
+        ones. Values that are too large to fit in a marker are not recorded.
+
+        Args:
+            name (str): the marker name of the generator.
+            values (list): the values of the generator.
+        Return:
+            list: the values.
+        """
+
+        if not self.recording:
+            return values
+
+        details = codec.dumps(values)
+        if len(details) > MAX_MARKER_DETAILS:
+            return values
+
+        values = codec.loads(details)
+        self.markers[name] = values
+        self.pending[name] = details
+        return values
+
+    def replay(self):
+        """Get a recorder that only reads the recorded values.
+
+        Return:
+            Recorder: the recorder (sharing the recorded values.)
+        """
+
+        recorder = Recorder(recording=False)
+        recorder.markers = self.markers
+        return recorder
+
+
+class Evaluator:
+    """
+    Evaluator
+    =========
+
+    The evaluator runs generators on a thread pool. The generators of all the
+    activities that are ready can be submitted at once, and their values are
+    then collected as the instances of each activity are created.
+
+    An evaluator holds the values of the generators for one context: a new
+    evaluator is needed for each decision.
+
+    A generator that exceeds its timeout cannot be stopped: it keeps its
+    thread of the pool until it returns, and the generators still waiting for
+    a thread are cancelled (see `cancel`.) The pool needs enough threads for
+    the generators that may be slow: the generators waiting for a thread
+    longer than their timeout also time out, so a pool taken by slow
+    generators aborts the decisions instead of blocking them.
+    """
+
+    def __init__(self, executor, timeout=None, on_timing=None):
+        """Create an evaluator.
+
+        Args:
+            executor (Executor): the thread pool running the generators.
+            timeout (int): the number of seconds a generator can run for (None
+                for no timeout.)
+            on_timing (callable): method called with the name of a generator
+                and the number of seconds it took to be evaluated.
+        """
+
+        self.executor = executor
+        self.timeout = timeout
+        self.on_timing = on_timing
+        self.futures = dict()
+        self.submitted = dict()
+        self.started = dict()
+        self.lock = threading.Lock()
+
+    def prefetch(self, generators, context, activity_name, recorder=None):
+        """Start evaluating the generators of an activity.
+
+        Only the generators that `evaluate` would consume are submitted: the
+        ones already recorded and the first generator if it is countable are
+        skipped.
+
+        Args:
+            generators (list): the generators.
+            context (dict): the current context.
+            activity_name (str): the name of the activity of the generators.
+            recorder (Recorder): the values of the recorded generators.
+        """
+
+        for index, current in enumerate(generators):
+            name = marker_name(activity_name, index)
+            if recorder and is_recorded(current):
+                if recorder.get(name) is not None:
+                    continue
+            elif not index and get_count(current):
+                continue
+
+            self.submit(name, current, context)
+
+    def submit(self, name, fn, context):
+        """Start evaluating a generator (if not already started.)
+
+        Args:
+            name (str): the name of the generator.
+            fn (callable): the generator.
+            context (dict): the current context.
+        Return:
+            Future: the values of the generator.
+        """
+
+        future = self.futures.get(name)
+        if not future:
+            self.submitted[name] = time.time()
+            future = self.executor.submit(self.run, name, fn, context)
+            self.futures[name] = future
+        return future
+
+    def run(self, name, fn, context):
+        """Evaluate a generator.
+
+        Args:
+            name (str): the name of the generator.
+            fn (callable): the generator.
+            context (dict): the current context.
+        Return:
+            list: the values of the generator.
+        """
+
+        start = time.time()
+        with self.lock:
+            self.started[name] = start
+
+        values = list(fn(context))
+        if self.on_timing:
+            self.on_timing(name, time.time() - start)
+        return values
+
+    def cancel(self):
+        """Cancel the generators that have not started running.
+        """
+
+        for future in self.futures.values():
+            future.cancel()
+
+    def result(self, name, fn, context):
+        """Get the values of a generator.
+
+        The timeout of a generator starts when it starts running. A generator
+        can also wait for a thread of the pool for as long as its timeout: if
+        all the threads are taken (for instance by the generators that have
+        exceeded their timeout in previous decisions), it times out without
+        running.
+
+        Args:
+            name (str): the name of the generator.
+            fn (callable): the generator.
+            context (dict): the current context.
+        Return:
+            list: the values of the generator.
+        Raises:
+            GeneratorTimeoutException: if the generator takes longer than the
+                timeout, or waits for a thread longer than the timeout.
+        """
+
+        future = self.submit(name, fn, context)
+        if self.timeout is None:
+            return future.result()
+
+        while True:
+            with self.lock:
+                start = self.started.get(name)
+
+            if start is None:
+                deadline = self.submitted[name] + self.timeout
+            else:
+                deadline = start + self.timeout
+
+            try:
+                return future.result(
+                    timeout=max(deadline - time.time(), 0))
+            except futures.TimeoutError:
+                with self.lock:
+                    started = self.started.get(name)
+
+                if start is not None:
+                    raise GeneratorTimeoutException(
+                        'The generator {} has exceeded its timeout.'.format(
+                            name))
+                elif started is None:
+                    raise GeneratorTimeoutException(
+                        'The generator {} has not found a thread.'.format(
+                            name))
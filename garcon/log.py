@@ -2,12 +2,13 @@
 """
 
 import logging
+import threading
 
 
 LOGGER_PREFIX = 'garcon'
 
 
-class GarconLogger:
+class GarconLogger(object):
     """This class is meant to be extended to get the Garcon logger feature
     The logger injects the execution context into the logger name.
 
@@ -28,8 +29,41 @@ class GarconLogger:
 
     This formatter will generate a log message as follow:
     '2015-01-15 - garcon.[domain].[workflow_id].[run_id] - [level] - [message]'
+
+    The logger name is kept per thread: the same object can log for different
+    executions from different threads.
     """
 
+    @property
+    def logger_name(self):
+        """Return the logger name of the current thread.
+
+        Return:
+            str: the logger name (None if no logger name was set.)
+        """
+
+        return getattr(self.log_context, 'logger_name', None)
+
+    @logger_name.setter
+    def logger_name(self, logger_name):
+        """Set the logger name of the current thread.
+
+        Args:
+            logger_name (str): the logger name.
+        """
+
+        self.log_context.logger_name = logger_name
+
+    @property
+    def log_context(self):
+        """Return the log context of the current thread.
+
+        Return:
+            threading.local: the log context.
+        """
+
+        return self.__dict__.setdefault('_log_context', threading.local())
+
     @property
     def logger(self):
         """Return the appropriate logger. Default to LOGGER_PREFIX if
@@ -39,8 +73,7 @@ class GarconLogger:
             logging.Logger: a logger object
         """
 
-        return logging.getLogger(
-            getattr(self, 'logger_name', None) or LOGGER_PREFIX)
+        return logging.getLogger(self.logger_name or LOGGER_PREFIX)
 
     def set_log_context(self, execution_context):
         """Set a logger name with execution context passed in.
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Registration
+============
+
+SWF needs the domain, the workflow type and all the activity types of a flow
+to be registered before the flow can run. Registering them one by one (and
+relying on SWF to reject the types that already exist) is slow for flows that
+have many activities, and uses a lot of the API quota.
+
+The registration lists the types that already exist in the domain (a page of
+100 types per call), and only registers the missing ones, concurrently. Calls
+that are throttled by SWF are retried with an exponential backoff.
+
+A manifest (a local JSON file) keeps the signature of the flows that have been
+fully registered: a flow that has not changed since its last registration is
+not registered again.
+"""
+
+from boto.swf.exceptions import SWFDomainAlreadyExistsError
+from boto.swf.exceptions import SWFTypeAlreadyExistsError
+import backoff
+import boto.exception as boto_exception
+import boto.swf.layer2 as swf
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import json
+import os
+import threading
+
+from garcon import log
+from garcon import utils
+
+
+DEFAULT_WORKERS = 8
+MAX_PAGE_SIZE = 100
+
+
+class Registration(log.GarconLogger):
+
+    def __init__(self, workers=DEFAULT_WORKERS, manifest=None, layer1=None):
+        """Create a registration.
+
+        Args:
+            workers (int): number of types registered at the same time.
+            manifest (str): path of the manifest of the registered flows (the
+                flows are always registered if not provided.)
+            layer1 (Layer1): the SWF connection used to list the existing
+                types (created from the domain if not provided.)
+        """
+
+        self.workers = workers
+        self.manifest = manifest
+        self.layer1 = layer1
+        self.lock = threading.Lock()
+
+    def register(self, domain, types):
+        """Register a domain and its types.
+
+        Args:
+            domain (Domain): the domain.
+            types (list): the workflow types and activity types.
+        """
+
+        signature = get_signature(domain, types)
+        if signature in self.read_manifest():
+            self.logger.debug('{} is already registered'.format(domain.name))
+            return
+
+        self.register_type(domain)
+
+        existing = self.list_types(domain)
+        missing = [
+            swf_entity for swf_entity in types
+            if (get_kind(swf_entity), swf_entity.name,
+                swf_entity.version) not in existing]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(self.register_type, missing))
+
+        self.write_manifest(signature)
+
+    def list_types(self, domain):
+        """List the types registered in a domain.
+
+        Args:
+            domain (Domain): the domain.
+        Return:
+            set: the kind (`activity` or `workflow`), the name and the version
+                of each type.
+        """
+
+        layer1 = self.layer1
+        if layer1 is None:
+            layer1 = swf.Layer1(
+                domain.aws_access_key_id, domain.aws_secret_access_key,
+                region=domain.region)
+
+        existing = set()
+        for kind in ('activity', 'workflow'):
+            method = getattr(layer1, 'list_{}_types'.format(kind))
+            next_page_token = None
+            while True:
+                page = self.list_page(
+                    method, domain.name, next_page_token=next_page_token)
+                for info in page.get('typeInfos', []):
+                    swf_type = info['{}Type'.format(kind)]
+                    existing.add(
+                        (kind, swf_type['name'], swf_type['version']))
+
+                next_page_token = page.get('nextPageToken')
+                if not next_page_token:
+                    break
+
+        return existing
+
+    @backoff.on_exception(
+        backoff.expo,
+        boto_exception.SWFResponseError,
+        max_tries=5,
+        giveup=utils.non_throttle_error,
+        on_backoff=utils.throttle_backoff_handler,
+        jitter=backoff.full_jitter)
+    def list_page(self, method, domain_name, next_page_token=None):
+        """List a page of the registered types.
+
+        Args:
+            method (callable): the listing method of the SWF connection.
+            domain_name (str): the name of the domain.
+            next_page_token (str): the token of the page.
+        Return:
+            dict: the page.
+        """
+
+        return method(
+            domain_name, 'REGISTERED', maximum_page_size=MAX_PAGE_SIZE,
+            next_page_token=next_page_token)
+
+    @backoff.on_exception(
+        backoff.expo,
+        boto_exception.SWFResponseError,
+        max_tries=5,
+        giveup=utils.non_throttle_error,
+        on_backoff=utils.throttle_backoff_handler,
+        jitter=backoff.full_jitter)
+    def register_type(self, swf_entity):
+        """Register a domain or a type.
+
+        Args:
+            swf_entity (SWFBase): the domain or the type.
+        """
+
+        try:
+            swf_entity.register()
+        except (SWFDomainAlreadyExistsError, SWFTypeAlreadyExistsError):
+            self.logger.debug('{} {} already exists'.format(
+                swf_entity.__class__.__name__, swf_entity.name))
+
+    def read_manifest(self):
+        """Read the signatures of the registered flows.
+
+        Return:
+            set: the signatures (empty if there is no manifest, or if it
+                cannot be read.)
+        """
+
+        if not self.manifest or not os.path.exists(self.manifest):
+            return set()
+
+        try:
+            with io.open(self.manifest, encoding='utf-8') as manifest_file:
+                return set(json.load(manifest_file))
+        except ValueError as error:
+            self.logger.warning(
+                'Registration manifest cannot be read: {}'.format(error))
+            return set()
+
+    def write_manifest(self, signature):
+        """Add the signature of a registered flow to the manifest.
+
+        Args:
+            signature (str): the signature of the flow.
+        """
+
+        if not self.manifest:
+            return
+
+        with self.lock:
+            signatures = self.read_manifest()
+            signatures.add(signature)
+
+            temporary_path = '{}.tmp'.format(self.manifest)
+            with open(temporary_path, 'w') as manifest_file:
+                json.dump(sorted(signatures), manifest_file)
+            os.rename(temporary_path, self.manifest)
+
+
+def get_kind(swf_entity):
+    """Get the kind of a type.
+
+    Args:
+        swf_entity (SWFBase): the type.
+    Return:
+        str: `workflow` for the workflow types, `activity` otherwise.
+    """
+
+    if isinstance(swf_entity, swf.WorkflowType):
+        return 'workflow'
+    return 'activity'
+
+
+def get_signature(domain, types):
+    """Get the signature of a domain and its types.
+
+    The signature changes if a type is added, removed, or if its version or
+    its task list changes.
+
+    Args:
+        domain (Domain): the domain.
+        types (list): the workflow types and activity types.
+    Return:
+        str: the signature.
+    """
+
+    description = [domain.name] + sorted(
+        [get_kind(swf_entity), swf_entity.name, swf_entity.version,
+            getattr(swf_entity, 'task_list', None)]
+        for swf_entity in types)
+    return hashlib.sha1(
+        json.dumps(description).encode('utf-8')).hexdigest()
@@ -9,13 +9,19 @@ or in parallel). There's only one task runner per activity.
 from concurrent import futures
 from concurrent.futures import ThreadPoolExecutor
 
+from garcon.context import ContextView
 from garcon.task import flatten
+from garcon.task import is_task_list
 
 
 DEFAULT_TASK_TIMEOUT = 600   # 10 minutes.
 DEFAULT_TASK_HEARTBEAT = 600  # 10 minutes
 
 
+# The methods of the runners that the plan is made of.
+PLAN_METHODS = ('timeout', 'heartbeat', 'requirements')
+
+
 class NoRunnerRequirementsFound(Exception):
     pass
 
@@ -24,11 +30,139 @@ class RunnerMissing(Exception):
     pass
 
 
+class RunnerPlan():
+
+    def __init__(self, timeout, heartbeat, requirements=None):
+        """Create a runner plan.
+
+        The runner plan holds the values needed to schedule the activity
+        of a runner: the timeout, the heartbeat and the requirements.
+
+        Args:
+            timeout (int): the timeout of the activity.
+            heartbeat (int): the heartbeat timeout of the activity.
+            requirements (set): the values required from the context (None if
+                at least one of the tasks does not list its requirements.)
+        """
+
+        self.timeout = timeout
+        self.heartbeat = heartbeat
+        self.requirements = requirements
+
+
 class BaseRunner():
 
     def __init__(self, *args):
         self.tasks = args
 
+    def plan(self, context):
+        """Calculate the timeout, the heartbeat and the requirements at once.
+
+        The values are calculated from the tasks (see `plan_tasks`), unless
+        the runner overrides `timeout`, `heartbeat` or `requirements`: the
+        values of the overridden methods are used instead.
+
+        Args:
+            context (dict): the current context.
+        Return:
+            RunnerPlan: the plan of the runner.
+        """
+
+        overridden = [
+            name for name in PLAN_METHODS if is_overridden(self, name)]
+        if not overridden:
+            return self.plan_tasks(context)
+
+        values = dict()
+        for name in PLAN_METHODS:
+            if name not in overridden:
+                continue
+            try:
+                values[name] = getattr(self, name)(context)
+            except NoRunnerRequirementsFound:
+                values[name] = None
+
+        if len(overridden) < len(PLAN_METHODS):
+            tasks_plan = self.plan_tasks(context)
+            values.setdefault('timeout', tasks_plan.timeout)
+            values.setdefault('heartbeat', tasks_plan.heartbeat)
+            values.setdefault('requirements', tasks_plan.requirements)
+
+        return RunnerPlan(**values)
+
+    def plan_tasks(self, context):
+        """Calculate the timeout, the heartbeat and the requirements from the
+        tasks.
+
+        The task lists are only flattened once for all the values. If the
+        runner does not have any task list, its plan does not depend on the
+        context and it is only calculated once.
+
+        Args:
+            context (dict): the current context.
+        Return:
+            RunnerPlan: the plan of the tasks.
+        """
+
+        static_plan = getattr(self, 'static_plan', None)
+        if static_plan:
+            return static_plan
+
+        timeout = 0
+        heartbeat = 0
+        requirements = []
+        has_requirements = True
+        has_task_list = False
+
+        # Get all the tasks and the lists (so the .fill on lists are also
+        # considered.)
+        tasks = []
+        for task in self.tasks:
+            if is_task_list(task):
+                # The task lists are user code: they receive a dict (the
+                # context of an activity instance is a read-only view.)
+                if isinstance(context, ContextView):
+                    context = dict(context)
+                has_task_list = True
+                tasks.append(task)
+                tasks += list(flatten([task], context))
+                continue
+            tasks.append(task)
+
+        for task in tasks:
+            task_details = getattr(task, '__garcon__', None)
+            if not task_details:
+                has_requirements = False
+                task_details = dict()
+
+            if not is_task_list(task):
+                timeout += task_details.get('timeout', DEFAULT_TASK_TIMEOUT)
+                heartbeat = max(
+                    heartbeat,
+                    task_details.get('heartbeat', DEFAULT_TASK_HEARTBEAT))
+
+            requirements += task_details.get('requirements', [])
+
+        plan = RunnerPlan(
+            timeout, heartbeat,
+            set(requirements) if has_requirements else None)
+
+        if not has_task_list:
+            self.static_plan = plan
+        return plan
+
+    def has_task_list(self):
+        """Check if the runner has task lists.
+
+        The tasks of a task list depend on the context: so do the plan of the
+        runner.
+
+        Return:
+            boolean: if one of the tasks is a task list.
+        """
+
+        return any(is_task_list(task) for task in self.tasks)
+
     def timeout(self, context):
         """Calculate and return the timeout for an activity.
 
@@ -41,19 +175,7 @@ class BaseRunner():
                 a regular number.)
         """
 
-        timeout = 0
-
-        for task in flatten(self.tasks, context):
-            task_timeout = DEFAULT_TASK_TIMEOUT
-            task_details = getattr(task, '__garcon__', None)
-
-            if task_details:
-                task_timeout = task_details.get(
-                    'timeout', DEFAULT_TASK_TIMEOUT)
-
-            timeout = timeout + task_timeout
-
-        return timeout
+        return self.plan_tasks(context).timeout
 
     def heartbeat(self, context):
         """Calculate and return the heartbeat for an activity.
@@ -70,20 +192,7 @@ class BaseRunner():
                 string not a regular number.)
         """
 
-        heartbeat = 0
-
-        for task in flatten(self.tasks, context):
-            task_details = getattr(task, '__garcon__', None)
-            task_heartbeat = DEFAULT_TASK_HEARTBEAT
-
-            if task_details:
-                task_heartbeat = task_details.get(
-                    'heartbeat', DEFAULT_TASK_HEARTBEAT)
-
-            if task_heartbeat > heartbeat:
-                heartbeat = task_heartbeat
-
-        return heartbeat
+        return self.plan_tasks(context).heartbeat
 
     def requirements(self, context):
         """Find all the requirements from the list of tasks and return it.
@@ -100,18 +209,10 @@ class BaseRunner():
             set: the list of the required values from the context.
         """
 
-        requirements = []
-
-        # Get all the tasks and the lists (so the .fill on lists are also
-        # considered.)
-        all_tasks = list(self.tasks) + list(flatten(self.tasks, context))
-        for task in all_tasks:
-            task_details = getattr(task, '__garcon__', None)
-            if task_details:
-                requirements += task_details.get('requirements', [])
-            else:
-                raise NoRunnerRequirementsFound()
-        return set(requirements)
+        requirements = self.plan_tasks(context).requirements
+        if requirements is None:
+            raise NoRunnerRequirementsFound()
+        return requirements
 
     def execute(self, activity, context):
         """Execution of the tasks.
@@ -165,5 +266,62 @@ class External(BaseRunner):
 
         assert timeout, 'External runner requires a timeout.'
 
+        self.tasks = ()
         self.timeout = lambda ctx=None: timeout
         self.heartbeat = lambda ctx=None: (heartbeat or timeout)
+
+    def plan(self, context):
+        """Get the plan of the external runner.
+
+        The tasks of an external activity are unknown: the whole context is
+        sent to the activity.
+
+        Args:
+            context (dict): the current context.
+        Return:
+            RunnerPlan: the plan of the runner.
+        """
+
+        return RunnerPlan(self.timeout(context), self.heartbeat(context))
+
+
+def is_overridden(current_runner, name):
+    """Check if a runner overrides one of the methods of the base runner.
+
+    Args:
+        current_runner (BaseRunner): the runner.
+        name (str): the name of the method.
+    Return:
+        boolean: if the method of the runner is not the one of the base
+            runner.
+    """
+
+    method = getattr(current_runner, name)
+    return getattr(method, '__func__', method) is not BaseRunner.__dict__[name]
+
+
+def get_plan(current_runner, context):
+    """Get the plan of a runner.
+
+    The runners that do not extend the base runner may not have a plan: it is
+    then made of their timeout, their heartbeat and their requirements.
+
+    Args:
+        current_runner (object): the runner.
+        context (dict): the current context.
+    Return:
+        RunnerPlan: the plan of the runner.
+    """
+
+    if hasattr(current_runner, 'plan'):
+        return current_runner.plan(context)
+
+    requirements = getattr(current_runner, 'requirements', None)
+    try:
+        requirements = requirements(context) if requirements else None
+    except NoRunnerRequirementsFound:
+        requirements = None
+
+    return RunnerPlan(
+        current_runner.timeout(context), current_runner.heartbeat(context),
+        requirements)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Scheduler
+=========
+
+The default decider schedules an activity when all the activities it requires
+have completed. Instead of walking through the state of every instance of the
+required activities on each decision, the ready set keeps track of the
+progress of each activity as the events of the history are consumed.
+"""
+
+from garcon import activity
+
+
+class ReadySet:
+
+    def __init__(self, compiled_flow):
+        """Create a ready set.
+
+        For each activity, the ready set keeps the number of instances that
+        have been scheduled, the number of instances that have completed and
+        the number of instances in flight.
+        An activity is completed when it has at least one instance and all of
+        its scheduled instances have completed. Each activity also has a
+        counter of the activities it requires that have not completed: the
+        activity is ready when this counter is 0.
+
+        Some instances of an activity may not be scheduled yet (the number of
+        instances in flight is limited, or the decision ran out of time): an
+        activity is only exhausted when all of its instances have been
+        scheduled and have completed (see `activity.is_activity_exhausted`.)
+
+        Args:
+            compiled_flow (CompiledFlow): the compiled flow.
+        """
+
+        self.dependents = compiled_flow.dependents
+        self.instances = dict()
+        self.completed_instances = dict()
+        self.in_flight = dict()
+        self.exhausted = set()
+        self.blocked = dict(
+            (name, len(requires))
+            for name, requires in compiled_flow.requires.items())
+
+    @classmethod
+    def from_activity_states(cls, compiled_flow, activity_states):
+        """Create a ready set from the states of the activities.
+
+        Args:
+            compiled_flow (CompiledFlow): the compiled flow.
+            activity_states (dict): the activities and their state.
+        Return:
+            ReadySet: the ready set.
+        """
+
+        ready_set = cls(compiled_flow)
+        for activity_name, instances in activity_states.items():
+            for states in instances.values():
+                ready_set.add_instance(activity_name)
+                if states.completed:
+                    ready_set.complete_instance(activity_name)
+                if states.get_last_state() == activity.ACTIVITY_SCHEDULED:
+                    ready_set.update_in_flight(activity_name, 1)
+
+        return ready_set
+
+    def is_completed(self, activity_name):
+        """Check if all the scheduled instances of an activity have completed.
+
+        Args:
+            activity_name (str): the name of the activity.
+        Return:
+            boolean: if the activity has completed.
+        """
+
+        instances = self.instances.get(activity_name, 0)
+        return bool(instances) and (
+            self.completed_instances.get(activity_name, 0) == instances)
+
+    def is_ready(self, activity_name):
+        """Check if all the activities required by an activity have completed.
+
+        The activities it requires may still have instances to schedule (see
+        `activity.is_activity_ready`.)
+
+        Args:
+            activity_name (str): the name of the activity.
+        Return:
+            boolean: if the activity can be scheduled.
+        """
+
+        return not self.blocked.get(activity_name, 0)
+
+    def add_instance(self, activity_name):
+        """Add a new instance of an activity.
+
+        Args:
+            activity_name (str): the name of the activity.
+        """
+
+        was_completed = self.is_completed(activity_name)
+        self.instances[activity_name] = (
+            self.instances.get(activity_name, 0) + 1)
+        self.exhausted.discard(activity_name)
+
+        if was_completed:
+            self.update_dependents(activity_name, 1)
+
+    def complete_instance(self, activity_name):
+        """Mark an instance of an activity as completed.
+
+        Args:
+            activity_name (str): the name of the activity.
+        """
+
+        self.completed_instances[activity_name] = (
+            self.completed_instances.get(activity_name, 0) + 1)
+
+        if self.is_completed(activity_name):
+            self.update_dependents(activity_name, -1)
+
+    def update_in_flight(self, activity_name, value):
+        """Update the number of instances in flight of an activity.
+
+        Args:
+            activity_name (str): the name of the activity.
+            value (int): the value to add to the counter.
+        """
+
+        self.in_flight[activity_name] = (
+            self.in_flight.get(activity_name, 0) + value)
+
+    def update_dependents(self, activity_name, value):
+        """Update the counters of the activities that require an activity.
+
+        Args:
+            activity_name (str): the name of the activity.
+            value (int): the value to add to the counters.
+        """
+
+        for dependent in self.dependents.get(activity_name, []):
+            self.blocked[dependent] = self.blocked.get(dependent, 0) + value
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot
+========
+
+The state cache only lives as long as the decider: after a restart (or on
+another host), the next decision task of each execution has to rebuild its
+state from the full history.
+
+The snapshot store keeps the state of each workflow run on disk, in a SQLite
+database, along with the id of the last event it has processed. A decider that
+does not have the state of a run in its cache loads its snapshot, and only has
+to process the events that have been added since.
+
+Deciders on different hosts can share the same database if it is on a volume
+that supports file locks.
+
+The snapshot of a run is removed when the decider closes the run. The runs
+that are closed without a decision (terminated, timed out or canceled) keep
+their snapshot: the snapshots that have not been updated for `max_age` seconds
+are pruned (at most once per `PRUNE_INTERVAL`, when a snapshot is saved.) A
+run whose snapshot has been pruned rebuilds its state from its history.
+"""
+
+import sqlite3
+import threading
+import time
+
+from garcon import codec
+from garcon import event
+
+
+SNAPSHOT_VERSION = 2
+DEFAULT_TIMEOUT = 30  # Seconds to wait for a lock on the database.
+DEFAULT_MAX_AGE = 7 * 24 * 3600  # Snapshots not updated for a week.
+PRUNE_INTERVAL = 3600  # Seconds between two prunes of the store.
+
+
+class SnapshotStore:
+
+    def __init__(self, path, timeout=DEFAULT_TIMEOUT, max_age=DEFAULT_MAX_AGE):
+        """Create a snapshot store.
+
+        Args:
+            path (str): path of the SQLite database (created if it does not
+                exist.)
+            timeout (int): number of seconds to wait for the database to be
+                unlocked by another process.
+            max_age (int): number of seconds after which the snapshots that
+                have not been updated are pruned (None to never prune them.)
+        """
+
+        self.path = path
+        self.max_age = max_age
+        self.pruned_at = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, timeout=timeout, check_same_thread=False)
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS snapshots ('
+                'workflow_id TEXT NOT NULL, '
+                'run_id TEXT NOT NULL, '
+                'version INTEGER NOT NULL, '
+                'last_event_id INTEGER NOT NULL, '
+                'data TEXT NOT NULL, '
+                'updated_at REAL NOT NULL, '
+                'PRIMARY KEY (workflow_id, run_id))')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS snapshots_updated_at '
+                'ON snapshots (updated_at)')
+
+    def get(self, workflow_id, run_id, compiled_flow=None):
+        """Get the state of a workflow run.
+
+        Args:
+            workflow_id (str): the workflow id.
+            run_id (str): the run id.
+            compiled_flow (CompiledFlow): the compiled flow of the execution.
+        Return:
+            HistoryState: the state of the run, None if the run does not have
+                a snapshot (or if it has been saved by another version.)
+        """
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT data FROM snapshots '
+                'WHERE workflow_id = ? AND run_id = ? AND version = ?',
+                (workflow_id, run_id, SNAPSHOT_VERSION)).fetchone()
+
+        if not row:
+            return None
+
+        return event.HistoryState.from_dict(
+            codec.loads(row[0]), compiled_flow=compiled_flow)
+
+    def set(self, workflow_id, run_id, state):
+        """Set the state of a workflow run.
+
+        A snapshot is never replaced by an older state of the run (which can
+        happen when several deciders share the store.)
+
+        Args:
+            workflow_id (str): the workflow id.
+            run_id (str): the run id.
+            state (HistoryState): the state of the run.
+        """
+
+        data = codec.dumps(state.to_dict())
+        values = (
+            SNAPSHOT_VERSION, state.last_event_id, data, time.time(),
+            workflow_id, run_id, state.last_event_id)
+
+        with self.lock, self.connection:
+            updated = self.connection.execute(
+                'UPDATE snapshots '
+                'SET version = ?, last_event_id = ?, data = ?, updated_at = ? '
+                'WHERE workflow_id = ? AND run_id = ? AND last_event_id <= ?',
+                values).rowcount
+
+            if not updated:
+                self.connection.execute(
+                    'INSERT OR IGNORE INTO snapshots (version, last_event_id, '
+                    'data, updated_at, workflow_id, run_id) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    values[:-1])
+
+        if self.max_age and time.time() - self.pruned_at > PRUNE_INTERVAL:
+            self.prune(self.max_age)
+
+    def remove(self, workflow_id, run_id):
+        """Remove the snapshot of a workflow run.
+
+        Args:
+            workflow_id (str): the workflow id.
+            run_id (str): the run id.
+        """
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM snapshots WHERE workflow_id = ? AND run_id = ?',
+                (workflow_id, run_id))
+
+    def prune(self, max_age):
+        """Remove the snapshots that have not been updated recently.
+
+        Args:
+            max_age (int): number of seconds since the last update of the
+                snapshots to remove.
+        Return:
+            int: the number of snapshots removed.
+        """
+
+        with self.lock, self.connection:
+            self.pruned_at = time.time()
+            return self.connection.execute(
+                'DELETE FROM snapshots WHERE updated_at < ?',
+                (self.pruned_at - max_age,)).rowcount
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT COUNT(*) FROM snapshots').fetchone()[0]
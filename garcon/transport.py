@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Transport
+=========
+
+The transport carries the calls of the deciders and the activities to SWF:
+polling for tasks, completing and failing them, and recording heartbeats. The
+decisions themselves are plain SWF decisions (built with
+`boto.swf.layer1_decisions.Layer1Decisions`, which does not connect to SWF.)
+
+Two transports are provided: the boto2 transport, used by default, and the
+in-memory transport, which sends the calls to an emulator (see
+`garcon.emulator`.) Other transports (such as one based on a pool of clients)
+implement the interface of `Transport`, and are provided to the deciders and
+the activities:
+
+    decider_worker = decider.DeciderWorker(flow, transport=custom_transport)
+    activity_worker = activity.ActivityWorker(
+        flow, transport=custom_transport)
+
+The deciders and the activities only create their connection of boto when it
+is first needed (see `LazyConnection`): the ones that are provided a
+transport never create it, and do not need AWS credentials.
+"""
+
+import threading
+
+import boto.swf.layer1 as layer1
+import boto.swf.layer2 as layer2
+
+
+class Transport(object):
+    """Interface of the transports.
+
+    The calls have the same arguments and return the same responses as the
+    calls of the SWF connection of boto (`boto.swf.layer1.Layer1`.)
+    """
+
+    def poll_for_decision_task(
+            self, domain, task_list, identity=None, maximum_page_size=None,
+            next_page_token=None, reverse_order=None):
+        """Poll for a decision task (or for a page of its history.)
+
+        Args:
+            domain (str): the domain.
+            task_list (str): the task list.
+            identity (str): the identity of the decider.
+            maximum_page_size (int): the number of events of a page.
+            next_page_token (str): the token of the page of the history.
+            reverse_order (boolean): if the events are from the newest to the
+                oldest.
+        Return:
+            dict: the decision task (without `taskToken` if there is no task.)
+        """
+
+        raise NotImplementedError()
+
+    def respond_decision_task_completed(
+            self, task_token, decisions=None, execution_context=None):
+        """Complete a decision task.
+
+        Args:
+            task_token (str): the token of the task.
+            decisions (list): the decisions.
+            execution_context (str): the context of the execution.
+        """
+
+        raise NotImplementedError()
+
+    def poll_for_activity_task(self, domain, task_list, identity=None):
+        """Poll for an activity task.
+
+        Args:
+            domain (str): the domain.
+            task_list (str): the task list.
+            identity (str): the identity of the activity worker.
+        Return:
+            dict: the activity task (without `activityId` if there is no
+                task.)
+        """
+
+        raise NotImplementedError()
+
+    def respond_activity_task_completed(self, task_token, result=None):
+        """Complete an activity task.
+
+        Args:
+            task_token (str): the token of the task.
+            result (str): the result of the task.
+        """
+
+        raise NotImplementedError()
+
+    def respond_activity_task_failed(
+            self, task_token, details=None, reason=None):
+        """Fail an activity task.
+
+        Args:
+            task_token (str): the token of the task.
+            details (str): the details of the failure.
+            reason (str): the reason of the failure.
+        """
+
+        raise NotImplementedError()
+
+    def record_activity_task_heartbeat(self, task_token, details=None):
+        """Record the heartbeat of an activity task.
+
+        Args:
+            task_token (str): the token of the task.
+            details (str): the progress of the task.
+        Return:
+            dict: the response (`cancelRequested`.)
+        """
+
+        raise NotImplementedError()
+
+
+class ConnectionTransport(Transport):
+    """Transport that sends the calls to a connection that has the calls of
+    the SWF connection of boto.
+    """
+
+    def __init__(self, connection):
+        """Create the transport.
+
+        Args:
+            connection (object): the connection.
+        """
+
+        self.connection = connection
+
+    def get_connection(self):
+        return self.connection
+
+    def poll_for_decision_task(
+            self, domain, task_list, identity=None, maximum_page_size=None,
+            next_page_token=None, reverse_order=None):
+        return self.get_connection().poll_for_decision_task(
+            domain, task_list, identity=identity,
+            maximum_page_size=maximum_page_size,
+            next_page_token=next_page_token, reverse_order=reverse_order)
+
+    def respond_decision_task_completed(
+            self, task_token, decisions=None, execution_context=None):
+        return self.get_connection().respond_decision_task_completed(
+            task_token, decisions=decisions,
+            execution_context=execution_context)
+
+    def poll_for_activity_task(self, domain, task_list, identity=None):
+        return self.get_connection().poll_for_activity_task(
+            domain, task_list, identity=identity)
+
+    def respond_activity_task_completed(self, task_token, result=None):
+        return self.get_connection().respond_activity_task_completed(
+            task_token, result=result)
+
+    def respond_activity_task_failed(
+            self, task_token, details=None, reason=None):
+        return self.get_connection().respond_activity_task_failed(
+            task_token, details=details, reason=reason)
+
+    def record_activity_task_heartbeat(self, task_token, details=None):
+        return self.get_connection().record_activity_task_heartbeat(
+            task_token, details=details)
+
+
+class Boto2Transport(ConnectionTransport):
+
+    def __init__(self, connection=None, **options):
+        """Create a boto2 transport.
+
+        Args:
+            connection (Layer1): the SWF connection (created when it is first
+                needed if not provided.)
+            options (dict): the options of the connection (such as
+                `aws_access_key_id`, `aws_secret_access_key` or `region`.)
+        """
+
+        super(Boto2Transport, self).__init__(connection)
+        self.options = options
+        self.lock = threading.Lock()
+
+    def get_connection(self):
+        if self.connection is None:
+            with self.lock:
+                if self.connection is None:
+                    self.connection = layer1.Layer1(**self.options)
+        return self.connection
+
+
+class ActorTransport(Boto2Transport):
+
+    def __init__(self, actor):
+        """Create a boto2 transport that uses the connection of an actor.
+
+        Args:
+            actor (LazyConnection): the decider or the activity (its
+                connection is created when it is first needed.)
+        """
+
+        super(ActorTransport, self).__init__()
+        self.actor = actor
+
+    def get_connection(self):
+        return self.actor._swf
+
+
+class InMemoryTransport(ConnectionTransport):
+
+    def __init__(self, emulator):
+        """Create an in-memory transport.
+
+        Args:
+            emulator (Emulator): the emulator of SWF.
+        """
+
+        super(InMemoryTransport, self).__init__(emulator)
+
+
+class LazyConnection(object):
+    """Mixin of the actors (the deciders and the activities) that extend the
+    workers of boto (`boto.swf.layer2`.)
+
+    The workers of boto create their SWF connection (`_swf`) when they are
+    created, which requires AWS credentials. The connection is only created
+    when it is first needed instead.
+    """
+
+    def __init__(self, **kwargs):
+        """Set the credentials and the options of the worker.
+
+        Args:
+            kwargs (dict): the options of the worker (such as
+                `aws_access_key_id`, `aws_secret_access_key` or `region`.)
+        """
+
+        for key in ('aws_access_key_id', 'aws_secret_access_key'):
+            if layer2.DEFAULT_CREDENTIALS.get(key):
+                setattr(self, key, layer2.DEFAULT_CREDENTIALS[key])
+
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    @property
+    def _swf(self):
+        connection = self.__dict__.get('swf_connection')
+        if connection is None:
+            connection = layer1.Layer1(
+                getattr(self, 'aws_access_key_id', None),
+                getattr(self, 'aws_secret_access_key', None),
+                region=getattr(self, 'region', None))
+            self.__dict__['swf_connection'] = connection
+        return connection
+
+    @_swf.setter
+    def _swf(self, connection):
+        self.__dict__['swf_connection'] = connection
@@ -9,6 +9,7 @@ import pytest
 
 from garcon import activity
 from garcon import event
+from garcon import generator
 from garcon import runner
 from garcon import task
 from garcon import utils
@@ -331,6 +332,44 @@ def test_create_external_activity(monkeypatch):
     assert current_activity.runner.timeout() == 60
 
 
+def test_create_external_activity_compression(monkeypatch):
+    """Test the compression of the flow does not apply to the external
+    activities, unless they opt in.
+    """
+
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    create = activity.create('domain_name', 'flow_name', compression='zlib')
+
+    assert create(name='activity_1').compression == 'zlib'
+
+    external_activity = create(name='activity_2', timeout=60, external=True)
+    assert external_activity.compression is None
+
+    external_activity = create(
+        name='activity_3', timeout=60, external=True, compression='zlib')
+    assert external_activity.compression == 'zlib'
+
+
+def test_create_external_activity_claim_check(monkeypatch):
+    """Test the claim check of the flow does not apply to the external
+    activities, unless they opt in.
+    """
+
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    claim_check = MagicMock()
+    create = activity.create(
+        'domain_name', 'flow_name', claim_check=claim_check)
+
+    assert create(name='activity_1').claim_check is claim_check
+
+    external_activity = create(name='activity_2', timeout=60, external=True)
+    assert external_activity.claim_check is None
+
+    external_activity = create(
+        name='activity_3', timeout=60, external=True, claim_check=claim_check)
+    assert external_activity.claim_check is claim_check
+
+
 def test_create_activity_worker(monkeypatch):
     """Test the creation of an activity worker.
     """
@@ -401,7 +440,7 @@ def test_activity_timeouts(monkeypatch, generators):
     total_generators = pow(10, len(current_activity.generators))
     schedule_to_start = start_timeout * total_generators
     for instance in current_activity.instances({}):
-        assert current_activity.pool_size == total_generators
+        assert instance.pool_size == total_generators
         assert instance.schedule_to_start == schedule_to_start
         assert instance.timeout == timeout * 2
         assert instance.schedule_to_close == (
@@ -423,7 +462,7 @@ def test_external_activity_timeouts(monkeypatch, generators):
     total_generators = pow(10, len(current_activity.generators))
     schedule_to_start = start_timeout * total_generators
     for instance in current_activity.instances({}):
-        assert current_activity.pool_size == total_generators
+        assert instance.pool_size == total_generators
         assert instance.schedule_to_start == schedule_to_start
         assert instance.timeout == timeout
         assert instance.schedule_to_close == (
@@ -750,3 +789,507 @@ def test_activity_state():
         state.set_result('shouldnt reset')
 
     assert state.result == result
+
+
+def test_activity_state_counters():
+    """Test the failures and the completion of an activity state are tracked
+    as the states are added.
+    """
+
+    state = activity.ActivityState('id')
+    for current_state in [
+            activity.ACTIVITY_SCHEDULED, activity.ACTIVITY_FAILED,
+            activity.ACTIVITY_SCHEDULED, activity.ACTIVITY_FAILED,
+            activity.ACTIVITY_SCHEDULED]:
+        state.add_state(current_state)
+
+    assert activity.count_activity_failures(state) == 2
+    assert not state.completed
+
+    state.add_state(activity.ACTIVITY_COMPLETED)
+    assert state.completed
+    assert state.ready
+    assert list(state.states)[-2:] == [
+        activity.ACTIVITY_SCHEDULED, activity.ACTIVITY_COMPLETED]
+
+    loaded_state = activity.ActivityState.from_dict(state.to_dict())
+    assert loaded_state.failures == 2
+    assert loaded_state.completed
+
+    # Activity states have no attribute dictionary.
+    with pytest.raises(AttributeError):
+        state.other = 1
+
+
+def test_activity_state_raw_result():
+    """Test the result of an activity state is decoded when accessed, and not
+    kept when it is larger than the maximum size.
+    """
+
+    state = activity.ActivityState('id')
+    state.add_state(activity.ACTIVITY_COMPLETED)
+    state.set_raw_result('{"k": "v"}', max_size=100)
+    assert state.result == {'k': 'v'}
+    assert state.raw_result is None
+
+    with pytest.raises(Exception):
+        state.set_raw_result('{}')
+
+    state = activity.ActivityState('id')
+    state.add_state(activity.ACTIVITY_COMPLETED)
+    state.set_raw_result('{"k": "v"}', max_size=5)
+    assert state.raw_result is None
+    with pytest.raises(activity.ActivityResultDiscardedException):
+        state.result
+
+    state = activity.ActivityState('id')
+    state.add_state(activity.ACTIVITY_COMPLETED)
+    state.set_raw_result(None)
+    assert state.result == {}
+
+
+def test_find_context_keys(monkeypatch):
+    """Test finding the values of the context needed by the activities.
+    """
+
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    create = activity.create('domain_name', 'flow_name')
+
+    @task.decorate()
+    def local_task(value):
+        pass
+
+    @generator.requires('context.countries')
+    def country_generator(context):
+        for country in context.get('context.countries'):
+            yield {'generator.country': country}
+
+    def undecorated_generator(context):
+        yield {}
+
+    @task.list
+    def task_list(context):
+        yield local_task.fill(value='context.list')
+
+    activity_1 = create(
+        name='activity_1', generators=[country_generator],
+        run=runner.Sync(local_task.fill(value='context.value')))
+    assert activity.find_context_keys(
+        activity.CompiledFlow([activity_1])) == set([
+            'context.countries', 'context.value'])
+
+    activity_2 = create(
+        name='activity_2', generators=[undecorated_generator],
+        run=runner.Sync(local_task.fill(value='context.value')))
+    assert activity.find_context_keys(
+        activity.CompiledFlow([activity_1, activity_2])) is None
+
+    activity_3 = create(name='activity_3', run=runner.Sync(task_list))
+    assert activity.find_context_keys(
+        activity.CompiledFlow([activity_1, activity_3])) is None
+
+
+def test_compile_flow():
+    """Test the compilation of a flow.
+    """
+
+    from tests.fixtures.flows import example
+
+    compiled_flow = activity.compile_flow(example)
+    assert activity.compile_flow(compiled_flow) is compiled_flow
+    assert len(compiled_flow.activities) == 4
+    assert compiled_flow.requires[example.activity_4.name] == [
+        example.activity_3.name, example.activity_2.name]
+    assert sorted(compiled_flow.dependents[example.activity_1.name]) == [
+        example.activity_2.name, example.activity_3.name]
+
+    order = compiled_flow.order
+    assert order[0] == example.activity_1.name
+    assert order[-1] == example.activity_4.name
+
+
+def test_compile_flow_with_cycle(monkeypatch):
+    """Test the compilation of a flow that has a cycle.
+    """
+
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    create = activity.create('domain_name', 'flow_name')
+
+    activity_1 = create(name='activity_1')
+    activity_2 = create(name='activity_2', requires=[activity_1])
+    activity_1.requires = [activity_2]
+
+    with pytest.raises(activity.FlowCycleException):
+        activity.CompiledFlow([activity_1, activity_2])
+
+
+def test_load_compiled_flow():
+    """Test a compiled flow can be serialized and loaded.
+    """
+
+    from tests.fixtures.flows import example
+
+    compiled_flow = activity.compile_flow(example)
+    data = json.loads(json.dumps(compiled_flow.to_dict()))
+
+    loaded_flow = activity.CompiledFlow.from_dict(example, data)
+    assert loaded_flow.activities == compiled_flow.activities
+    assert loaded_flow.requires == compiled_flow.requires
+    assert loaded_flow.order == compiled_flow.order
+
+    data['activities'][0]['name'] = 'unknown'
+    with pytest.raises(activity.CompiledFlowMismatchException):
+        activity.CompiledFlow.from_dict(example, data)
+
+
+def test_load_compiled_flow_added_activity(monkeypatch):
+    """Test a compiled flow cannot be loaded if an activity has been added to
+    the flow since it was compiled.
+    """
+
+    from tests.fixtures.flows import example
+
+    data = json.loads(json.dumps(activity.compile_flow(example).to_dict()))
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    create = activity.create(example.domain, example.name)
+    monkeypatch.setattr(
+        example, 'activity_added', create(name='activity_added'),
+        raising=False)
+
+    with pytest.raises(activity.CompiledFlowMismatchException):
+        activity.CompiledFlow.from_dict(example, data)
+
+
+def test_instances_pages(monkeypatch, generators):
+    """Test getting a page of the instances of an activity.
+    """
+
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    current_activity = activity.Activity()
+    current_activity.generators = generators
+
+    total = pow(10, len(generators))
+    assert current_activity.count_instances(dict()) == total
+
+    instances = list(current_activity.instances(dict()))
+    page = list(current_activity.instances(dict(), offset=5, limit=3))
+    assert [instance.id for instance in page] == [
+        instance.id for instance in instances[5:8]]
+    assert all(instance.pool_size == total for instance in page)
+
+
+def test_max_in_flight(monkeypatch):
+    """Test the instances of an activity are scheduled by windows.
+    """
+
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    create = activity.create('domain_name', 'flow_name')
+
+    def igenerator(context):
+        for i in range(10):
+            yield {'i': i}
+
+    activity_1 = create(
+        name='activity_1', generators=[igenerator], max_in_flight=3,
+        run=runner.Sync())
+    activity_2 = create(
+        name='activity_2', requires=[activity_1], run=runner.Sync())
+    compiled_flow = activity.CompiledFlow([activity_1, activity_2])
+
+    state = event.HistoryState(compiled_flow)
+    scheduled = []
+
+    def add_events(instances, event_type):
+        for instance in instances:
+            event_id = state.last_event_id + 1
+            if event_type == 'ActivityTaskScheduled':
+                scheduled.append(event_id)
+                attributes = dict(
+                    activityId=instance.id,
+                    activityType=dict(name=instance.activity_name))
+            else:
+                attributes = dict(
+                    scheduledEventId=scheduled[len(scheduled) - len(
+                        instances) + instances.index(instance)])
+            key = event_type[0].lower() + event_type[1:] + 'EventAttributes'
+            state.add(dict(
+                eventId=event_id, eventType=event_type,
+                **{key: attributes}))
+
+    def available(**kwargs):
+        return list(activity.find_available_activities(
+            compiled_flow, state.activity_states, dict(),
+            ready_set=state.ready_set, **kwargs))
+
+    instances = available()
+    assert len(instances) == 3
+    assert all(
+        instance.activity_worker is activity_1 for instance in instances)
+    assert instances[0].schedule_to_start == (
+        3 * activity.DEFAULT_ACTIVITY_SCHEDULE_TO_START)
+
+    add_events(instances, 'ActivityTaskScheduled')
+    assert not available()
+
+    # All the instances in the history have completed, but the activity
+    # requiring them is not available until all instances are completed.
+    add_events(instances, 'ActivityTaskCompleted')
+    assert state.ready_set.is_completed(activity_1.name)
+    instances = available(max_in_flight=2)
+    assert len(instances) == 2
+
+    windows = 0
+    while instances[0].activity_worker is activity_1:
+        windows += 1
+        add_events(instances, 'ActivityTaskScheduled')
+        add_events(instances, 'ActivityTaskCompleted')
+        instances = available()
+
+    assert windows == 3
+    assert len(instances) == 1
+    assert instances[0].activity_worker is activity_2
+
+
+def test_activity_instance_plan(monkeypatch):
+    """Test the scheduling plan of an activity instance.
+    """
+
+    spy = MagicMock()
+
+    @task.decorate(timeout=10)
+    def task_a(value):
+        pass
+
+    @task.list
+    def task_list(context):
+        spy()
+        yield task_a.fill(value='context')
+
+    activity_mock = MagicMock()
+    activity_mock.max_in_flight = None
+    activity_mock.schedule_to_start_timeout = 100
+    activity_mock.runner = runner.Sync(task_list)
+    activity_mock.claim_check = None
+    activity_mock.compression = None
+    instance = activity.ActivityInstance(
+        activity_mock, local_context=dict(context='yes'), pool_size=2)
+
+    plan = instance.plan
+    assert instance.plan is plan
+    assert plan.timeout == 10
+    assert plan.heartbeat_timeout == 10
+    assert plan.schedule_to_start == 200
+    assert plan.schedule_to_close == 210
+    assert json.loads(plan.input).get('context') == 'yes'
+
+    # The task list is only flattened once for the timeouts and the input.
+    assert spy.call_count == 1
+
+
+def test_activity_instance_plan_with_custom_runner():
+    """Test the scheduling plan of an instance uses the timeouts of a runner
+    that overrides them.
+    """
+
+    @task.decorate(timeout=10)
+    def task_a(value):
+        pass
+
+    class CustomRunner(runner.Sync):
+
+        def timeout(self, context):
+            return 42
+
+        def heartbeat(self, context):
+            return 21
+
+    activity_mock = MagicMock()
+    activity_mock.max_in_flight = None
+    activity_mock.schedule_to_start_timeout = 100
+    activity_mock.runner = CustomRunner(task_a.fill(value='context'))
+    activity_mock.claim_check = None
+    activity_mock.compression = None
+    instance = activity.ActivityInstance(
+        activity_mock, local_context=dict(context='yes'))
+
+    assert instance.timeout == 42
+    assert instance.plan.timeout == 42
+    assert instance.plan.heartbeat_timeout == 21
+    assert instance.plan.schedule_to_close == 142
+    assert json.loads(instance.plan.input).get('context') == 'yes'
+
+
+def test_activity_instance_task_list_context():
+    """Test the task lists receive the context of an instance as a dict.
+    """
+
+    @task.decorate()
+    def task_a(value):
+        pass
+
+    @task.list
+    def task_list(context):
+        assert isinstance(context, dict)
+        context = context.copy()
+        context.update(json.loads(json.dumps(context)))
+        context['value'] = 'list'
+        yield task_a.fill(value='value')
+
+    activity_mock = MagicMock()
+    activity_mock.max_in_flight = None
+    activity_mock.schedule_to_start_timeout = 100
+    activity_mock.runner = runner.Sync(task_list)
+    activity_mock.claim_check = None
+    activity_mock.compression = None
+    execution_context = dict(value='execution')
+    instance = activity.ActivityInstance(
+        activity_mock, local_context=dict(context='yes'),
+        execution_context=execution_context)
+
+    assert json.loads(instance.plan.input).get('value') == 'execution'
+    assert execution_context == dict(value='execution')
+
+
+def test_input_encoder():
+    """Test the input encoder encodes the shared values once, and encodes the
+    inputs exactly as json.dumps.
+    """
+
+    shared = dict(items=list(range(10)), name=u'caf\xe9')
+    encoder = activity.InputEncoder(shared)
+
+    inputs = [
+        dict(shared),
+        dict(shared, value=1),
+        dict(shared, items=[1]),
+        dict()]
+    for activity_input in inputs:
+        assert encoder.encode(activity_input) == json.dumps(activity_input)
+
+    assert sorted(encoder.fragments) == ['items', 'name']
+    assert encoder.fragments['items'] == json.dumps(
+        dict(items=shared['items']))[1:-1]
+
+
+def test_activity_instances_share_execution_context():
+    """Test the instances do not copy the execution context.
+    """
+
+    activity_mock = MagicMock()
+    execution_context = dict(('key_{}'.format(i), i) for i in range(100))
+    instances = [
+        activity.ActivityInstance(
+            activity_mock, local_context=dict(index=i),
+            execution_context=execution_context)
+        for i in range(3)]
+
+    for index, instance in enumerate(instances):
+        assert instance.global_context.execution_context is execution_context
+        assert instance.global_context['index'] == index
+        assert instance.global_context['key_5'] == 5
+        assert not hasattr(instance, '__dict__')
+
+
+def test_run_activity_with_claim_check(monkeypatch, tmpdir):
+    """Run an activity that offloads its large values.
+    """
+
+    from garcon import blob
+
+    claim_check = blob.ClaimCheck(
+        blob.FileBlobStore(str(tmpdir)), threshold=100)
+    large_value = ['value'] * 100
+    reference = claim_check.offload(dict(large=large_value))['large']
+
+    execute = MagicMock(return_value=dict(result=list(large_value)))
+    current_activity = activity_run(
+        monkeypatch, poll=dict(
+            activityId='id', input=json.dumps(dict(large=reference))),
+        execute=execute)
+    current_activity.claim_check = claim_check
+    current_activity.run()
+
+    assert execute.call_args[0][0] == dict(large=large_value)
+    result = current_activity.complete.call_args[1].get('result')
+    assert json.loads(result) == dict(result=reference)
+
+
+def test_generators_with_claim_check(monkeypatch, tmpdir):
+    """Test the generators read the values offloaded to the blob store.
+    """
+
+    from garcon import blob
+
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    claim_check = blob.ClaimCheck(
+        blob.FileBlobStore(str(tmpdir)), threshold=100)
+    large_value = list(range(50))
+    context = claim_check.offload(dict(values=large_value))
+    assert blob.is_reference(context['values'])
+
+    def value_generator(context):
+        for value in context.get('values'):
+            yield {'generator.value': value}
+
+    create = activity.create('domain', 'flow', claim_check=claim_check)
+    current_activity = create(
+        name='activity', generators=[value_generator],
+        run=runner.Sync(lambda context, activity: None))
+
+    assert current_activity.count_instances(context) == 50
+    instances = list(current_activity.instances(context))
+    assert [
+        instance.local_context['generator.value']
+        for instance in instances] == large_value
+
+    # The instances keep the references.
+    assert instances[0].execution_context is context
+
+
+def test_activity_instance_plan_with_claim_check(monkeypatch, tmpdir):
+    """Test the large values of the input of an instance are offloaded.
+    """
+
+    from garcon import blob
+
+    activity_mock = MagicMock()
+    activity_mock.max_in_flight = None
+    activity_mock.schedule_to_start_timeout = 100
+    activity_mock.runner = runner.Sync(lambda context: None)
+    activity_mock.claim_check = blob.ClaimCheck(
+        blob.FileBlobStore(str(tmpdir)), threshold=100)
+    activity_mock.compression = None
+    instance = activity.ActivityInstance(
+        activity_mock, execution_context=dict(large=['value'] * 100))
+
+    plan_input = json.loads(instance.plan.input)
+    assert blob.is_reference(plan_input['large'])
+    assert activity_mock.claim_check.resolve(plan_input) == dict(
+        large=['value'] * 100)
+
+
+def test_run_activity_with_compression(monkeypatch):
+    """Run an activity that receives and returns compressed payloads.
+    """
+
+    from garcon import codec
+
+    values = dict(values=['value'] * 1000)
+    execute = MagicMock(return_value=values)
+    current_activity = activity_run(
+        monkeypatch, poll=dict(
+            activityId='id',
+            input=codec.encode(values, compression='zlib')),
+        execute=execute)
+    current_activity.compression = 'zlib'
+    current_activity.run()
+
+    assert execute.call_args[0][0] == values
+    result = current_activity.complete.call_args[1].get('result')
+    assert result.startswith('garcon.zlib:')
+
+    state = activity.ActivityState('id')
+    state.add_state(activity.ACTIVITY_SCHEDULED)
+    state.add_state(activity.ACTIVITY_COMPLETED)
+    state.set_raw_result(result)
+    assert state.result == values
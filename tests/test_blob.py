@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+try:
+    from unittest.mock import MagicMock
+except:
+    from mock import MagicMock
+import json
+import os
+import pytest
+
+from garcon import blob
+
+
+def test_file_blob_store(tmpdir):
+    """Test the blobs are stored in files.
+    """
+
+    store = blob.FileBlobStore(str(tmpdir.join('blobs')))
+    store.put('abcdef', b'data')
+    assert store.get('abcdef') == b'data'
+    assert os.path.exists(str(tmpdir.join('blobs', 'ab', 'abcdef')))
+
+    # A blob is never replaced.
+    store.put('abcdef', b'other')
+    assert store.get('abcdef') == b'data'
+
+    with pytest.raises(blob.BlobNotFoundException):
+        store.get('unknown')
+
+
+def test_offload_and_resolve(tmpdir):
+    """Test the large values are replaced by references, and resolved.
+    """
+
+    store = blob.FileBlobStore(str(tmpdir))
+    claim_check = blob.ClaimCheck(store, threshold=100)
+
+    large_value = ['value'] * 100
+    values = dict(small='value', large=large_value, other=list(large_value))
+    offloaded = claim_check.offload(values)
+
+    assert offloaded['small'] == 'value'
+    assert blob.is_reference(offloaded['large'])
+    assert len(json.dumps(offloaded)) < len(json.dumps(large_value))
+
+    # Identical values are only stored once.
+    assert offloaded['large'] == offloaded['other']
+    assert claim_check.offload(offloaded) == offloaded
+
+    other_claim_check = blob.ClaimCheck(store)
+    assert other_claim_check.resolve(offloaded) == values
+
+
+def test_resolve_from_cache():
+    """Test the values in the cache are not loaded from the store again.
+    """
+
+    store = MagicMock()
+    claim_check = blob.ClaimCheck(store, threshold=0, cache_size=1)
+    first = claim_check.offload(dict(key='first'))
+    second = claim_check.offload(dict(key='second'))
+    assert store.put.call_count == 2
+
+    assert claim_check.resolve(second) == dict(key='second')
+    assert not store.get.called
+
+    store.get.return_value = b'"first"'
+    assert claim_check.resolve(first) == dict(key='first')
+    assert store.get.call_count == 1
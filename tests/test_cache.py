@@ -0,0 +1,66 @@
+from __future__ import absolute_import
+try:
+    from unittest.mock import MagicMock
+except:
+    from mock import MagicMock
+
+from garcon import cache
+
+
+def test_cache_get_and_set():
+    """Test setting and getting a state from the cache.
+    """
+
+    state_cache = cache.StateCache()
+    state = MagicMock()
+
+    assert not state_cache.get('workflow_id', 'run_id')
+    state_cache.set('workflow_id', 'run_id', state)
+    assert state_cache.get('workflow_id', 'run_id') is state
+    assert not state_cache.get('workflow_id', 'other_run_id')
+
+    state_cache.remove('workflow_id', 'run_id')
+    assert not state_cache.get('workflow_id', 'run_id')
+
+
+def test_cache_lru_eviction():
+    """Test the least recently used runs are evicted first.
+    """
+
+    state_cache = cache.StateCache(max_size=2)
+    state_cache.set('workflow_id', 'run_1', 1)
+    state_cache.set('workflow_id', 'run_2', 2)
+
+    # Access the first run so the second one becomes the least recently used.
+    assert state_cache.get('workflow_id', 'run_1') == 1
+    state_cache.set('workflow_id', 'run_3', 3)
+
+    assert len(state_cache) == 2
+    assert state_cache.get('workflow_id', 'run_1') == 1
+    assert not state_cache.get('workflow_id', 'run_2')
+    assert state_cache.get('workflow_id', 'run_3') == 3
+
+
+def test_cache_ttl(monkeypatch):
+    """Test expired entries are not returned.
+    """
+
+    state_cache = cache.StateCache(ttl=10)
+    monkeypatch.setattr(cache.time, 'time', MagicMock(return_value=100))
+    state_cache.set('workflow_id', 'run_id', 1)
+
+    monkeypatch.setattr(cache.time, 'time', MagicMock(return_value=105))
+    assert state_cache.get('workflow_id', 'run_id') == 1
+
+    monkeypatch.setattr(cache.time, 'time', MagicMock(return_value=200))
+    assert not state_cache.get('workflow_id', 'run_id')
+    assert not len(state_cache)
+
+
+def test_disabled_cache():
+    """Test a cache without size does not keep anything.
+    """
+
+    state_cache = cache.StateCache(max_size=0)
+    state_cache.set('workflow_id', 'run_id', 1)
+    assert not state_cache.get('workflow_id', 'run_id')
@@ -0,0 +1,116 @@
+from __future__ import absolute_import
+import json
+import pytest
+
+from garcon import codec
+from tests.fixtures import decider as decider_events
+
+
+PAYLOADS = [
+    '{}',
+    '[]',
+    '{"a": 1, "b": [true, false, null], "c": {"d": "e"}}',
+    '{"b": 1, "a": 2}',
+    '{"a": 1, "a": 2}',
+    '{"unicode": "caf\\u00e9 \\ud83d\\ude00", "raw": "\u00e9"}',
+    '{"escapes": "\\"\\\\\\/\\b\\f\\n\\r\\t"}',
+    '[0.1, 1e-07, 1.0000000000000002, 1e+308, -0.0, 5e-324, 3.0]',
+    '[9223372036854775807, -9223372036854775808, 18446744073709551615]',
+    '[18446744073709551616, -9223372036854775809, 1180591620717411303424]',
+    '[NaN, Infinity, -Infinity]',
+    '"string"',
+    '  {"spaces" :  [1 , 2]}  ',
+    json.dumps(decider_events.history),
+]
+
+
+@pytest.fixture(params=sorted(codec.BACKENDS))
+def backend(request):
+    previous = codec.backend
+    codec.set_backend(request.param)
+    request.addfinalizer(lambda: codec.set_backend(previous))
+    return request.param
+
+
+def test_loads_is_compatible(backend):
+    """Test the backends decode the payloads as the standard library.
+    """
+
+    for payload in PAYLOADS:
+        value = codec.loads(payload)
+        assert json.dumps(value) == json.dumps(json.loads(payload))
+
+
+def test_dumps_is_compatible(backend):
+    """Test the backends encode the values exactly as the standard library.
+    """
+
+    for payload in PAYLOADS:
+        value = json.loads(payload)
+        assert codec.dumps(value) == json.dumps(value)
+        assert codec.dumps(codec.loads(codec.dumps(value))) == json.dumps(
+            value)
+
+
+def test_invalid_payloads(backend):
+    """Test the invalid payloads raise the errors of the standard library.
+    """
+
+    for payload in ['', '{', '{"a": }', '[1, 2']:
+        with pytest.raises(ValueError):
+            codec.loads(payload)
+
+
+def test_unknown_backend():
+    """Test the backends that are not available are rejected.
+    """
+
+    with pytest.raises(codec.UnknownBackendException):
+        codec.set_backend('unknown')
+
+
+def test_compress_large_payloads():
+    """Test the payloads above the threshold are compressed and tagged.
+    """
+
+    value = dict(values=['value'] * 1000)
+    payload = codec.encode(value, compression='zlib')
+    assert payload.startswith('garcon.zlib:')
+    assert len(payload) < len(json.dumps(value))
+    assert codec.decode(payload) == value
+
+
+def test_compress_small_payloads():
+    """Test the payloads that are small (or not compressible) are unchanged.
+    """
+
+    value = dict(value='small')
+    assert codec.encode(value, compression='zlib') == json.dumps(value)
+    assert codec.encode(value) == json.dumps(value)
+
+    # Compression is disabled by default.
+    value = dict(values=['value'] * 1000)
+    assert codec.encode(value) == json.dumps(value)
+    assert codec.decode(json.dumps(value)) == value
+
+
+def test_unknown_compression():
+    """Test the algorithms that are not available are rejected.
+    """
+
+    with pytest.raises(codec.UnknownCompressionException):
+        codec.compress('x' * 2000, compression='unknown')
+
+    with pytest.raises(codec.UnknownCompressionException):
+        codec.decompress('garcon.unknown:abc')
+
+
+@pytest.mark.skipif(not codec.zstandard, reason='zstandard is not installed')
+def test_zstd_compression():
+    """Test the payloads can be compressed with zstd.
+    """
+
+    value = dict(values=['value'] * 1000)
+    payload = codec.encode(value, compression='zstd')
+    assert payload.startswith('garcon.zstd:')
+    assert codec.decode(payload) == value
@@ -4,6 +4,8 @@ try:
 except:
     from mock import MagicMock
 import boto.swf.layer2 as swf
+import json
+import pytest
 
 from garcon import context
 from tests.fixtures import decider as decider_events
@@ -51,3 +53,91 @@ def test_get_workflow_execution_info(monkeypatch):
         'execution.domain': 'dev',
         'execution.run_id': '123abc=',
         'execution.workflow_id': 'test-workflow-id'}
+
+
+def test_projected_context(monkeypatch):
+    """Check only the values needed are kept in a projected context.
+    """
+
+    mock(monkeypatch)
+    current_context = context.ExecutionContext(keys=set(['k', 'other']))
+    current_context.add_result({'k': 'v', 'unused': 'value'})
+    assert current_context.current == {'k': 'v'}
+
+    current_context.set_execution_input(dict(
+        workflowExecutionStartedEventAttributes=dict(
+            input='{"other": 1, "unused_input": 2}')))
+    assert current_context.current == {'k': 'v', 'other': 1}
+    assert current_context.workflow_input == {'other': 1, 'unused_input': 2}
+
+    assert current_context.covers(set(['k']))
+    assert not current_context.covers(set(['unused']))
+    assert not current_context.covers(None)
+    assert context.ExecutionContext().covers(None)
+
+    loaded_context = context.ExecutionContext.from_dict(
+        current_context.to_dict())
+    assert loaded_context.keys == current_context.keys
+    assert loaded_context.current == current_context.current
+
+
+def test_projected_context_without_keys(monkeypatch):
+    """Check the results are not decoded when no values are needed.
+    """
+
+    mock(monkeypatch)
+    loads = MagicMock()
+    monkeypatch.setattr(context.codec, 'decode', loads)
+
+    current_context = context.ExecutionContext(keys=set())
+    current_context.add_activity_result(dict(
+        activityTaskCompletedEventAttributes=dict(result='{"k": "v"}')))
+    assert not current_context.current
+    assert not loads.called
+
+
+def test_context_view():
+    """Check the view of a local context over an execution context.
+    """
+
+    execution_context = {'a': 1, 'b': 2}
+    local_context = {'b': 3, 'c': 4}
+    view = context.ContextView(execution_context, local_context)
+
+    assert view['a'] == 1
+    assert view['b'] == 3
+    assert view.get('c') == 4
+    assert view.get('d', 5) == 5
+    assert 'c' in view and 'd' not in view
+    assert len(view) == 3
+    assert list(view.items()) == list(
+        dict(execution_context, **local_context).items())
+    assert dict(view) == {'a': 1, 'b': 3, 'c': 4}
+
+    # The view does not copy the execution context.
+    execution_context['d'] = 6
+    assert view['d'] == 6
+
+    with pytest.raises(TypeError):
+        view['e'] = 7
+
+
+def test_compressed_payloads(monkeypatch):
+    """Check the compressed inputs and results are decoded.
+    """
+
+    from garcon import codec
+
+    mock(monkeypatch)
+    values = dict(('key_{}'.format(i), 'value') for i in range(200))
+    payload = codec.encode(values, compression='zlib')
+    assert payload != json.dumps(values)
+
+    current_context = context.ExecutionContext()
+    current_context.set_execution_input(dict(
+        workflowExecutionStartedEventAttributes=dict(input=payload)))
+    current_context.add_activity_result(dict(
+        activityTaskCompletedEventAttributes=dict(
+            result=codec.encode(dict(result=1), compression='zlib'))))
+    assert current_context.workflow_input == values
+    assert current_context.current == dict(values, result=1)
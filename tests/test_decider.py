@@ -5,10 +5,20 @@ except:
     from mock import MagicMock
 import boto.swf.layer2 as swf
 import json
+import os
 import pytest
+import threading
+import time
+import types
 
 from garcon import decider
 from garcon import activity
+from garcon import codec
+from garcon import event
+from garcon import generator
+from garcon import registration
+from garcon import runner
+from garcon import snapshot
 from tests.fixtures import decider as decider_events
 
 
@@ -17,6 +27,8 @@ def mock(monkeypatch):
         monkeypatch.setattr(base, '__init__', MagicMock(return_value=None))
         if base is not swf.Decider:
             monkeypatch.setattr(base, 'register', MagicMock())
+    monkeypatch.setattr(
+        registration.Registration, 'list_types', MagicMock(return_value=set()))
 
 
 def test_create_decider(monkeypatch):
@@ -32,6 +44,9 @@ def test_create_decider(monkeypatch):
     assert d.domain
     assert d.on_exception
 
+    # The default decider does not keep the results of the activities.
+    assert d.max_result_size == 0
+
     monkeypatch.setattr(decider.DeciderWorker, 'register', MagicMock())
     d = decider.DeciderWorker(example)
     assert d.register.called
@@ -287,6 +302,36 @@ def test_schedule_with_completed_activity(monkeypatch):
     resp.result.get('foo')
 
 
+def test_schedule_with_discarded_result(monkeypatch):
+    """Test the scheduling of an activity whose result has not been kept.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    monkeypatch.setattr(decider, 'schedule_activity_task', MagicMock())
+
+    schedule_context = decider.ScheduleContext()
+    instance_state = activity.ActivityState('activity_1')
+    instance_state.add_state(activity.ACTIVITY_COMPLETED)
+    instance_state.set_raw_result('{"k": "v"}', max_size=1)
+    current_activity = example.activity_1
+    history = {
+        current_activity.name: {
+            'workflow_name_activity_1-1-schedule_id': instance_state
+        }
+    }
+
+    resp = decider.schedule(
+        MagicMock(), schedule_context, history, {}, 'schedule_id',
+        current_activity)
+
+    assert resp.get_last_state() == activity.ACTIVITY_COMPLETED
+    assert resp.result == {}
+    assert resp.result_discarded
+    assert schedule_context.completed
+
+
 def test_schedule_requires_with_incomplete_activities():
     """Test the scheduler.
     """
@@ -368,3 +413,738 @@ def test_schedule_activity_task_with_version(monkeypatch):
         start_to_close_timeout=str(instance.timeout),
         schedule_to_start_timeout=str(instance.schedule_to_start),
         schedule_to_close_timeout=str(instance.schedule_to_close))
+
+
+def test_history_state_incremental(monkeypatch):
+    """Test the history state only consumes the new events.
+    """
+
+    events = decider_events.history.get('events')
+
+    state = event.HistoryState()
+    state.add_events(events[:14])
+    assert state.last_event_id == 14
+    state.add_events(events)
+    assert state.last_event_id == events[-1]['eventId']
+
+    full_states = event.activity_states_from_events(events)
+    assert set(state.activity_states) == set(full_states)
+    for activity_name, instances in full_states.items():
+        for activity_id, activity_state in instances.items():
+            assert state.activity_states[activity_name][
+                activity_id].states == activity_state.states
+    assert state.context.current == event.get_current_context(
+        events).current
+
+
+def test_get_history_state_uses_cache(monkeypatch):
+    """Test the decider reuses the cached state of an execution.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    poll = dict(decider_events.history)
+
+    d = decider.DeciderWorker(example)
+    first_state = d.get_history_state(poll, [events[:14]])
+    second_state = d.get_history_state(poll, [events[:14], events[14:]])
+
+    assert first_state is second_state
+    assert second_state.last_event_id == events[-1]['eventId']
+
+
+def test_get_history_state_rebuilds_invalid_cache(monkeypatch):
+    """Test the state is rebuilt when the cached state cannot be used.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    poll = dict(decider_events.history)
+
+    d = decider.DeciderWorker(example)
+    first_state = d.get_history_state(poll, [events])
+    second_state = d.get_history_state(poll, [events[:14]])
+
+    assert first_state is not second_state
+    assert second_state.last_event_id == 14
+
+
+def test_get_history_state_page_error(monkeypatch):
+    """Test a page that cannot be retrieved does not leave a partial state in
+    the cache.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    poll = dict(decider_events.history)
+    execution = poll['workflowExecution']
+
+    def pages():
+        yield events[:14]
+        raise Exception('Page cannot be retrieved.')
+
+    d = decider.DeciderWorker(example)
+    d.get_history_state(poll, [events[:6]])
+
+    with pytest.raises(Exception):
+        d.get_history_state(poll, pages())
+    assert not d.state_cache.get(execution['workflowId'], execution['runId'])
+
+    with pytest.raises(Exception):
+        d.get_history_state(poll, pages())
+    assert not d.state_cache.get(execution['workflowId'], execution['runId'])
+
+
+def test_closed_execution_removed_from_cache(monkeypatch):
+    """Test the state of a closed execution is removed from the cache.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    d = decider.DeciderWorker(example)
+    d.poll = MagicMock(return_value=decider_events.history)
+    d.complete = MagicMock()
+    d.run()
+
+    execution = decider_events.history['workflowExecution']
+    assert not d.state_cache.get(
+        execution['workflowId'], execution['runId'])
+
+
+def test_get_history_reverse_order(monkeypatch):
+    """Test the history is retrieved from the newest to the oldest event.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    newest = events[14:][::-1]
+    oldest = events[:14][::-1]
+
+    d = decider.DeciderWorker(example, reverse_history=True)
+    d.poll = MagicMock(return_value={'events': list(oldest)})
+
+    resp = d.get_history({'events': list(newest), 'nextPageToken': 'page'})
+    d.poll.assert_called_with(
+        next_page_token='page', reverse_order=True,
+        maximum_page_size=decider.MAX_HISTORY_PAGE_SIZE)
+
+    event_ids = [evt['eventId'] for evt in resp]
+    assert event_ids == sorted(event_ids)
+    assert event_ids[0] == 1
+
+
+def test_get_history_reverse_order_stops_on_known_event(monkeypatch):
+    """Test the retrieval stops when it reaches an event already known.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    newest = events[10:][::-1]
+
+    d = decider.DeciderWorker(example, reverse_history=True)
+    d.poll = MagicMock()
+
+    resp = d.get_history(
+        {'events': list(newest), 'nextPageToken': 'page'}, known_event_id=14)
+    assert not d.poll.called
+    assert resp[0]['eventId'] == 11
+
+
+def test_get_history_state_rebuilds_partial_history(monkeypatch):
+    """Test the full history is retrieved if the cached state is gone.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    poll = dict(decider_events.history)
+
+    d = decider.DeciderWorker(example, reverse_history=True)
+    d.iter_history = MagicMock(return_value=iter([events]))
+
+    state = d.get_history_state(poll, [events[14:]], known_event_id=14)
+    d.iter_history.assert_called_with(poll)
+    assert state.context.current == {'k': 'v'}
+
+
+def test_history_metrics(monkeypatch):
+    """Test the pages and bytes of the history are reported.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    on_metric = MagicMock()
+    monkeypatch.setattr(example, 'on_metric', on_metric, raising=False)
+
+    d = decider.DeciderWorker(example)
+    d.poll = MagicMock(return_value={'events': events[14:]})
+    d.get_history({'events': events[:14], 'nextPageToken': 'page'})
+
+    metrics = {
+        call[0][1]: call[0][2] for call in on_metric.call_args_list}
+    assert metrics['history.pages'] == 2
+    assert metrics['history.events'] == len(events)
+    assert metrics['history.bytes'] == len(json.dumps(events[:14])) + len(
+        json.dumps(events[14:]))
+
+
+def test_iter_history_streams_pages(monkeypatch):
+    """Test the pages are provided as they are retrieved.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    d = decider.DeciderWorker(example)
+    d.poll = MagicMock(return_value={'events': events[14:]})
+
+    pages = d.iter_history({'events': events[:14], 'nextPageToken': 'page'})
+    assert next(pages) == events[:14]
+    assert next(pages) == events[14:]
+    d.poll.assert_called_once_with(next_page_token='page')
+
+
+def test_history_state_decodes_results_once(monkeypatch):
+    """Test each activity result is only decoded once.
+    """
+
+    events = decider_events.history.get('events')
+    loads = MagicMock(side_effect=codec.loads)
+    monkeypatch.setattr(codec, 'loads', loads)
+
+    state = event.HistoryState()
+    state.add_events(events)
+
+    completed = [
+        evt for evt in events if evt['eventType'] == 'ActivityTaskCompleted']
+    results = [
+        evt for evt in completed
+        if evt['activityTaskCompletedEventAttributes'].get('result')]
+    assert loads.call_count == len(results)
+    assert state.context.current == {'k': 'v'}
+
+    # The decoded results are shared by the context and the activity states.
+    activity_state = state.activity_states['workflow_name_activity_2'][
+        'workflow_name_activity_2-1']
+    assert activity_state.raw_result is None
+    assert activity_state.result == {'k': 'v'}
+    assert loads.call_count == len(results)
+
+    # If the context does not keep any value, the results of the activities
+    # are only decoded when they are accessed.
+    state = event.HistoryState(context_keys=set())
+    state.add_events(events)
+    activity_state = state.activity_states['workflow_name_activity_2'][
+        'workflow_name_activity_2-1']
+    assert activity_state.raw_result == '{"k": "v"}'
+    assert activity_state.result == {'k': 'v'}
+    assert activity_state.result is activity_state.result
+    assert loads.call_count == len(results) + 1
+
+
+def test_generator_values_recorded_as_markers(monkeypatch):
+    """Test the values of the recorded generators are read from the history.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    spy = MagicMock()
+
+    @generator.recorded
+    def igenerator(context):
+        spy()
+        for i in range(3):
+            yield {'i': i}
+
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    create = activity.create('domain_name', 'flow_name')
+    compiled_flow = activity.CompiledFlow([
+        create(name='activity_1', generators=[igenerator],
+            run=runner.Sync())])
+
+    decider_worker = decider.DeciderWorker(
+        example, register=False, compiled_flow=compiled_flow)
+
+    state = event.HistoryState(compiled_flow)
+    decisions = swf.Layer1Decisions()
+    decider_worker.create_decisions_from_flow(
+        decisions, state.activity_states, state.context,
+        ready_set=state.ready_set,
+        recorder=generator.Recorder(state.markers))
+
+    markers = [
+        decision['recordMarkerDecisionAttributes']
+        for decision in decisions._data
+        if decision['decisionType'] == 'RecordMarker']
+    assert len(decisions._data) == 4
+    assert len(markers) == 1
+    assert spy.call_count == 1
+
+    state.add(dict(
+        eventId=1, eventType='MarkerRecorded',
+        markerRecordedEventAttributes=markers[0]))
+    assert state.markers == {
+        markers[0]['markerName']: [{'i': 0}, {'i': 1}, {'i': 2}]}
+
+    decisions = swf.Layer1Decisions()
+    decider_worker.create_decisions_from_flow(
+        decisions, state.activity_states, state.context,
+        ready_set=state.ready_set,
+        recorder=generator.Recorder(state.markers))
+    assert len(decisions._data) == 3
+    assert spy.call_count == 1
+
+
+def test_generator_timing_metrics(monkeypatch):
+    """Test the time taken by each generator is reported.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    decider_worker = decider.DeciderWorker(example)
+    decider_worker.on_metric = MagicMock()
+    evaluator = decider_worker.create_evaluator(
+        dict(workflowExecution=dict(workflowId='id', runId='run')))
+
+    def igenerator(context):
+        yield {'i': 1}
+
+    assert evaluator.result('name', igenerator, dict()) == [{'i': 1}]
+    _, name, value, tags = decider_worker.on_metric.call_args[0]
+    assert name == 'generator.time'
+    assert value >= 0
+    assert tags == dict(workflow_id='id', run_id='run', generator='name')
+
+
+def test_generator_timeout_aborts_decision(monkeypatch):
+    """Test a generator exceeding its timeout aborts the decision without
+    failing the execution.
+    """
+
+    mock(monkeypatch)
+
+    def igenerator(context):
+        time.sleep(0.2)
+        yield {'i': 1}
+
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    flow = types.ModuleType('flow_name')
+    flow.domain = 'domain_name'
+    flow.name = 'flow_name'
+    flow.generator_timeout = 0.01
+    create = activity.create(flow.domain, flow.name)
+    flow.activity_1 = create(
+        name='activity_1', generators=[igenerator], run=runner.Sync())
+
+    d = decider.DeciderWorker(flow, register=False)
+    d.on_metric = MagicMock()
+    d.poll = MagicMock(return_value=decider_events.history)
+    d.complete = MagicMock()
+
+    assert d.run()
+    assert not d.complete.called
+    metrics = [call[0][1] for call in d.on_metric.call_args_list]
+    assert 'generator.timeout' in metrics
+
+
+def test_decider_pool(monkeypatch):
+    """Test the deciders of a pool share the flow and run concurrently.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    identities = set()
+
+    def run(identity=None):
+        identities.add(identity)
+        time.sleep(0.01)
+        return True
+
+    monkeypatch.setattr(decider.DeciderWorker, 'register', MagicMock())
+    pool = decider.DeciderPool(example, size=3)
+    assert len(pool.workers) == 3
+    assert decider.DeciderWorker.register.call_count == 1
+    for worker in pool.workers:
+        assert worker.compiled_flow is pool.compiled_flow
+        assert worker.state_cache is pool.state_cache
+        worker.run = run
+
+    threads = pool.run(identity='host')
+    assert len(threads) == 3
+    pool.stop()
+    assert not any(thread.is_alive() for thread in threads)
+    assert identities == set(['host-0', 'host-1', 'host-2'])
+
+
+def test_decider_runner_survives_errors(monkeypatch):
+    """Test a decider keeps polling after a decision raises an error.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    monkeypatch.setattr(decider, 'RUNNER_BACKOFF', 0)
+    on_exception = MagicMock()
+    d = decider.DeciderWorker(example, register=False)
+    d.on_exception = on_exception
+    error = Exception('Page cannot be retrieved.')
+    d.run = MagicMock(side_effect=[error, True, False])
+
+    decider.decider_runner(d, threading.Event(), identity='decider')
+    assert d.run.call_count == 3
+    on_exception.assert_called_once_with(d, error)
+
+
+def test_get_history_state_resumes_from_snapshot(monkeypatch, tmpdir):
+    """Test a new decider only consumes the events added since the snapshot.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    poll = dict(decider_events.history)
+    execution = poll['workflowExecution']
+    store = snapshot.SnapshotStore(os.path.join(str(tmpdir), 'snapshots.db'))
+
+    d = decider.DeciderWorker(example, snapshot_store=store)
+    state = d.get_history_state(poll, [events[:14]])
+    d.save_snapshot(execution['workflowId'], execution['runId'], state)
+
+    add = MagicMock(side_effect=event.HistoryState.add, autospec=True)
+    monkeypatch.setattr(
+        event.HistoryState, 'add',
+        lambda self, evt: add(self, evt))
+
+    restarted = decider.DeciderWorker(example, snapshot_store=store)
+    state = restarted.get_history_state(poll, [events[:14], events[14:]])
+    assert add.call_count == len(events) - 14
+    assert state.last_event_id == events[-1]['eventId']
+    assert state.ready_set
+
+    restarted.save_snapshot(
+        execution['workflowId'], execution['runId'], state, closing=True)
+    assert not len(store)
+
+
+def test_known_event_id_from_snapshot(monkeypatch, tmpdir):
+    """Test a new decider retrieving the history in reverse order stops at
+    the last event of the snapshot.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    poll = dict(decider_events.history)
+    execution = poll['workflowExecution']
+    store = snapshot.SnapshotStore(os.path.join(str(tmpdir), 'snapshots.db'))
+
+    d = decider.DeciderWorker(example, snapshot_store=store)
+    state = d.get_history_state(poll, [events[:14]])
+    d.save_snapshot(execution['workflowId'], execution['runId'], state)
+
+    restarted = decider.DeciderWorker(
+        example, snapshot_store=store, reverse_history=True)
+    assert restarted.get_known_event_id(poll) == 14
+
+    state = restarted.get_history_state(
+        poll, [events[10:]], known_event_id=14)
+    assert state.last_event_id == events[-1]['eventId']
+
+
+def test_fast_path_for_passive_events(monkeypatch):
+    """Test the decider does not process the history when the events added
+    since the previous decision cannot change the decisions.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    d = decider.DeciderWorker(example)
+    d.complete = MagicMock()
+    d.get_history_state = MagicMock()
+    d.on_metric = MagicMock()
+
+    poll = dict(decider_events.history)
+    poll.update(
+        events=events[:13], previousStartedEventId=9, startedEventId=13)
+    d.poll = MagicMock(return_value=poll)
+    d.run()
+
+    assert not d.get_history_state.called
+    assert d.complete.call_args[1]['decisions']._data == []
+    _, name, value, tags = d.on_metric.call_args[0]
+    assert name == 'decision.fast_path'
+    assert value == 1
+    assert tags['run_id'] == poll['workflowExecution']['runId']
+
+    # An activity has completed since the previous decision.
+    poll.update(
+        events=events[:14], previousStartedEventId=9, startedEventId=14)
+    assert not decider.is_passive(decider.get_new_events(poll))
+
+    # Some of the new events are not in the poll.
+    poll.update(
+        events=events[:12], previousStartedEventId=9, startedEventId=13)
+    assert decider.get_new_events(poll) is None
+
+
+def test_fast_path_with_history_pages(monkeypatch):
+    """Test the decider looks for the new events in all the pages of a
+    history longer than one page.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    events = decider_events.history.get('events')
+    d = decider.DeciderWorker(example)
+    d.complete = MagicMock()
+    d.get_history_state = MagicMock()
+
+    poll = dict(decider_events.history)
+    poll.update(
+        events=events[:5], nextPageToken='token', previousStartedEventId=9,
+        startedEventId=13)
+    d.poll = MagicMock(side_effect=[poll, dict(events=events[5:13])])
+    d.run()
+
+    assert d.poll.call_count == 2
+    assert not d.get_history_state.called
+    assert d.complete.call_args[1]['decisions']._data == []
+
+    # An activity has completed since the previous decision: the pages
+    # already retrieved are used to update the state.
+    poll.update(startedEventId=14)
+    d.poll = MagicMock(side_effect=[poll, dict(events=events[5:14])])
+    d.get_history_state = MagicMock(side_effect=Exception('stop'))
+    with pytest.raises(Exception):
+        d.run()
+
+    assert d.poll.call_count == 2
+    pages = d.get_history_state.call_args[0][1]
+    assert pages == [events[:5], events[5:14]]
+
+
+def test_partial_decisions_when_deadline_is_reached(monkeypatch):
+    """Test the decider stops scheduling once the deadline is reached, and
+    continues in a follow-up decision.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    def igenerator(context):
+        for i in range(3):
+            yield {'i': i}
+
+    monkeypatch.setattr(activity.Activity, '__init__', lambda self: None)
+    create = activity.create('domain_name', 'flow_name')
+    compiled_flow = activity.CompiledFlow([
+        create(name='activity_1', generators=[igenerator],
+            run=runner.Sync())])
+
+    decider_worker = decider.DeciderWorker(
+        example, register=False, compiled_flow=compiled_flow)
+
+    state = event.HistoryState(compiled_flow)
+    decisions = swf.Layer1Decisions()
+    decider_worker.create_decisions_from_flow(
+        decisions, state.activity_states, state.context,
+        ready_set=state.ready_set, deadline=time.time() - 1)
+
+    decision_types = [decision['decisionType'] for decision in decisions._data]
+    assert decision_types == ['ScheduleActivityTask', 'StartTimer']
+    assert decider.is_continued(decisions)
+    assert not decider.is_closing(decisions)
+
+    decisions = swf.Layer1Decisions()
+    decider_worker.create_decisions_from_flow(
+        decisions, state.activity_states, state.context,
+        ready_set=state.ready_set, deadline=time.time() + 60)
+    assert len(decisions._data) == 3
+    assert not decider.is_continued(decisions)
+
+
+def test_decision_budget_metrics(monkeypatch):
+    """Test the decisions that exceed their budget are reported.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    d = decider.DeciderWorker(example)
+    d.complete = MagicMock()
+    d.on_metric = MagicMock()
+    d.poll = MagicMock(return_value=decider_events.history)
+
+    d.run()
+    metrics = [call[0][1] for call in d.on_metric.call_args_list]
+    assert 'decision.time' in metrics
+    assert 'decision.budget_exceeded' not in metrics
+
+    d.decision_budget = 0.000001
+    d.on_metric = MagicMock()
+    d.run()
+    metrics = dict(
+        (call[0][1], call[0][2]) for call in d.on_metric.call_args_list)
+    assert metrics['decision.budget_exceeded'] > 0
+
+
+def test_schedule_many(monkeypatch):
+    """Test the scheduling of an activity for several schedule ids.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    monkeypatch.setattr(decider, 'schedule_activity_task', MagicMock())
+
+    schedule_context = decider.ScheduleContext()
+    completed_state = activity.ActivityState('activity_1')
+    completed_state.add_state(activity.ACTIVITY_SCHEDULED)
+    completed_state.add_state(activity.ACTIVITY_COMPLETED)
+    current_activity = example.activity_1
+    history = {
+        current_activity.name: {
+            'workflow_name_activity_1-1-id_0': completed_state
+        }
+    }
+
+    spy = MagicMock(wraps=current_activity.instances)
+    monkeypatch.setattr(current_activity, 'instances', spy)
+
+    states = decider.schedule_many(
+        MagicMock(), schedule_context, history, {'key': 'value'},
+        [('id_{}'.format(index), None) for index in range(3)] +
+        [('id_3', {'input': 'value'})],
+        current_activity)
+
+    assert len(states) == 4
+    assert states[0].get_last_state() == activity.ACTIVITY_COMPLETED
+    assert states[1].get_last_state() == activity.ACTIVITY_SCHEDULED
+    assert not schedule_context.completed
+
+    # The schedules without input share their instances.
+    assert spy.call_count == 2
+    ids = [
+        call[1]['id'] for call in
+        decider.schedule_activity_task.call_args_list]
+    assert ids == [
+        'workflow_name_activity_1-1-id_1', 'workflow_name_activity_1-1-id_2',
+        'workflow_name_activity_1-1-id_3']
+
+    plans = [
+        call[0][1].plan for call in
+        decider.schedule_activity_task.call_args_list]
+    assert json.loads(plans[0].input) == {'key': 'value'}
+    assert json.loads(plans[2].input) == {'key': 'value', 'input': 'value'}
+
+
+def test_schedule_with_claim_check(monkeypatch, tmpdir):
+    """Test the results of a schedule are resolved from the blob store.
+    """
+
+    from garcon import blob
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    claim_check = blob.ClaimCheck(
+        blob.FileBlobStore(str(tmpdir)), threshold=100)
+    large_value = ['value'] * 100
+    current_activity = example.activity_1
+    monkeypatch.setattr(current_activity, 'claim_check', claim_check)
+
+    completed_state = activity.ActivityState('activity_1')
+    completed_state.add_state(activity.ACTIVITY_SCHEDULED)
+    completed_state.add_state(activity.ACTIVITY_COMPLETED)
+    completed_state.set_result(claim_check.offload(dict(
+        large=large_value, small='value')))
+    history = {
+        current_activity.name: {
+            'workflow_name_activity_1-1-id': completed_state
+        }
+    }
+
+    state = decider.schedule(
+        MagicMock(), decider.ScheduleContext(), history, {}, 'id',
+        current_activity)
+    assert state.result == dict(large=large_value, small='value')
+
+
+def test_schedule_many_shares_instances_by_input(monkeypatch):
+    """Test the schedules share their instances when their inputs have the
+    same values, even if the dict is reused.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    monkeypatch.setattr(decider, 'schedule_activity_task', MagicMock())
+
+    current_activity = example.activity_1
+    spy = MagicMock(wraps=current_activity.instances)
+    monkeypatch.setattr(current_activity, 'instances', spy)
+
+    input = {'input': 'value_1'}
+    ids_and_inputs = [('id_1', input), ('id_2', {'input': 'value_1'})]
+
+    def iter_ids_and_inputs():
+        for schedule_id, schedule_input in ids_and_inputs:
+            yield schedule_id, schedule_input
+        # The same dict, with a different value.
+        input['input'] = 'value_2'
+        yield 'id_3', input
+
+    decider.schedule_many(
+        MagicMock(), decider.ScheduleContext(), {}, {'key': 'value'},
+        iter_ids_and_inputs(), current_activity)
+
+    assert spy.call_count == 2
+    inputs = [
+        json.loads(call[0][1].plan.input)['input'] for call in
+        decider.schedule_activity_task.call_args_list]
+    assert inputs == ['value_1', 'value_1', 'value_2']
+
+
+def test_delegate_decisions_with_schedule_many(monkeypatch):
+    """Test the custom deciders that need it receive schedule_many.
+    """
+
+    mock(monkeypatch)
+    from tests.fixtures.flows import example
+
+    monkeypatch.setattr(decider, 'schedule_activity_task', MagicMock())
+    d = decider.DeciderWorker(example, register=False)
+    context = event.HistoryState().context
+
+    def custom_decider(schedule, schedule_many):
+        schedule_many(
+            [('id_{}'.format(index), None) for index in range(3)],
+            example.activity_1)
+
+    decisions = swf.Layer1Decisions()
+    d.delegate_decisions(decisions, custom_decider, {}, context)
+    assert decider.schedule_activity_task.call_count == 3
+    assert not decider.is_closing(decisions)
@@ -0,0 +1,253 @@
+from __future__ import absolute_import
+try:
+    from unittest.mock import MagicMock
+except:
+    from mock import MagicMock
+import boto.exception as boto_exception
+import boto.swf.layer2 as swf
+import pytest
+import types
+
+from garcon import activity
+from garcon import decider
+from garcon import emulator
+from garcon import runner
+from garcon import task
+
+
+def create_flow(monkeypatch, instances=5):
+    """Create a flow with a fan-out.
+    """
+
+    # Boto needs credentials to create the actors (they are not used.)
+    monkeypatch.setitem(swf.DEFAULT_CREDENTIALS, 'aws_access_key_id', 'key')
+    monkeypatch.setitem(
+        swf.DEFAULT_CREDENTIALS, 'aws_secret_access_key', 'secret')
+
+    @task.decorate()
+    def task_1(activity):
+        return {'task_1.value': 1}
+
+    @task.decorate()
+    def task_2(activity, value, index):
+        return {'task_2.total': value + index}
+
+    def index_generator(context):
+        for index in range(instances):
+            yield {'generator.index': index}
+
+    flow = types.ModuleType('emulated_flow')
+    flow.domain = 'dev'
+    flow.name = 'emulated_flow'
+    create = activity.create(flow.domain, flow.name)
+    flow.activity_1 = create(name='activity_1', run=runner.Sync(task_1.fill()))
+    flow.activity_2 = create(
+        name='activity_2', requires=[flow.activity_1],
+        generators=[index_generator],
+        run=runner.Sync(task_2.fill(
+            value='task_1.value', index='generator.index')))
+    return flow
+
+
+def create_fan_out_flow(monkeypatch, instances=5):
+    """Create a flow with a fan-out followed by an activity that requires it.
+    """
+
+    flow = create_flow(monkeypatch)
+
+    @task.decorate()
+    def task_3(activity, index):
+        return {'task_3.index': index}
+
+    def index_generator(context):
+        for index in range(instances):
+            yield {'generator.index': index}
+
+    create = activity.create(flow.domain, flow.name)
+    flow.activity_1 = create(
+        name='activity_1', generators=[index_generator],
+        run=runner.Sync(task_3.fill(index='generator.index')))
+    flow.activity_2 = create(
+        name='activity_2', requires=[flow.activity_1],
+        run=runner.Sync(task_3.fill(index='generator.index')))
+    return flow
+
+
+def run_flow(flow, swf_emulator, size=2):
+    """Run a flow on the emulator until its execution is closed.
+
+    Return:
+        tuple: the status and the run id of the execution.
+    """
+
+    pool = decider.DeciderPool(flow, size=size, register=False)
+    activity_worker = activity.ActivityWorker(flow)
+    swf_emulator.connect(*pool.workers)
+    swf_emulator.connect(*activity_worker.activities)
+
+    run_id = swf_emulator.start_workflow_execution(
+        flow.domain, 'workflow_id', flow.name, '1.0',
+        input='{"key": "value"}')['runId']
+
+    pool.run()
+    activity_worker.run()
+    try:
+        status = swf_emulator.wait(run_id, timeout=10)
+    finally:
+        pool.stop()
+        activity_worker.stop()
+    return status, run_id
+
+
+def get_scheduled_activities(swf_emulator, run_id):
+    """Get the activity ids of an execution, in the order they were
+    scheduled.
+    """
+
+    return [
+        evt['activityTaskScheduledEventAttributes']['activityId']
+        for evt in swf_emulator.get_execution(run_id).events
+        if evt['eventType'] == 'ActivityTaskScheduled']
+
+
+def test_run_flow(monkeypatch):
+    """Test a flow runs end to end on the emulator.
+    """
+
+    flow = create_flow(monkeypatch)
+    latency = MagicMock(return_value=0)
+    swf_emulator = emulator.Emulator(latency=latency, poll_timeout=0.05)
+    status, run_id = run_flow(flow, swf_emulator)
+
+    assert status == 'WorkflowExecutionCompleted'
+
+    events = swf_emulator.get_execution(run_id).events
+    event_types = [evt['eventType'] for evt in events]
+    assert event_types.count('ActivityTaskCompleted') == 6
+    assert event_types.count('ActivityTaskFailed') == 0
+    assert [evt['eventId'] for evt in events] == list(
+        range(1, len(events) + 1))
+
+    calls = set(call[0][0] for call in latency.call_args_list)
+    assert 'poll_for_decision_task' in calls
+    assert 'respond_activity_task_completed' in calls
+
+
+def test_decision_task_pages(monkeypatch):
+    """Test the history is provided in pages, and the decision tasks of an
+    execution are not provided twice at the same time.
+    """
+
+    swf_emulator = emulator.Emulator(poll_timeout=0.01)
+    run_id = swf_emulator.start_workflow_execution(
+        'dev', 'workflow_id', 'flow', '1.0')['runId']
+
+    decision_task = swf_emulator.poll_for_decision_task('dev', 'flow')
+    assert decision_task['workflowExecution']['runId'] == run_id
+    assert 'events' not in swf_emulator.poll_for_decision_task('dev', 'flow')
+
+    decisions = swf.Layer1Decisions()
+    for index in range(3):
+        decisions.record_marker('marker_{}'.format(index))
+    decisions.start_timer('0', 'timer')
+    swf_emulator.respond_decision_task_completed(
+        decision_task['taskToken'], decisions._data)
+
+    # The timer triggers the next decision task.
+    swf_emulator.poll_timeout = 1
+    decision_task = swf_emulator.poll_for_decision_task(
+        'dev', 'flow', maximum_page_size=5)
+    assert decision_task['previousStartedEventId'] == 3
+    assert len(decision_task['events']) == 5
+
+    events = decision_task['events']
+    page = decision_task
+    while 'nextPageToken' in page:
+        page = swf_emulator.poll_for_decision_task(
+            'dev', 'flow', maximum_page_size=5,
+            next_page_token=page['nextPageToken'])
+        events += page['events']
+    assert events[-1]['eventType'] == 'DecisionTaskStarted'
+    assert events[-3]['eventType'] == 'TimerFired'
+    assert decision_task['startedEventId'] == len(events)
+
+    with pytest.raises(emulator.UnsupportedDecisionException):
+        swf_emulator.respond_decision_task_completed(
+            decision_task['taskToken'], [dict(decisionType='CancelTimer')])
+
+
+def test_closed_execution(monkeypatch):
+    """Test the activity tasks of a closed execution cannot be completed.
+    """
+
+    swf_emulator = emulator.Emulator(poll_timeout=0.01)
+    swf_emulator.start_workflow_execution('dev', 'workflow_id', 'flow', '1.0')
+    decision_task = swf_emulator.poll_for_decision_task('dev', 'flow')
+
+    decisions = swf.Layer1Decisions()
+    decisions.schedule_activity_task(
+        'activity_id', 'activity', '1.0', task_list='activity')
+    swf_emulator.respond_decision_task_completed(
+        decision_task['taskToken'], decisions._data)
+    activity_task = swf_emulator.poll_for_activity_task('dev', 'activity')
+    assert activity_task['activityId'] == 'activity_id'
+
+    decision_task = swf_emulator.poll_for_decision_task('dev', 'flow')
+    assert 'events' not in decision_task
+
+    swf_emulator.record_activity_task_heartbeat(activity_task['taskToken'])
+    swf_emulator.respond_activity_task_failed(
+        activity_task['taskToken'], reason='failure')
+    decision_task = swf_emulator.poll_for_decision_task('dev', 'flow')
+    decisions = swf.Layer1Decisions()
+    decisions.schedule_activity_task(
+        'activity_id', 'activity', '1.0', task_list='activity')
+    decisions.fail_workflow_execution(reason='failure')
+    swf_emulator.respond_decision_task_completed(
+        decision_task['taskToken'], decisions._data)
+
+    # The activity was scheduled again before the execution failed.
+    assert swf_emulator.poll_for_activity_task('dev', 'activity') == dict(
+        startedEventId=0)
+    assert swf_emulator.wait(
+        decision_task['workflowExecution']['runId']) == (
+            'WorkflowExecutionFailed')
+
+    with pytest.raises(boto_exception.SWFResponseError):
+        swf_emulator.respond_activity_task_completed(
+            activity_task['taskToken'])
+
+
+def test_capped_requirement(monkeypatch):
+    """Test an activity waits for all the instances of the activity it
+    requires when the execution has a maximum number of instances in flight.
+    """
+
+    flow = create_fan_out_flow(monkeypatch)
+    flow.max_in_flight = 2
+    swf_emulator = emulator.Emulator(poll_timeout=0.05)
+    status, run_id = run_flow(flow, swf_emulator, size=1)
+
+    assert status == 'WorkflowExecutionCompleted'
+    scheduled = get_scheduled_activities(swf_emulator, run_id)
+    assert len(scheduled) == 6
+    assert scheduled[-1] == flow.activity_2.name + '-1'
+
+
+def test_requirement_cut_by_budget(monkeypatch):
+    """Test an activity waits for all the instances of the activity it
+    requires when the decisions run out of time.
+    """
+
+    flow = create_fan_out_flow(monkeypatch)
+    flow.decision_budget = 1e-9
+    swf_emulator = emulator.Emulator(poll_timeout=0.05)
+    status, run_id = run_flow(flow, swf_emulator, size=1)
+
+    assert status == 'WorkflowExecutionCompleted'
+    events = swf_emulator.get_execution(run_id).events
+    assert [evt['eventType'] for evt in events].count('TimerFired') >= 1
+
+    scheduled = get_scheduled_activities(swf_emulator, run_id)
+    assert len(scheduled) == 6
+    assert scheduled[-1] == flow.activity_2.name + '-1'
@@ -0,0 +1,201 @@
+from __future__ import absolute_import
+try:
+    from unittest.mock import MagicMock
+except:
+    from mock import MagicMock
+from concurrent.futures import ThreadPoolExecutor
+import json
+import pytest
+import threading
+import time
+
+from garcon import generator
+
+
+def test_countable_generator():
+    """Test a countable generator is not consumed to be counted.
+    """
+
+    spy = MagicMock()
+
+    @generator.countable(lambda context: context.get('total'))
+    def countable_generator(context):
+        spy()
+        for i in range(context.get('total')):
+            yield {'i': i}
+
+    context = dict(total=5)
+    assert generator.get_count(countable_generator)(context) == 5
+    assert generator.count([countable_generator], context) == 5
+    assert not spy.called
+
+
+def test_count_generators():
+    """Test counting the combinations of generators.
+    """
+
+    def igenerator(context):
+        for i in range(10):
+            yield {'i': i}
+
+    @generator.countable(lambda context: 3)
+    def dgenerator(context):
+        for d in range(3):
+            yield {'d': d}
+
+    assert generator.count([], dict()) == 1
+    assert generator.count([igenerator, dgenerator], dict()) == 30
+
+
+def test_evaluate_and_combine_generators():
+    """Test the combinations of the local contexts of generators.
+    """
+
+    @generator.countable(lambda context: 2)
+    def igenerator(context):
+        for i in range(2):
+            yield {'i': i}
+
+    def dgenerator(context):
+        for d in range(3):
+            yield {'d': d}
+
+    total, values = generator.evaluate([igenerator, dgenerator], dict())
+    assert total == 6
+
+    # The first generator is countable: its values are not kept in memory.
+    assert not isinstance(values[0], list)
+    assert values[1] == [{'d': 0}, {'d': 1}, {'d': 2}]
+
+    contexts = list(generator.combine(values))
+    assert len(contexts) == 6
+    assert contexts[0] == {'i': 0, 'd': 0}
+    assert contexts[-1] == {'i': 1, 'd': 2}
+
+
+def test_recorded_generator():
+    """Test the values of a recorded generator are only evaluated once.
+    """
+
+    spy = MagicMock()
+
+    @generator.recorded
+    def igenerator(context):
+        spy()
+        for i in range(3):
+            yield {'i': (i, i)}
+
+    recorder = generator.Recorder()
+    total, values = generator.evaluate(
+        [igenerator], dict(), recorder=recorder, activity_name='activity')
+    name = generator.marker_name('activity', 0)
+    assert total == 3
+    assert spy.call_count == 1
+
+    # The values are the ones that will be read from the history.
+    assert values[0] == [{'i': [0, 0]}, {'i': [1, 1]}, {'i': [2, 2]}]
+    assert json.loads(recorder.pending[name]) == values[0]
+
+    recorder = generator.Recorder(recorder.markers)
+    generator.evaluate(
+        [igenerator], dict(), recorder=recorder, activity_name='activity')
+    assert spy.call_count == 1
+    assert not recorder.pending
+
+
+def test_recorder_replay():
+    """Test a replay recorder does not record new values.
+    """
+
+    recorder = generator.Recorder().replay()
+    assert recorder.record('name', [{'i': 1}]) == [{'i': 1}]
+    assert not recorder.get('name')
+    assert not recorder.pending
+
+
+def test_recorder_too_large_values():
+    """Test values that do not fit in a marker are not recorded.
+    """
+
+    recorder = generator.Recorder()
+    values = [{'i': 'v' * generator.MAX_MARKER_DETAILS}]
+    assert recorder.record('name', values) is values
+    assert not recorder.pending
+
+
+def test_evaluator_runs_generators_concurrently():
+    """Test the generators submitted to an evaluator run concurrently.
+    """
+
+    started = threading.Event()
+    on_timing = MagicMock()
+
+    def igenerator(context):
+        # Only completes if the other generator runs at the same time.
+        assert started.wait(5)
+        for i in range(2):
+            yield {'i': i}
+
+    def dgenerator(context):
+        started.set()
+        for d in range(3):
+            yield {'d': d}
+
+    evaluator = generator.Evaluator(
+        ThreadPoolExecutor(max_workers=2), on_timing=on_timing)
+    evaluator.prefetch([igenerator, dgenerator], dict(), 'activity')
+    total, values = generator.evaluate(
+        [igenerator, dgenerator], dict(), activity_name='activity',
+        evaluator=evaluator)
+
+    assert total == 6
+    assert values[1] == [{'d': 0}, {'d': 1}, {'d': 2}]
+    assert sorted(call[0][0] for call in on_timing.call_args_list) == [
+        generator.marker_name('activity', 0),
+        generator.marker_name('activity', 1)]
+
+
+def test_evaluator_timeout():
+    """Test a generator taking longer than the timeout raises an exception.
+    """
+
+    def igenerator(context):
+        time.sleep(0.5)
+        yield {'i': 1}
+
+    evaluator = generator.Evaluator(
+        ThreadPoolExecutor(max_workers=1), timeout=0.05)
+    with pytest.raises(generator.GeneratorTimeoutException):
+        generator.evaluate(
+            [igenerator], dict(), activity_name='activity',
+            evaluator=evaluator)
+
+
+def test_evaluator_timeout_without_thread():
+    """Test a generator waiting for a thread longer than the timeout raises an
+    exception.
+    """
+
+    released = threading.Event()
+
+    def hung_generator(context):
+        released.wait(5)
+        yield {'i': 1}
+
+    def igenerator(context):
+        yield {'i': 1}
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    previous_evaluator = generator.Evaluator(executor, timeout=0.05)
+    with pytest.raises(generator.GeneratorTimeoutException):
+        previous_evaluator.result('hung', hung_generator, dict())
+
+    evaluator = generator.Evaluator(executor, timeout=0.05)
+    start = time.time()
+    with pytest.raises(generator.GeneratorTimeoutException):
+        evaluator.result('generator', igenerator, dict())
+    assert time.time() - start < 1
+
+    evaluator.cancel()
+    released.set()
+    executor.shutdown()
@@ -1,4 +1,5 @@
 import logging
+import threading
 
 from garcon import log
 from tests.fixtures import log as fixture
@@ -43,3 +44,19 @@ def test_unset_log_context():
     valid_mock.unset_log_context()
 
     assert getattr(valid_mock, 'logger_name', None) is None
+
+
+def test_log_context_per_thread():
+    """Test that the logger_name property is only set for the current thread.
+    """
+
+    valid_mock = fixture.log_enabled_object()
+    logger_names = []
+
+    thread = threading.Thread(
+        target=lambda: logger_names.append(valid_mock.logger_name))
+    thread.start()
+    thread.join()
+
+    assert logger_names == [None]
+    assert valid_mock.logger_name is not None
@@ -0,0 +1,135 @@
+from __future__ import absolute_import
+try:
+    from unittest.mock import MagicMock
+except:
+    from mock import MagicMock
+from boto.swf.exceptions import SWFTypeAlreadyExistsError
+import boto.exception as boto_exception
+import boto.swf.layer2 as swf
+import json
+
+from garcon import registration
+
+
+def mock(monkeypatch):
+    for base in [swf.WorkflowType, swf.ActivityType, swf.Domain]:
+        monkeypatch.setattr(base, '__init__', MagicMock(return_value=None))
+        monkeypatch.setattr(base, 'register', MagicMock())
+
+
+def create_types(count):
+    workflow_type = swf.WorkflowType()
+    workflow_type.name = 'flow'
+    workflow_type.version = '1.0'
+    workflow_type.task_list = 'flow'
+
+    types = [workflow_type]
+    for index in range(count):
+        activity_type = swf.ActivityType()
+        activity_type.name = 'activity_{}'.format(index)
+        activity_type.version = '1.0'
+        activity_type.task_list = 'flow'
+        types.append(activity_type)
+    return types
+
+
+def create_layer1(activity_names):
+    layer1 = MagicMock()
+    pages = [
+        dict(typeInfos=[
+            dict(activityType=dict(name=name, version='1.0'))
+            for name in activity_names[:1]], nextPageToken='page_2'),
+        dict(typeInfos=[
+            dict(activityType=dict(name=name, version='1.0'))
+            for name in activity_names[1:]])]
+    layer1.list_activity_types = MagicMock(side_effect=pages)
+    layer1.list_workflow_types = MagicMock(return_value=dict(typeInfos=[]))
+    return layer1
+
+
+def test_register_missing_types(monkeypatch):
+    """Test only the types that do not exist are registered.
+    """
+
+    mock(monkeypatch)
+    domain = swf.Domain()
+    domain.name = 'domain'
+    types = create_types(4)
+
+    layer1 = create_layer1(['activity_0', 'activity_2'])
+    registration.Registration(layer1=layer1).register(domain, types)
+
+    assert layer1.list_activity_types.call_count == 2
+    assert layer1.list_activity_types.call_args[1]['next_page_token'] == (
+        'page_2')
+    assert domain.register.call_count == 1
+
+    # The register mock is shared by all the activity types.
+    assert swf.ActivityType.register.call_count == 2
+    assert swf.WorkflowType.register.call_count == 1
+
+
+def test_register_existing_type(monkeypatch):
+    """Test a type registered in the meantime does not fail the registration.
+    """
+
+    mock(monkeypatch)
+    domain = swf.Domain()
+    domain.name = 'domain'
+    types = create_types(1)
+
+    monkeypatch.setattr(
+        swf.ActivityType, 'register', MagicMock(
+            side_effect=SWFTypeAlreadyExistsError(400, 'Bad Request')))
+    layer1 = create_layer1([])
+    registration.Registration(layer1=layer1).register(domain, types)
+    assert swf.ActivityType.register.call_count == 1
+
+
+def test_register_retries_throttled_calls(monkeypatch):
+    """Test the throttled registrations are retried.
+    """
+
+    mock(monkeypatch)
+    monkeypatch.setattr('time.sleep', MagicMock())
+    domain = swf.Domain()
+    domain.name = 'domain'
+    types = create_types(1)
+
+    throttle = boto_exception.SWFResponseError(
+        400, 'Bad Request',
+        body={'__type': 'com.amazonaws.swf.base.model#ThrottlingException'})
+    monkeypatch.setattr(
+        swf.ActivityType, 'register', MagicMock(side_effect=[throttle, None]))
+    registration.Registration(layer1=create_layer1([])).register(
+        domain, types)
+    assert swf.ActivityType.register.call_count == 2
+
+
+def test_register_with_manifest(monkeypatch, tmpdir):
+    """Test the flows that have not changed are not registered again.
+    """
+
+    mock(monkeypatch)
+    domain = swf.Domain()
+    domain.name = 'domain'
+    manifest = str(tmpdir.join('manifest.json'))
+
+    layer1 = create_layer1([])
+    registration.Registration(layer1=layer1, manifest=manifest).register(
+        domain, create_types(2))
+    assert swf.ActivityType.register.call_count == 2
+    assert len(json.load(open(manifest))) == 1
+
+    layer1 = create_layer1([])
+    registration.Registration(layer1=layer1, manifest=manifest).register(
+        domain, create_types(2))
+    assert not layer1.list_activity_types.called
+    assert swf.ActivityType.register.call_count == 2
+
+    # A new activity changes the signature of the flow.
+    layer1 = create_layer1(['activity_0', 'activity_1'])
+    registration.Registration(layer1=layer1, manifest=manifest).register(
+        domain, create_types(3))
+    assert swf.ActivityType.register.call_count == 3
+    assert len(json.load(open(manifest))) == 2
@@ -204,3 +204,108 @@ def test_runner_requirements_without_decoration():
 
     with pytest.raises(runner.NoRunnerRequirementsFound):
         current_runner.requirements(EMPTY_CONTEXT)
+
+
+def test_runner_plan():
+    """Test the plan of a runner without task lists is only calculated once.
+    """
+
+    @task.decorate(timeout=10, heartbeat=5)
+    def task_a(value):
+        pass
+
+    current_runner = runner.Sync(task_a.fill(value='key'), task_a.fill())
+    plan = current_runner.plan(dict())
+
+    assert plan.timeout == 20
+    assert plan.heartbeat == 5
+    assert plan.requirements == set(['key'])
+    assert current_runner.plan(dict(other='context')) is plan
+
+
+def test_runner_plan_with_task_list():
+    """Test the task lists are only flattened once per plan.
+    """
+
+    spy = MagicMock()
+
+    @task.decorate(timeout=10)
+    def task_a(value):
+        pass
+
+    @task.list
+    def task_list(context):
+        spy()
+        yield task_a.fill(value='key')
+
+    current_runner = runner.Sync(task_list)
+    plan = current_runner.plan(dict())
+
+    assert spy.call_count == 1
+    assert plan.timeout == 10
+    assert plan.requirements == set(['key'])
+    assert current_runner.plan(dict()) is not plan
+
+
+def test_runner_plan_without_requirements():
+    """Test the plan of a runner with undecorated tasks.
+    """
+
+    current_runner = runner.Sync(lambda activity, context: None)
+    plan = current_runner.plan(dict())
+
+    assert plan.timeout == runner.DEFAULT_TASK_TIMEOUT
+    assert plan.requirements is None
+    with pytest.raises(runner.NoRunnerRequirementsFound):
+        current_runner.requirements(dict())
+
+
+def test_runner_plan_with_overridden_methods():
+    """Test the plan of a runner uses the methods it overrides.
+    """
+
+    @task.decorate(timeout=10, heartbeat=5)
+    def task_a(value):
+        pass
+
+    class CustomRunner(runner.Sync):
+
+        def timeout(self, context):
+            return 42
+
+        def heartbeat(self, context):
+            return super(CustomRunner, self).heartbeat(context) + 1
+
+    current_runner = CustomRunner(task_a.fill(value='key'))
+    plan = current_runner.plan(dict())
+
+    assert plan.timeout == 42
+    assert plan.heartbeat == 6
+    assert plan.requirements == set(['key'])
+
+    class NoRequirementsRunner(runner.Sync):
+
+        def requirements(self, context):
+            raise runner.NoRunnerRequirementsFound()
+
+    plan = NoRequirementsRunner(task_a.fill(value='key')).plan(dict())
+    assert plan.timeout == 10
+    assert plan.requirements is None
+
+
+def test_get_plan_without_plan():
+    """Test the plan of a runner that does not extend the base runner.
+    """
+
+    class CustomRunner(object):
+
+        def timeout(self, context):
+            return 42
+
+        def heartbeat(self, context):
+            return 21
+
+    plan = runner.get_plan(CustomRunner(), dict())
+    assert plan.timeout == 42
+    assert plan.heartbeat == 21
+    assert plan.requirements is None
@@ -0,0 +1,57 @@
+from __future__ import absolute_import
+
+from garcon import activity
+from garcon import event
+from garcon import scheduler
+from tests.fixtures import decider
+
+
+def test_ready_set():
+    """Test the progress of the activities in the ready set.
+    """
+
+    from tests.fixtures.flows import example
+
+    ready_set = scheduler.ReadySet(activity.compile_flow(example))
+    assert ready_set.is_ready(example.activity_1.name)
+    assert not ready_set.is_ready(example.activity_2.name)
+    assert not ready_set.is_completed(example.activity_1.name)
+
+    ready_set.add_instance(example.activity_1.name)
+    ready_set.add_instance(example.activity_1.name)
+    ready_set.complete_instance(example.activity_1.name)
+    assert not ready_set.is_completed(example.activity_1.name)
+    assert not ready_set.is_ready(example.activity_2.name)
+
+    ready_set.complete_instance(example.activity_1.name)
+    assert ready_set.is_completed(example.activity_1.name)
+    assert ready_set.is_ready(example.activity_2.name)
+    assert ready_set.is_ready(example.activity_3.name)
+    assert not ready_set.is_ready(example.activity_4.name)
+
+    # A new instance of a completed activity blocks the activities requiring
+    # it again.
+    ready_set.add_instance(example.activity_1.name)
+    assert not ready_set.is_ready(example.activity_2.name)
+
+
+def test_ready_set_from_history():
+    """Test the ready set matches the activity launch sequence.
+    """
+
+    from tests.fixtures.flows import example
+
+    compiled_flow = activity.compile_flow(example)
+    events = decider.history['events']
+
+    for index, expected in [(1, 1), (5, 0), (7, 2), (14, 0), (22, 1), (25, 0)]:
+        state = event.HistoryState(compiled_flow)
+        state.add_events(events[:index])
+
+        available = list(activity.find_available_activities(
+            compiled_flow, state.activity_states, dict(),
+            ready_set=state.ready_set))
+        assert len(available) == expected
+        assert [instance.id for instance in available] == [
+            instance.id for instance in activity.find_available_activities(
+                example, state.activity_states, dict())]
@@ -0,0 +1,103 @@
+from __future__ import absolute_import
+import os
+
+from garcon import activity
+from garcon import event
+from garcon import snapshot
+from tests.fixtures import decider as decider_events
+
+
+def test_snapshot_get_and_set(tmpdir):
+    """Test saving and loading the state of a run.
+    """
+
+    from tests.fixtures.flows import example
+
+    compiled_flow = activity.compile_flow(example)
+    events = decider_events.history.get('events')
+    state = event.HistoryState(compiled_flow)
+    state.add_events(events)
+
+    store = snapshot.SnapshotStore(os.path.join(str(tmpdir), 'snapshots.db'))
+    assert not store.get('workflow_id', 'run_id')
+    store.set('workflow_id', 'run_id', state)
+    assert len(store) == 1
+
+    loaded_state = store.get(
+        'workflow_id', 'run_id', compiled_flow=compiled_flow)
+    assert loaded_state.last_event_id == state.last_event_id
+    assert loaded_state.event_id_info == state.event_id_info
+    assert loaded_state.context.current == state.context.current
+    for activity_name, instances in state.activity_states.items():
+        for activity_id, activity_state in instances.items():
+            loaded_activity_state = loaded_state.activity_states[
+                activity_name][activity_id]
+            assert loaded_activity_state.states == activity_state.states
+            assert loaded_activity_state._result == activity_state._result
+
+    for current_activity in compiled_flow.activities:
+        name = current_activity.name
+        assert loaded_state.ready_set.is_ready(name) == (
+            state.ready_set.is_ready(name))
+        assert loaded_state.ready_set.is_completed(name) == (
+            state.ready_set.is_completed(name))
+        assert loaded_state.ready_set.in_flight.get(name, 0) == (
+            state.ready_set.in_flight.get(name, 0))
+
+    store.remove('workflow_id', 'run_id')
+    assert not store.get('workflow_id', 'run_id')
+    assert not len(store)
+
+
+def test_snapshot_not_replaced_by_older_state(tmpdir):
+    """Test a snapshot is never replaced by an older state of the run.
+    """
+
+    events = decider_events.history.get('events')
+    path = os.path.join(str(tmpdir), 'snapshots.db')
+
+    old_state = event.HistoryState()
+    old_state.add_events(events[:14])
+    new_state = event.HistoryState()
+    new_state.add_events(events)
+
+    store = snapshot.SnapshotStore(path)
+    store.set('workflow_id', 'run_id', new_state)
+    store.set('workflow_id', 'run_id', old_state)
+
+    # The snapshots are shared with the other stores using the same database.
+    other_store = snapshot.SnapshotStore(path)
+    assert other_store.get('workflow_id', 'run_id').last_event_id == (
+        new_state.last_event_id)
+
+
+def test_snapshot_prune(tmpdir):
+    """Test the snapshots that have not been updated recently are pruned.
+    """
+
+    events = decider_events.history.get('events')
+    state = event.HistoryState()
+    state.add_events(events)
+
+    store = snapshot.SnapshotStore(
+        os.path.join(str(tmpdir), 'snapshots.db'), max_age=None)
+    store.set('workflow_id', 'old_run_id', state)
+    store.set('workflow_id', 'run_id', state)
+    with store.connection:
+        store.connection.execute(
+            'UPDATE snapshots SET updated_at = 0 WHERE run_id = ?',
+            ('old_run_id',))
+
+    assert store.prune(3600) == 1
+    assert not store.get('workflow_id', 'old_run_id')
+    assert store.get('workflow_id', 'run_id')
+
+    # The store prunes itself when a snapshot is saved.
+    store = snapshot.SnapshotStore(
+        os.path.join(str(tmpdir), 'snapshots.db'), max_age=3600)
+    with store.connection:
+        store.connection.execute('UPDATE snapshots SET updated_at = 0')
+    store.set('workflow_id', 'new_run_id', state)
+    assert not store.get('workflow_id', 'run_id')
+    assert store.get('workflow_id', 'new_run_id')
+    assert len(store) == 1
@@ -0,0 +1,187 @@
+from __future__ import absolute_import
+try:
+    from unittest.mock import MagicMock
+except:
+    from mock import MagicMock
+import boto.swf.layer2 as swf
+import pytest
+import types
+
+from garcon import activity
+from garcon import decider
+from garcon import emulator
+from garcon import runner
+from garcon import task
+from garcon import transport
+
+
+def create_flow(monkeypatch):
+    """Create a flow with one activity.
+    """
+
+    monkeypatch.setitem(swf.DEFAULT_CREDENTIALS, 'aws_access_key_id', 'key')
+    monkeypatch.setitem(
+        swf.DEFAULT_CREDENTIALS, 'aws_secret_access_key', 'secret')
+
+    @task.decorate()
+    def task_1(activity):
+        return {'task_1.value': 1}
+
+    flow = types.ModuleType('transport_flow')
+    flow.domain = 'dev'
+    flow.name = 'transport_flow'
+    create = activity.create(flow.domain, flow.name)
+    flow.activity_1 = create(name='activity_1', run=runner.Sync(task_1.fill()))
+    return flow
+
+
+def test_interface():
+    """Test the calls of the interface are not implemented.
+    """
+
+    with pytest.raises(NotImplementedError):
+        transport.Transport().poll_for_decision_task('dev', 'task_list')
+
+    with pytest.raises(NotImplementedError):
+        transport.Transport().record_activity_task_heartbeat('token')
+
+
+def test_boto2_transport(monkeypatch):
+    """Test the boto2 transport creates its connection when first needed.
+    """
+
+    layer1 = MagicMock()
+    monkeypatch.setattr(transport.layer1, 'Layer1', layer1)
+
+    boto2_transport = transport.Boto2Transport(region='us-west-2')
+    assert not layer1.called
+
+    boto2_transport.respond_activity_task_failed('token', reason='error')
+    boto2_transport.respond_activity_task_completed('token', result='{}')
+    layer1.assert_called_once_with(region='us-west-2')
+
+    connection = layer1.return_value
+    connection.respond_activity_task_failed.assert_called_once_with(
+        'token', details=None, reason='error')
+    connection.respond_activity_task_completed.assert_called_once_with(
+        'token', result='{}')
+
+
+def test_decider_transport(monkeypatch):
+    """Test the decider polls and completes its tasks through its transport.
+    """
+
+    flow = create_flow(monkeypatch)
+    custom_transport = MagicMock()
+    custom_transport.poll_for_decision_task.return_value = dict(
+        taskToken='token')
+
+    d = decider.DeciderWorker(
+        flow, register=False, transport=custom_transport)
+    assert d.poll(identity='decider') == dict(taskToken='token')
+    custom_transport.poll_for_decision_task.assert_called_once_with(
+        flow.domain, flow.name, identity='decider')
+
+    decisions = swf.Layer1Decisions()
+    decisions.complete_workflow_execution()
+    d.complete(decisions=decisions)
+    custom_transport.respond_decision_task_completed.assert_called_once_with(
+        'token', decisions=decisions._data)
+
+
+def test_default_transport(monkeypatch):
+    """Test the deciders and the activities use the boto2 transport.
+    """
+
+    flow = create_flow(monkeypatch)
+    d = decider.DeciderWorker(flow, register=False)
+    assert isinstance(d.transport, transport.Boto2Transport)
+    assert d.transport.get_connection() is d._swf
+
+    current_activity = flow.activity_1
+    assert isinstance(
+        current_activity.get_transport(), transport.Boto2Transport)
+    assert current_activity.get_transport().get_connection() is (
+        current_activity._swf)
+
+
+def test_transport_without_connection(monkeypatch):
+    """Test the deciders and the activities provided a transport do not
+    create a connection of boto.
+    """
+
+    layer1 = MagicMock()
+    monkeypatch.setattr(transport.layer1, 'Layer1', layer1)
+    monkeypatch.delitem(
+        swf.DEFAULT_CREDENTIALS, 'aws_access_key_id', raising=False)
+    monkeypatch.delitem(
+        swf.DEFAULT_CREDENTIALS, 'aws_secret_access_key', raising=False)
+
+    flow = types.ModuleType('transport_flow')
+    flow.domain = 'dev'
+    flow.name = 'transport_flow'
+    create = activity.create(flow.domain, flow.name)
+    flow.activity_1 = create(
+        name='activity_1', run=runner.Sync(lambda context, activity: None))
+
+    swf_emulator = emulator.Emulator(poll_timeout=0.05)
+    in_memory_transport = transport.InMemoryTransport(swf_emulator)
+    d = decider.DeciderWorker(
+        flow, register=False, transport=in_memory_transport)
+    activity_worker = activity.ActivityWorker(
+        flow, transport=in_memory_transport)
+
+    assert d.transport is in_memory_transport
+    assert activity_worker.activities[0].get_transport() is (
+        in_memory_transport)
+    assert not layer1.called
+
+    # The connection is created when it is first needed.
+    assert d._swf is layer1.return_value
+    layer1.assert_called_once_with(None, None, region=None)
+
+
+def test_activity_transport(monkeypatch):
+    """Test the activity calls go through its transport.
+    """
+
+    flow = create_flow(monkeypatch)
+    custom_transport = MagicMock()
+    custom_transport.poll_for_activity_task.return_value = dict(
+        taskToken='token', activityId='transport_flow_activity_1-1',
+        input='{}')
+
+    activity_worker = activity.ActivityWorker(
+        flow, transport=custom_transport)
+    current_activity = activity_worker.activities[0]
+    assert current_activity.get_transport() is custom_transport
+
+    current_activity.run(identity='worker')
+    custom_transport.poll_for_activity_task.assert_called_once_with(
+        flow.domain, current_activity.task_list, identity='worker')
+    custom_transport.respond_activity_task_completed.assert_called_once_with(
+        'token', result='{"task_1.value": 1}')
+
+    current_activity.heartbeat(details='50%')
+    custom_transport.record_activity_task_heartbeat.assert_called_with(
+        'token', details='50%')
+
+
+def test_in_memory_transport(monkeypatch):
+    """Test the in-memory transport sends the calls to the emulator.
+    """
+
+    flow = create_flow(monkeypatch)
+    swf_emulator = emulator.Emulator(poll_timeout=0.05)
+    in_memory_transport = transport.InMemoryTransport(swf_emulator)
+
+    d = decider.DeciderWorker(
+        flow, register=False, transport=in_memory_transport)
+    run_id = swf_emulator.start_workflow_execution(
+        flow.domain, 'workflow_id', flow.name, '1.0')['runId']
+
+    d.run()
+    activity_task = swf_emulator.poll_for_activity_task(
+        flow.domain, flow.activity_1.task_list)
+    assert activity_task['activityId'] == 'transport_flow_activity_1-1'
+    assert swf_emulator.get_execution(run_id).events